@@ -0,0 +1,431 @@
+"""
+Fleet aggregator: one upstream Socket.IO connection per registered agent,
+fanned out to any number of dashboards.
+
+Agents register exactly as they do with the web app's /api/ngrok route
+(point get_stats.py at http://<aggregator>/api/ngrok). For every
+registered machine_id the aggregator keeps a single socketio.AsyncClient
+to the agent and rebroadcasts its telemetry into the room
+"machine:<machine_id>", so adding viewers never adds load on the host.
+Control events from dashboards carry a machine_id and are routed to that
+agent's upstream connection as acknowledged calls with a request_id; if
+the upstream drops, the call is sent again after it reconnects and the
+agent replays the result instead of running the command twice. Replies
+go back to the dashboard that asked.
+
+    python aggregator.py [port]
+"""
+import asyncio
+import socketio
+import time
+import sys
+import uuid
+from aiohttp import web
+
+import metrics
+import instrumentation
+import compression
+import jsonlog
+from host_index import HostIndex
+
+# Create a Socket.IO server for dashboards
+sio = socketio.AsyncServer(cors_allowed_origins='*', async_mode='aiohttp')
+app = web.Application()
+sio.attach(app)
+
+log = jsonlog.get_logger("aggregator")
+instrument = instrumentation.Instrumentation()
+
+# Configuration
+DEFAULT_PORT = 8766
+HOST_TTL = 120  # Seconds without a heartbeat before a disconnected host is dropped
+UPSTREAM_RETRY_MAX = 30  # Upper bound for the upstream reconnect delay
+DASHBOARD_PING_INTERVAL = 60  # Seconds; fewer pings for thousands of idle dashboards (Engine.IO default 25)
+
+# Control events a dashboard may send, mapped to the reply event for
+# dashboards that send no request_id (the rest get an acknowledgement)
+CONTROL_EVENTS = {
+    "run_container": "container_result",
+    "list_containers": "container_list",
+    "stop_container_request": "container_stop_result",
+    "update_container": "container_update_result",
+    "request_system_info": "system_info",
+}
+# Seconds to wait for the agent's acknowledgement, across reconnects; a
+# little over the agent's own CONTROL_TIMEOUTS
+UPSTREAM_CALL_TIMEOUTS = {
+    "run_container": 125,
+    "list_containers": 20,
+    "stop_container_request": 35,
+    "update_container": 20,
+    "request_system_info": 20,
+}
+
+# Events relayed from every agent to its machine room
+TELEMETRY_EVENTS = ("system_info", "usage_stats")
+
+# Deflate large frames to dashboards only, with the agent's default thresholds
+ws_compression = compression.install(sio)
+sio.eio.ping_interval = DASHBOARD_PING_INTERVAL
+
+aggregator_counters = {
+    "registrations": 0,
+    "frames_forwarded": 0,
+    "commands_routed": 0,
+    "replies_routed": 0,
+    "commands_resent": 0,
+}
+
+
+def machine_room(machine_id):
+    return f"machine:{machine_id}"
+
+
+class Upstream:
+    """The aggregator's single connection to one registered agent"""
+
+    def __init__(self, machine_id, url):
+        self.machine_id = machine_id
+        self.url = url
+        self.last_seen = time.time()
+        self.registration = {}
+        self.latest = {}  # Last payload per telemetry event, replayed to new subscribers
+        self.alerts = {}  # (rule, subject) -> firing alert, replayed to new subscribers
+        self.ready = asyncio.Event()  # Set while the upstream is connected
+        self.lost = asyncio.Event()  # Set when the current connection drops
+        self.client = socketio.AsyncClient(reconnection=True, reconnection_delay_max=UPSTREAM_RETRY_MAX,
+                                          websocket_extra_options=compression.CLIENT_OPTIONS)
+        self.task = None
+        self.closed = False
+        self.client_id = uuid.uuid4().hex  # The agent scopes cached results to it, across reconnects
+
+        for event in TELEMETRY_EVENTS:
+            self.client.on(event, self._telemetry_handler(event))
+        self.client.on("alert", self._on_alert)
+        self.client.on("connect", self._on_connect)
+        self.client.on("disconnect", self._on_disconnect)
+
+    @property
+    def connected(self):
+        return self.client.connected
+
+    def summary(self):
+        return {
+            "machine_id": self.machine_id,
+            "url": self.url,
+            "connected": self.connected,
+            "last_seen": self.last_seen,
+            "load": self.registration.get("load"),
+        }
+
+    def _telemetry_handler(self, event):
+        async def handler(data):
+            self.latest[event] = data
+            payload = dict(data, machine_id=self.machine_id) if isinstance(data, dict) else data
+            await sio.emit(event, payload, room=machine_room(self.machine_id))
+            aggregator_counters["frames_forwarded"] += 1
+        return handler
+
+    async def _on_alert(self, data):
+        key = (data.get("rule"), data.get("subject"))
+        if data.get("state") == "firing":
+            self.alerts[key] = data
+        else:
+            self.alerts.pop(key, None)
+        await sio.emit("alert", dict(data, machine_id=self.machine_id), room=machine_room(self.machine_id))
+        aggregator_counters["frames_forwarded"] += 1
+
+    async def _on_connect(self):
+        log.info("upstream_connected", machine_id=self.machine_id, url=self.url)
+        # The agent replays its firing alerts on subscribe, so start from a clean slate
+        self.alerts.clear()
+        self.lost = asyncio.Event()
+        self.ready.set()
+        await self.client.emit("subscribe_alerts")
+
+    async def _on_disconnect(self, *args):
+        log.info("upstream_disconnected", machine_id=self.machine_id)
+        # Calls on the old connection will never be acknowledged; forward() sends them again
+        self.ready.clear()
+        self.lost.set()
+
+    async def forward(self, event, data):
+        """
+        Call event on the agent and return its acknowledged result. data
+        carries a request_id, so sending it again after a reconnect gets
+        the agent's result for the first send.
+        """
+        if not self.connected:
+            return {'success': False, 'error': 'Host is not connected'}
+        aggregator_counters["commands_routed"] += 1
+        deadline = time.monotonic() + UPSTREAM_CALL_TIMEOUTS[event]
+        while not self.closed:
+            try:
+                await asyncio.wait_for(self.ready.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            lost = asyncio.ensure_future(self.lost.wait())
+            call = asyncio.ensure_future(self.client.call(event, data, timeout=deadline - time.monotonic()))
+            await asyncio.wait((call, lost), return_when=asyncio.FIRST_COMPLETED)
+            lost.cancel()
+            if call.done():
+                try:
+                    result = call.result()
+                except (socketio.exceptions.TimeoutError, socketio.exceptions.BadNamespaceError):
+                    break
+                aggregator_counters["replies_routed"] += 1
+                return result
+            call.cancel()
+            aggregator_counters["commands_resent"] += 1
+        return {'success': False, 'error': 'Host did not answer'}
+
+    async def run(self):
+        """Connect, retrying with backoff until the first connection succeeds"""
+        delay = 1
+        while not self.closed:
+            try:
+                await self.client.connect(self.url, auth={"client_id": self.client_id}, transports=["websocket"],
+                                          wait_timeout=10)
+                await self.client.wait()  # Returns only once reconnection gives up
+                if self.closed:
+                    return
+            except socketio.exceptions.ConnectionError as e:
+                log.warning("upstream_connect_failed", machine_id=self.machine_id, url=self.url, error=str(e))
+            await asyncio.sleep(delay)
+            delay = min(UPSTREAM_RETRY_MAX, delay * 2)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self):
+        self.closed = True
+        if self.client.connected:
+            await self.client.disconnect()
+        if self.task is not None:
+            self.task.cancel()
+
+
+# Registered hosts by machine_id
+hosts = {}
+
+# Capacity indexes over the hosts' heartbeat load summaries
+host_index = HostIndex()
+
+
+async def register_host(payload):
+    """Create or refresh the upstream for a registration payload"""
+    machine_id = payload["machine_id"]
+    url = payload["ngrok_url"]
+    upstream = hosts.get(machine_id)
+    if upstream is not None and upstream.url != url:
+        # The agent came back on a new tunnel URL
+        await upstream.close()
+        upstream = None
+    if upstream is None:
+        upstream = hosts[machine_id] = Upstream(machine_id, url)
+        upstream.start()
+        log.info("host_registered", machine_id=machine_id, url=url)
+    upstream.last_seen = time.time()
+    upstream.registration = payload
+    host_index.update(machine_id, payload.get("load") or {})
+    aggregator_counters["registrations"] += 1
+    return upstream
+
+
+async def register_handler(request):
+    """Same contract as the web app's /api/ngrok route"""
+    try:
+        body = await request.json()
+    except ValueError:
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+    if not isinstance(body, dict):
+        return web.json_response({"error": "Invalid data format. Expected a JSON object"}, status=400)
+    if not body.get("ngrok_url") or not body.get("timestamp") or not body.get("machine_id"):
+        return web.json_response(
+            {"error": "Invalid data format. Required: ngrok_url, timestamp, machine_id"}, status=400)
+    if not isinstance(body.get("load") or {}, dict):
+        return web.json_response({"error": "Invalid data format. load must be an object"}, status=400)
+    await register_host(body)
+    return web.json_response({"message": "ngrok data stored successfully"})
+
+
+async def hosts_handler(request):
+    return web.json_response([upstream.summary() for upstream in hosts.values()])
+
+
+def parse_capacity_query(params):
+    """Capacity query from request params or an event payload"""
+    return {
+        "min_free_gpus": int(params.get("min_free_gpus") or 0),
+        "gpu_model": params.get("gpu_model") or None,
+        "min_free_ram_gb": float(params.get("min_free_ram_gb") or 0),
+        "min_cpu_threads": int(params.get("min_cpu_threads") or 0),
+        "limit": int(params.get("limit") or 0) or None,
+    }
+
+
+def find_hosts_result(params):
+    if not hasattr(params, 'get'):
+        return {'success': False, 'error': "Invalid query: expected an object"}
+    try:
+        query = parse_capacity_query(params)
+    except (TypeError, ValueError) as e:
+        return {'success': False, 'error': f"Invalid query: {e}"}
+    matches = host_index.find(**query)
+    return {'success': True, 'hosts': [hosts[machine_id].summary() for machine_id in matches]}
+
+
+async def find_hosts_handler(request):
+    """GET /api/hosts/find?min_free_gpus=2&gpu_model=A100&min_free_ram_gb=64"""
+    result = find_hosts_result(request.query)
+    return web.json_response(result, status=200 if result['success'] else 400)
+
+
+def render_metrics():
+    out = metrics.MetricsText(prefix="aggregator_")
+    out.gauge("hosts_registered", "Registered agents.", len(hosts))
+    out.gauge("upstreams_connected", "Agents with a live upstream connection.",
+              sum(1 for upstream in hosts.values() if upstream.connected))
+    out.gauge("dashboards_connected", "Connected dashboard clients.", len(dashboards))
+    for name, value in aggregator_counters.items():
+        out.counter(f"{name}_total", f"Total {name.replace('_', ' ')}.", value)
+    out.histogram("handler_duration_seconds", "Dashboard event handler latency.", instrument.series("handler"))
+    out.histogram("event_loop_lag_seconds", "Event-loop wake-up delay.", [(None, instrument.loop_lag)])
+    frames, sizes = ws_compression.series()
+    out.family("websocket_frames_total", "counter", "WebSocket frames sent, by event and compression.", frames)
+    out.family("websocket_payload_bytes_total", "counter", "Uncompressed WebSocket payload bytes sent.", sizes)
+    return out.render()
+
+
+async def metrics_handler(request):
+    return web.Response(body=render_metrics(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+app.router.add_post('/api/ngrok', register_handler)
+app.router.add_get('/api/hosts', hosts_handler)
+app.router.add_get('/api/hosts/find', find_hosts_handler)
+app.router.add_get('/metrics', metrics_handler)
+
+# Connected dashboards
+dashboards = set()
+dashboard_identities = {}  # sid -> the dashboard's client_id, or its sid without one
+
+
+@sio.event
+@instrument.handler
+async def connect(sid, environ, auth=None):
+    dashboards.add(sid)
+    client_id = auth.get('client_id') if isinstance(auth, dict) else None
+    dashboard_identities[sid] = str(client_id) if client_id else sid
+
+
+@sio.event
+@instrument.handler
+async def disconnect(sid):
+    dashboards.discard(sid)
+    dashboard_identities.pop(sid, None)
+
+
+@sio.event
+@instrument.handler
+async def list_hosts(sid, *args):
+    await sio.emit('hosts', [upstream.summary() for upstream in hosts.values()], room=sid)
+
+
+@sio.event
+@instrument.handler
+async def find_hosts(sid, data=None):
+    """Capacity query answered from the indexes, e.g. {'min_free_gpus': 2, 'gpu_model': 'A100'}"""
+    await sio.emit('find_hosts_result', find_hosts_result(data or {}), room=sid)
+
+
+@sio.event
+@instrument.handler
+async def subscribe(sid, data):
+    """Join a host's telemetry room and get its latest state straight away"""
+    machine_id = (data or {}).get('machine_id')
+    upstream = hosts.get(machine_id)
+    if upstream is None:
+        await sio.emit('subscribe_result', {'success': False, 'error': f"Unknown host: {machine_id}"}, room=sid)
+        return
+    await sio.enter_room(sid, machine_room(machine_id))
+    await sio.emit('subscribe_result', {'success': True, 'machine_id': machine_id}, room=sid)
+    for event, payload in list(upstream.latest.items()):
+        await sio.emit(event, dict(payload, machine_id=machine_id), room=sid)
+    for alert in list(upstream.alerts.values()):
+        await sio.emit('alert', dict(alert, machine_id=machine_id), room=sid)
+
+
+@sio.event
+@instrument.handler
+async def unsubscribe(sid, data):
+    machine_id = (data or {}).get('machine_id')
+    await sio.leave_room(sid, machine_room(machine_id))
+
+
+def _control_handler(event):
+    async def handler(sid, data=None):
+        data = dict(data or {})
+        machine_id = data.pop('machine_id', None)
+        request_id = data.get('request_id')
+        upstream = hosts.get(machine_id)
+        if upstream is None:
+            result = {'success': False, 'error': f"Unknown host: {machine_id}"}
+        else:
+            # Every dashboard shares the upstream's scope at the agent, so
+            # qualify the request_id with the dashboard's own identity
+            scoped_id = f"{dashboard_identities.get(sid, sid)}:{request_id or uuid.uuid4().hex}"
+            result = await upstream.forward(event, dict(data, request_id=scoped_id))
+        if not isinstance(result, dict):
+            result = {'success': False, 'error': 'Unexpected reply from host'}
+        result = dict(result, machine_id=machine_id, request_id=request_id)
+        if request_id is None:
+            # Dashboards without a request_id get the reply event, as before
+            result.pop('request_id', None)
+            await sio.emit(CONTROL_EVENTS[event], result, room=sid)
+        return result
+    handler.__name__ = event
+    return handler
+
+
+for _event in CONTROL_EVENTS:
+    sio.on(_event, instrument.handler(_control_handler(_event)))
+
+
+async def reap_stale_hosts():
+    """Forget hosts that stopped heartbeating and whose upstream is gone"""
+    while True:
+        await asyncio.sleep(HOST_TTL / 4)
+        cutoff = time.time() - HOST_TTL
+        for machine_id, upstream in list(hosts.items()):
+            if upstream.last_seen < cutoff and not upstream.connected:
+                await upstream.close()
+                del hosts[machine_id]
+                host_index.remove(machine_id)
+                log.info("host_expired", machine_id=machine_id)
+
+
+async def start(host="0.0.0.0", port=DEFAULT_PORT):
+    """Start the aggregator and return its runner"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    sio.start_background_task(reap_stale_hosts)
+    sio.start_background_task(instrument.monitor_loop_lag)
+    log.info("listening", url=f"http://{host}:{port}")
+    return runner
+
+
+async def main(port=DEFAULT_PORT):
+    await start(port=port)
+    while True:
+        await asyncio.sleep(3600)
+
+
+if __name__ == "__main__":
+    jsonlog.configure()
+    try:
+        asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT))
+    except KeyboardInterrupt:
+        log.info("shutdown_requested")
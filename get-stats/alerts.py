@@ -0,0 +1,154 @@
+"""
+Threshold alerts over sampler snapshots.
+
+A rule watches one metric of the usage_stats snapshot. The metric is
+either a top-level value ("Memory_Usage") or a field of each item in a
+list ("GPUs.Temperature"); list items are told apart by the identity
+field given in list_keys (GPU index, disk device, interface name), so
+every GPU gets its own alert state.
+
+Per (rule, subject) the engine keeps an optionally EWMA-smoothed value.
+A rule fires once the value has been past its threshold for `duration`
+seconds, and resolves once the value is back past the threshold by more
+than `hysteresis`, so a reading that wobbles around the threshold does not
+flap. evaluate() returns only state transitions.
+
+A subject that stops reporting (a removed container, a GPU that drops out)
+gets no new sample to clear on, so after `expire_after` evaluations without
+one its state is dropped, and if it was firing it resolves with
+"expired": True.
+"""
+import time
+
+
+class AlertRule:
+    __slots__ = ("name", "metric", "threshold", "above", "duration", "hysteresis", "ewma_alpha", "severity",
+                 "list_name", "field")
+
+    def __init__(self, name, metric, threshold, above=True, duration=0.0, hysteresis=0.0, ewma_alpha=None,
+                 severity="warning"):
+        if ewma_alpha is not None and not 0 < ewma_alpha <= 1:
+            raise ValueError(f"ewma_alpha must be in (0, 1], got {ewma_alpha}")
+        self.name = name
+        self.metric = metric
+        self.threshold = float(threshold)
+        self.above = above
+        self.duration = float(duration)
+        self.hysteresis = float(hysteresis)
+        self.ewma_alpha = ewma_alpha
+        self.severity = severity
+        self.list_name, _, self.field = metric.rpartition(".")
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(**spec)
+
+    def breached(self, value):
+        return value >= self.threshold if self.above else value <= self.threshold
+
+    def cleared(self, value):
+        if self.above:
+            return value < self.threshold - self.hysteresis
+        return value > self.threshold + self.hysteresis
+
+
+class AlertState:
+    __slots__ = ("value", "pending_since", "firing", "since", "seen")
+
+    def __init__(self):
+        self.value = None
+        self.pending_since = None
+        self.firing = False
+        self.since = None
+        self.seen = 0  # Number of the last evaluation with a reading
+
+
+class AlertEngine:
+    def __init__(self, rules, list_keys=None, expire_after=3):
+        self.rules = [rule if isinstance(rule, AlertRule) else AlertRule.from_dict(rule) for rule in rules]
+        self.list_keys = dict(list_keys or {})  # list metric -> identity field of its items
+        self.expire_after = expire_after  # Evaluations a subject may miss before its state is dropped
+        self.states = {}  # (rule name, subject) -> AlertState
+        self.evaluations = 0
+
+    def _readings(self, rule, snapshot):
+        """(subject, value) pairs for one rule; the subject is None for scalar metrics"""
+        if not rule.list_name:
+            value = snapshot.get(rule.field)
+            if isinstance(value, (int, float)):
+                yield None, value
+            return
+        key = self.list_keys.get(rule.list_name)
+        for item in snapshot.get(rule.list_name) or ():
+            value = item.get(rule.field)
+            if isinstance(value, (int, float)):
+                yield item.get(key), value
+
+    def evaluate(self, snapshot, now=None):
+        """Feed one snapshot; returns alert dicts for rules that changed state"""
+        now = time.time() if now is None else now
+        self.evaluations += 1
+        transitions = []
+        for rule in self.rules:
+            for subject, raw in self._readings(rule, snapshot):
+                state = self.states.get((rule.name, subject))
+                if state is None:
+                    state = self.states[(rule.name, subject)] = AlertState()
+                state.seen = self.evaluations
+                if rule.ewma_alpha is None or state.value is None:
+                    state.value = raw
+                else:
+                    state.value += rule.ewma_alpha * (raw - state.value)
+                value = state.value
+
+                if not state.firing:
+                    if not rule.breached(value):
+                        state.pending_since = None
+                        continue
+                    if state.pending_since is None:
+                        state.pending_since = now
+                    if now - state.pending_since >= rule.duration:
+                        state.firing = True
+                        state.since = now
+                        transitions.append(self._alert(rule, subject, state, "firing", now))
+                elif rule.cleared(value):
+                    state.firing = False
+                    state.pending_since = None
+                    transitions.append(self._alert(rule, subject, state, "resolved", now))
+        transitions.extend(self._expire(now))
+        return transitions
+
+    def _expire(self, now):
+        """Drop subjects missing from the last expire_after snapshots, resolving those still firing"""
+        rules = {rule.name: rule for rule in self.rules}
+        expired = []
+        for key, state in list(self.states.items()):
+            if self.evaluations - state.seen < self.expire_after:
+                continue
+            del self.states[key]
+            name, subject = key
+            if state.firing and name in rules:
+                alert = self._alert(rules[name], subject, state, "resolved", now)
+                alert["expired"] = True
+                expired.append(alert)
+        return expired
+
+    def active(self, now=None):
+        """Currently firing alerts, for clients that subscribe mid-incident"""
+        now = time.time() if now is None else now
+        rules = {rule.name: rule for rule in self.rules}
+        return [self._alert(rules[name], subject, state, "firing", now)
+                for (name, subject), state in self.states.items() if state.firing and name in rules]
+
+    def _alert(self, rule, subject, state, status, now):
+        return {
+            "rule": rule.name,
+            "metric": rule.metric,
+            "subject": subject,
+            "state": status,
+            "severity": rule.severity,
+            "value": round(state.value, 2),
+            "threshold": rule.threshold,
+            "since": state.since,
+            "timestamp": now,
+        }
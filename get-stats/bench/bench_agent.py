@@ -0,0 +1,365 @@
+"""
+Benchmarks for the agent's hot paths.
+
+Times get_usage(), get_system_info(), get_container_list(),
+run_docker_container() and the usage_stats emit fan-out against a fake
+nvidia-smi, a mock Docker Engine on a unix socket and in-process Socket.IO
+clients, so it runs on a machine with neither a GPU nor a Docker daemon.
+
+    python bench/bench_agent.py                    # compare against baseline.json
+    python bench/bench_agent.py --against HEAD~1   # compare against a revision, here and now
+    python bench/bench_agent.py --update-baseline  # record a new baseline
+
+Iteration counts, fake GPU values and the mock's container set are fixed.
+Each pass runs in a fresh process (BENCH_AGENT_WORKER set), --repeats
+times; a benchmark's result is the median of the passes' medians, and the
+fastest and slowest pass bound its noise. A benchmark is a regression
+when its median is more than --tolerance slower than the baseline's and
+even its fastest pass is slower than the baseline's slowest; it is then
+reported and the script exits non-zero. Slower medians whose passes
+overlap the baseline's are only reported as "noisy".
+
+baseline.json gates only runs on the machine and interpreter it was
+recorded on, and even there speed drifts from session to session.
+--against REVISION checks the revision out into a git worktree and
+alternates its passes with this tree's, which compares like with like.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AGENT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, AGENT_DIR)
+
+import fake_nvidia_smi  # noqa: E402
+from mock_docker import MockDockerServer  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# Regressions smaller than this many milliseconds are treated as noise
+ABSOLUTE_NOISE_MS = 0.05
+
+
+def summarize(timings_ns):
+    ms = sorted(t / 1e6 for t in timings_ns)
+    return {
+        "iterations": len(ms),
+        "min_ms": round(ms[0], 4),
+        "median_ms": round(statistics.median(ms), 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(0.95 * len(ms)))], 4),
+        "mean_ms": round(statistics.fmean(ms), 4),
+    }
+
+
+def measure(fn, iterations, warmup):
+    """Time a synchronous callable"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter_ns()
+            fn()
+            timings.append(time.perf_counter_ns() - start)
+    finally:
+        gc.enable()
+    return summarize(timings)
+
+
+async def measure_async(fn, iterations, warmup):
+    """Time a coroutine function"""
+    for _ in range(warmup):
+        await fn()
+    timings = []
+    gc.collect()
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        await fn()
+        timings.append(time.perf_counter_ns() - start)
+    return summarize(timings)
+
+
+class FanoutClients:
+    """In-process Socket.IO clients that report when a marked frame reached all of them"""
+
+    def __init__(self, socketio, count):
+        self.clients = [socketio.AsyncClient(reconnection=False) for _ in range(count)]
+        self.expected_seq = None
+        self.received = 0
+        self.done = asyncio.Event()
+        for client in self.clients:
+            client.on("usage_stats", self.on_usage_stats)
+
+    async def on_usage_stats(self, data):
+        if data.get("bench_seq") == self.expected_seq:
+            self.received += 1
+            if self.received == len(self.clients):
+                self.done.set()
+
+    async def connect(self, url):
+        await asyncio.gather(*(c.connect(url, transports=["websocket"], wait_timeout=10)
+                               for c in self.clients))
+
+    async def disconnect(self):
+        await asyncio.gather(*(c.disconnect() for c in self.clients))
+
+    def arm(self, seq):
+        self.expected_seq = seq
+        self.received = 0
+        self.done.clear()
+
+
+async def run_benchmarks(agent, mock, args):
+    import socketio
+    from aiohttp import web
+
+    results = {}
+    quick = args.quick
+
+    async def bench_get_usage():
+        await agent.get_usage()
+
+    results["get_usage"] = await measure_async(bench_get_usage, 5 if quick else 20, 2)
+
+    async def bench_get_system_info_cold():
+        agent.system_info_cache = None
+        await agent.get_system_info()
+
+    results["get_system_info_cold"] = await measure_async(bench_get_system_info_cold,
+                                                          5 if quick else 20, 2)
+
+    async def bench_get_system_info_cached():
+        await agent.get_system_info()
+
+    results["get_system_info_cached"] = await measure_async(bench_get_system_info_cached, 1000, 10)
+
+    mock.docker.reset(containers=args.containers)
+    results["get_container_list"] = measure(agent.get_container_list, 10 if quick else 50, 3)
+
+    mock.docker.reset()
+    counter = iter(range(1_000_000))
+    limits = {"cpu_count": 1, "memory": "512m", "gpu_count": 0}
+
+    def bench_run_container():
+        result = agent.run_docker_container("nginx", limits, f"bench_{next(counter)}")
+        assert result["success"], result
+
+    results["run_docker_container"] = measure(bench_run_container, 10 if quick else 50, 3)
+
+    # Emit fan-out: one usage_stats emit until every connected client has it
+    runner = web.AppRunner(agent.app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    clients = FanoutClients(socketio, args.clients)
+    try:
+        await clients.connect(f"http://127.0.0.1:{port}")
+        await asyncio.sleep(1)  # Let the connect handlers finish their initial sends
+        payload = dict(await agent.get_usage())
+        seq = iter(range(1_000_000))
+
+        async def bench_fanout():
+            n = next(seq)
+            clients.arm(n)
+            await agent.sio.emit("usage_stats", dict(payload, bench_seq=n))
+            await asyncio.wait_for(clients.done.wait(), 10)
+
+        results[f"emit_fanout_{args.clients}_clients"] = await measure_async(
+            bench_fanout, 20 if quick else 100, 5)
+    finally:
+        await clients.disconnect()
+        await runner.cleanup()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return (rows, regressions) comparing medians against the baseline.
+
+    A regression must be more than tolerance and ABSOLUTE_NOISE_MS slower,
+    and the fastest of this run's repeats must still be slower than the
+    slowest of the baseline's, so run-to-run noise alone cannot trip it.
+    """
+    rows, regressions = [], []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, result["median_ms"], None, None, "new"))
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        slower_by = result["median_ms"] - base["median_ms"]
+        overlaps = result.get("fastest_ms", result["median_ms"]) <= base.get("slowest_ms", base["median_ms"])
+        status = "ok"
+        if ratio > 1 + tolerance and slower_by > ABSOLUTE_NOISE_MS and not overlaps:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif ratio > 1 + tolerance and slower_by > ABSOLUTE_NOISE_MS:
+            status = "noisy"
+        elif ratio < 1 - tolerance:
+            status = "faster"
+        rows.append((name, result["median_ms"], base["median_ms"], ratio, status))
+    return rows, regressions
+
+
+def combine(runs):
+    """Per benchmark: the median of each run's median, and the fastest and slowest run"""
+    combined = {}
+    for name in runs[0]:
+        medians = [run[name]["median_ms"] for run in runs if name in run]
+        combined[name] = {
+            "runs": len(medians),
+            "median_ms": round(statistics.median(medians), 4),
+            "fastest_ms": min(medians),
+            "slowest_ms": max(medians),
+        }
+    return combined
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_once(args):
+    """One pass over every benchmark, in this process"""
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    fake_nvidia_smi.install_shim(workdir)
+    os.environ["PATH"] = workdir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_NVIDIA_SMI_GPUS"] = str(args.gpus)
+    mock = MockDockerServer(os.path.join(workdir, "docker.sock")).start()
+    os.environ["DOCKER_HOST"] = mock.base_url
+
+    # Import only once the fakes are in place: the agent connects to Docker at import
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import get_stats
+        results = asyncio.run(run_benchmarks(get_stats, mock, args))
+    mock.stop()
+    return results
+
+
+def run_worker(script, args):
+    """Run one pass of `script` (this file, or its copy at another revision) in a fresh process"""
+    fd, output = tempfile.mkstemp(prefix="agent-bench-", suffix=".json")
+    os.close(fd)
+    command = [sys.executable, script, "--output", output, "--baseline", output + ".none",
+               "--clients", str(args.clients), "--containers", str(args.containers), "--gpus", str(args.gpus)]
+    if args.quick:
+        command.append("--quick")
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")  # Whatever the agent writes stays out of the tree
+    try:
+        subprocess.run(command, check=False, stdout=subprocess.DEVNULL, cwd=workdir,
+                       env=dict(os.environ, BENCH_AGENT_WORKER="1",
+                                AGENT_METER_LEDGER=os.path.join(workdir, "metering.jsonl")))
+        with open(output) as f:
+            return json.load(f)["results"]
+    finally:
+        os.unlink(output)
+
+
+@contextlib.contextmanager
+def checkout(revision):
+    """bench_agent.py as of a git revision, in a temporary worktree"""
+    path = tempfile.mkdtemp(prefix="agent-bench-rev-")
+    subprocess.run(["git", "worktree", "add", "--detach", "--quiet", path, revision], cwd=AGENT_DIR, check=True)
+    try:
+        relative = os.path.relpath(os.path.abspath(__file__), subprocess.run(
+            ["git", "rev-parse", "--show-toplevel"], cwd=AGENT_DIR, check=True, capture_output=True,
+            text=True).stdout.strip())
+        yield os.path.join(path, relative)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", path], cwd=AGENT_DIR, check=False)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the agent's hot paths")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Write this run's results as the new baseline")
+    parser.add_argument("--against", metavar="REVISION",
+                        help="Compare against this git revision, run interleaved on this machine now, "
+                             "instead of the baseline file")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh processes per side")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown of the median before flagging a regression")
+    parser.add_argument("--clients", type=int, default=50, help="Socket.IO clients for the fan-out")
+    parser.add_argument("--containers", type=int, default=20,
+                        help="Running containers in the mock for get_container_list")
+    parser.add_argument("--gpus", type=int, default=2, help="GPUs reported by the fake nvidia-smi")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations, for smoke runs")
+    parser.add_argument("--output", help="Also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    if os.environ.get("BENCH_AGENT_WORKER"):
+        with open(args.output, "w") as f:
+            json.dump({"meta": machine_info(), "results": run_once(args)}, f)
+        return 0
+
+    script = os.path.abspath(__file__)
+    runs, base_runs = [], []
+    with contextlib.ExitStack() as stack:
+        base_script = stack.enter_context(checkout(args.against)) if args.against else None
+        for _ in range(args.repeats):
+            # Alternate the two sides so drift in the machine's speed hits both alike
+            if base_script:
+                base_runs.append(run_worker(base_script, args))
+            runs.append(run_worker(script, args))
+    results = combine(runs)
+
+    report = {"meta": machine_info(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+
+    baseline = {}
+    gate = True
+    if base_runs:
+        baseline = combine(base_runs)
+        print(f"Baseline: {args.against}, {args.repeats} interleaved runs")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored.get("results", {})
+        if stored.get("meta") != report["meta"]:
+            gate = False
+            print("Note: baseline was recorded on a different machine/interpreter; not failing on it. "
+                  "Use --against REVISION to compare on this machine.")
+
+    rows, regressions = compare(results, baseline, args.tolerance)
+    print(f"{'benchmark':<34}{'median ms':>12}{'baseline':>12}{'ratio':>8}  status")
+    for name, median, base, ratio, status in rows:
+        base_text = f"{base:.4f}" if base is not None else "-"
+        ratio_text = f"{ratio:.2f}" if ratio is not None else "-"
+        print(f"{name:<34}{median:>12.4f}{base_text:>12}{ratio_text:>8}  {status}")
+
+    if regressions and gate and not args.update_baseline:
+        print(f"Regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
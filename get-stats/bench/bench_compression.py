@@ -0,0 +1,168 @@
+"""
+Benchmark WebSocket compression: CPU cost against bytes saved, per event.
+
+Builds realistic payloads for each event the agent sends (usage_stats with
+2 and 8 GPUs, system_info, container_list with 10 and 50 containers,
+agent_stats), encodes them as Engine.IO/Socket.IO packets and writes a
+stream of them through aiohttp's own WebSocketWriter into a byte-counting
+transport, once uncompressed and once with permessage-deflate (context
+takeover, as negotiated with browsers). Payload values change from frame
+to frame the way they do between sampler ticks.
+
+For each event it reports payload and wire bytes per frame, CPU time per
+frame in both modes, and whether the agent's compression thresholds would
+deflate it. system_info goes out once per connection, so each of its frames
+starts with an empty deflate window.
+
+    python bench/bench_compression.py --frames 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from aiohttp._websocket.writer import WebSocketWriter
+from aiohttp.http_websocket import WSMsgType
+from socketio import packet
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import compression  # noqa: E402
+import instrumentation  # noqa: E402
+
+
+class CountingTransport:
+    """Just enough of asyncio.Transport for WebSocketWriter"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+    def is_closing(self):
+        return False
+
+
+class IdleProtocol:
+    _paused = False
+
+    async def _drain_helper(self):
+        pass
+
+
+def usage_stats(rng, gpus):
+    return {
+        "CPU_Usage": round(rng.uniform(0, 100), 1),
+        "Memory_Usage": round(rng.uniform(20, 90), 1),
+        "Disk_Usage": 61.3,
+        "GPU_Usage": rng.randint(0, 100),
+        "GPUs": [{"Index": i, "Name": "NVIDIA A100-SXM4-80GB", "Usage": rng.randint(0, 100),
+                  "Memory_Usage": rng.randint(0, 100), "Memory_Used": rng.randint(0, 81920),
+                  "Memory_Total": 81920, "Temperature": rng.randint(30, 80)} for i in range(gpus)],
+    }
+
+
+def system_info(rng):
+    return {
+        "OS": "Linux 6.8.0-45-generic", "Threads": 128, "RAM": 1007.52,
+        "GPU": [{"Name": "NVIDIA A100-SXM4-80GB", "Memory": 81920.0} for _ in range(8)],
+    }
+
+
+def container_list(rng, count):
+    images = ["nginx:latest", "pytorch/pytorch:2.4.0-cuda12.1-cudnn9-runtime",
+              "nvcr.io/nvidia/tritonserver:24.08-py3", "jupyter/base-notebook:latest"]
+    statuses = ["running"] * 8 + ["exited", "paused"]
+    return {"success": True, "containers": [
+        {"id": "%064x" % rng.getrandbits(256), "name": f"rental-{rng.randint(1000, 9999)}-{i}",
+         "status": rng.choice(statuses), "image": rng.choice(images)} for i in range(count)]}
+
+
+def agent_stats(rng):
+    instrument = instrumentation.Instrumentation()
+    for kind, names in (("handler", ["connect", "request_system_info", "run_container", "list_containers",
+                                     "stop_container_request", "get_agent_stats", "disconnect"]),
+                        ("collector", ["get_system_info", "get_usage", "get_container_list",
+                                       "run_docker_container", "stop_container", "get_container_summary"]),
+                        ("emit", ["usage_stats", "system_info", "container_list", "container_result"])):
+        for name in names:
+            hist = instrument.histogram(kind, name)
+            for _ in range(50):
+                hist.observe(rng.expovariate(200))
+    snapshot = instrument.snapshot()
+    snapshot["counters"] = {"samples": rng.randint(0, 10 ** 6), "usage_frames_sent": rng.randint(0, 10 ** 7)}
+    return snapshot
+
+
+# name -> (event, payload builder, sent once per connection)
+EVENTS = {
+    "usage_stats_2_gpus": ("usage_stats", lambda rng: usage_stats(rng, 2), False),
+    "usage_stats_8_gpus": ("usage_stats", lambda rng: usage_stats(rng, 8), False),
+    "system_info": ("system_info", system_info, True),
+    "container_list_10": ("container_list", lambda rng: container_list(rng, 10), False),
+    "container_list_50": ("container_list", lambda rng: container_list(rng, 50), False),
+    "agent_stats": ("agent_stats", agent_stats, False),
+}
+
+
+def encode(event, data):
+    """The text Engine.IO hands to the WebSocket driver"""
+    return "4" + packet.Packet(packet.EVENT, data=[event, data]).encode()
+
+
+async def write_stream(messages, compress, fresh):
+    """
+    Push messages through a WebSocketWriter; returns (wire bytes, CPU seconds).
+    With fresh, every message gets a new writer and so an empty deflate window.
+    """
+    transport = CountingTransport()
+    writer = WebSocketWriter(IdleProtocol(), transport, compress=compress)
+    start = time.process_time()
+    for message in messages:
+        if fresh:
+            writer = WebSocketWriter(IdleProtocol(), transport, compress=compress)
+        await writer.send_frame(message.encode("utf-8"), WSMsgType.TEXT)
+    return transport.bytes, time.process_time() - start
+
+
+async def bench(args):
+    from get_stats import COMPRESSION_THRESHOLDS
+    policy = compression.CompressionPolicy(COMPRESSION_THRESHOLDS)
+    report = {}
+    for name, (event, build, per_connection) in EVENTS.items():
+        rng = random.Random(args.seed)
+        messages = [encode(event, build(rng)) for _ in range(args.frames)]
+        payload = sum(len(m.encode("utf-8")) for m in messages)
+        plain_bytes, plain_cpu = await write_stream(messages, 0, per_connection)
+        deflate_bytes, deflate_cpu = await write_stream(messages, 15, per_connection)
+        saved = plain_bytes - deflate_bytes
+        extra_cpu = deflate_cpu - plain_cpu
+        report[name] = {
+            "payload_bytes_per_frame": round(payload / args.frames, 1),
+            "plain_wire_bytes_per_frame": round(plain_bytes / args.frames, 1),
+            "deflate_wire_bytes_per_frame": round(deflate_bytes / args.frames, 1),
+            "bytes_saved_percent": round(saved / plain_bytes * 100, 1),
+            "plain_cpu_us_per_frame": round(plain_cpu / args.frames * 1e6, 2),
+            "deflate_cpu_us_per_frame": round(deflate_cpu / args.frames * 1e6, 2),
+            "extra_cpu_us_per_kib_saved": round(extra_cpu * 1e6 / (saved / 1024), 2) if saved > 0 else None,
+            "policy_compresses": policy.should_compress(event, round(payload / args.frames)),
+        }
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="WebSocket compression CPU versus bytes, per event")
+    parser.add_argument("--frames", type=int, default=2000, help="Frames per event stream")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    print(json.dumps({"frames": args.frames, "events": asyncio.run(bench(args))}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
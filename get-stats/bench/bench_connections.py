@@ -0,0 +1,220 @@
+"""
+Benchmark what an idle dashboard connection costs the agent.
+
+Spawns the agent (fake nvidia-smi, mock Docker, no tunnel), opens N
+websocket clients that speak just enough Engine.IO v4 / Socket.IO to
+connect and answer pings, and reports the agent's resident memory and
+asyncio task count per connection plus its CPU time per idle connection
+over a window that spans several ping intervals. The CPU figure has the
+agent's own baseline (sampler, loop-lag monitor) subtracted; what remains
+is ping/pong plus the usage_stats fan-out every client receives.
+
+    python bench/bench_connections.py --connections 2000
+    python bench/bench_connections.py --connections 10000 --scale-mode
+
+--scale-mode sets AGENT_CONNECTION_SCALE=1 on the agent under test. For
+10k connections the open-file limit has to allow it (the agent and this
+script each hold one socket per connection).
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import aiohttp
+import psutil
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AGENT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, AGENT_DIR)
+
+import fake_nvidia_smi  # noqa: E402
+from mock_docker import MockDockerServer  # noqa: E402
+
+
+class IdleClient:
+    """A Socket.IO client that connects, answers pings and counts frames"""
+
+    def __init__(self, session, url):
+        self.session = session
+        self.url = url
+        self.ws = None
+        self.connected = asyncio.Event()
+        self.pings = 0
+        self.frames = 0
+        self.task = None
+
+    async def run(self):
+        self.ws = await self.session.ws_connect(self.url, autoping=True, compress=0)
+        async for msg in self.ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            data = msg.data
+            if data.startswith("0"):  # Engine.IO open
+                await self.ws.send_str("40")
+            elif data.startswith("40"):  # Socket.IO connect ack
+                self.connected.set()
+            elif data == "2":
+                self.pings += 1
+                await self.ws.send_str("3")
+            else:
+                self.frames += 1
+
+    async def request(self, event, reply):
+        """One-off event round trip on a dedicated connection"""
+        ws = await self.session.ws_connect(self.url, compress=0)
+        try:
+            async for msg in ws:
+                data = msg.data
+                if data.startswith("0"):
+                    await ws.send_str("40")
+                elif data.startswith("40"):
+                    await ws.send_str("42" + json.dumps([event]))
+                elif data == "2":
+                    await ws.send_str("3")
+                elif data.startswith(f'42["{reply}"'):
+                    return json.loads(data[2:])[1]
+        finally:
+            await ws.close()
+
+
+async def wait_for_log(stream, event, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        line = await asyncio.wait_for(stream.readline(), deadline - time.monotonic())
+        if not line:
+            break
+        try:
+            if json.loads(line).get("event") == event:
+                return True
+        except ValueError:
+            continue
+    raise RuntimeError(f"agent never logged {event!r}")
+
+
+async def drain(stream):
+    while await stream.readline():
+        pass
+
+
+def cpu_seconds(proc):
+    times = proc.cpu_times()
+    return times.user + times.system
+
+
+async def agent_stats(session, url):
+    stats = await IdleClient(session, url).request("get_agent_stats", "agent_stats")
+    return {"tasks": stats.get("tasks"), "connected_clients": stats.get("connected_clients")}
+
+
+async def bench(args):
+    workdir = tempfile.mkdtemp(prefix="agent-connections-")
+    fake_nvidia_smi.install_shim(workdir)
+    mock = MockDockerServer(os.path.join(workdir, "docker.sock")).start()
+    mock.docker.reset(containers=3)
+
+    env = dict(os.environ)
+    env["PATH"] = workdir + os.pathsep + env.get("PATH", "")
+    env["DOCKER_HOST"] = mock.base_url
+    env["AGENT_PUBLIC_URL"] = f"http://127.0.0.1:{args.port}"
+    env["AGENT_PORT"] = str(args.port)
+    env["AGENT_METER_LEDGER"] = os.path.join(workdir, "metering.jsonl")
+    if args.scale_mode:
+        env["AGENT_CONNECTION_SCALE"] = "1"
+
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(AGENT_DIR, "get_stats.py"), "http://127.0.0.1:9/api/ngrok",
+        cwd=AGENT_DIR, env=env,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    url = f"ws://127.0.0.1:{args.port}/socket.io/?EIO=4&transport=websocket"
+    connector = aiohttp.TCPConnector(limit=0)
+    session = aiohttp.ClientSession(connector=connector)
+    clients = []
+    drainer = None
+    try:
+        await wait_for_log(proc.stdout, "system_info_ready", 30)
+        drainer = asyncio.create_task(drain(proc.stdout))
+        agent = psutil.Process(proc.pid)
+
+        await asyncio.sleep(args.settle)
+        before = await agent_stats(session, url)
+        rss_before = agent.memory_info().rss
+        cpu_start, wall_start = cpu_seconds(agent), time.monotonic()
+        await asyncio.sleep(args.window)
+        baseline_cpu = (cpu_seconds(agent) - cpu_start) / (time.monotonic() - wall_start)
+
+        started = time.perf_counter()
+        for i in range(0, args.connections, args.batch):
+            batch = [IdleClient(session, url) for _ in range(min(args.batch, args.connections - i))]
+            for client in batch:
+                client.task = asyncio.create_task(client.run())
+            await asyncio.wait_for(asyncio.gather(*(c.connected.wait() for c in batch)), 60)
+            clients.extend(batch)
+        connect_s = time.perf_counter() - started
+
+        await asyncio.sleep(args.settle)
+        for client in clients:
+            client.pings = client.frames = 0
+        rss_after = agent.memory_info().rss
+        cpu_start, wall_start = cpu_seconds(agent), time.monotonic()
+        await asyncio.sleep(args.window)
+        window = time.monotonic() - wall_start
+        loaded_cpu = (cpu_seconds(agent) - cpu_start) / window
+        after = await agent_stats(session, url)
+        alive = sum(1 for c in clients if not c.task.done())
+
+        n = args.connections
+        return {
+            "mode": "connection_scale" if args.scale_mode else "default",
+            "connections": n,
+            "alive_at_end": alive,
+            "connect_s": round(connect_s, 2),
+            "rss_before_mb": round(rss_before / 2 ** 20, 1),
+            "rss_after_mb": round(rss_after / 2 ** 20, 1),
+            "rss_per_connection_kb": round((rss_after - rss_before) / n / 1024, 2),
+            "tasks_before": before["tasks"],
+            "tasks_after": after["tasks"],
+            "tasks_per_connection": round((after["tasks"] - before["tasks"]) / n, 2),
+            "window_s": round(window, 1),
+            "agent_cpu_percent_baseline": round(baseline_cpu * 100, 2),
+            "agent_cpu_percent_loaded": round(loaded_cpu * 100, 2),
+            "cpu_us_per_idle_connection_per_s": round((loaded_cpu - baseline_cpu) / n * 1e6, 2),
+            "pings_per_connection": round(sum(c.pings for c in clients) / n, 2),
+            "frames_per_connection": round(sum(c.frames for c in clients) / n, 2),
+        }
+    finally:
+        for client in clients:
+            client.task.cancel()
+        if drainer is not None:
+            drainer.cancel()
+        await session.close()
+        proc.terminate()
+        await proc.wait()
+        mock.stop()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Per-connection memory and idle CPU of the agent")
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--scale-mode", action="store_true", help="Run the agent with AGENT_CONNECTION_SCALE=1")
+    parser.add_argument("--batch", type=int, default=200, help="Clients connecting at once")
+    parser.add_argument("--window", type=float, default=60,
+                        help="Idle measurement window in seconds; keep it above the ping interval")
+    parser.add_argument("--settle", type=float, default=5)
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args(argv)
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))  # Inherited by the agent too
+    print(json.dumps(asyncio.run(bench(args)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
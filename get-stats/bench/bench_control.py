@@ -0,0 +1,145 @@
+"""
+Benchmark control-command fairness with one abusive client.
+
+Runs the agent in-process against the mock Docker daemon with simulated
+daemon latency. One client fires run_container in a tight loop while a few
+polite clients send list_containers every half second, and the polite
+clients' round-trip times are compared across scheduling variants:
+
+    inline      the Docker call runs in the event-loop handler (before)
+    fifo        the control pool, but one shared FIFO queue and no limits
+    fair        per-client queues served round-robin, no limits
+    fair+limit  the agent's defaults: round-robin plus token buckets and
+                a per-client pending cap, rejecting with retry_after
+
+    python bench/bench_control.py --duration 8 --docker-latency 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+import socketio
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from client import percentiles  # noqa: E402
+import fake_nvidia_smi  # noqa: E402
+from mock_docker import MockDockerServer  # noqa: E402
+
+
+def variants(control, get_stats):
+    class Inline(control.FairScheduler):
+        async def submit(self, client, command, func, *args):
+            return func(*args)
+
+    class Fifo(control.FairScheduler):
+        async def submit(self, client, command, func, *args):
+            return await super().submit("everyone", command, func, *args)
+
+    unlimited = dict(rate=math.inf, burst=math.inf, max_pending=10 ** 9)
+    workers = get_stats.CONTROL_WORKERS
+    return {
+        "inline": lambda: Inline(workers, **unlimited),
+        "fifo": lambda: Fifo(workers, **unlimited),
+        "fair": lambda: control.FairScheduler(workers, **unlimited),
+        "fair+limit": lambda: control.FairScheduler(workers, get_stats.CONTROL_RATE, get_stats.CONTROL_BURST,
+                                                    get_stats.CONTROL_MAX_PENDING, get_stats.CONTROL_COSTS),
+    }
+
+
+async def polite_client(url, deadline, rtts, interval):
+    sio = socketio.AsyncClient(reconnection=False)
+    replies = asyncio.Queue()
+    sio.on("container_list", lambda data: replies.put_nowait(time.perf_counter()))
+    await sio.connect(url, transports=["websocket"], wait_timeout=10)
+    while time.perf_counter() < deadline:
+        sent = time.perf_counter()
+        await sio.emit("list_containers")
+        try:
+            received = await asyncio.wait_for(replies.get(), max(0.1, deadline + 30 - sent))
+        except asyncio.TimeoutError:
+            break
+        rtts.append((received - sent) * 1000)
+        await asyncio.sleep(max(0, interval - (time.perf_counter() - sent)))
+    await sio.disconnect()
+
+
+async def abusive_client(url, deadline, counts, rate):
+    sio = socketio.AsyncClient(reconnection=False)
+
+    def on_result(data):
+        counts["throttled" if "retry_after" in data else "completed" if data.get("success") else "failed"] += 1
+    sio.on("container_result", on_result)
+    await sio.connect(url, transports=["websocket"], wait_timeout=10)
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        counts["sent"] += 1
+        await sio.emit("run_container", {"image": "nginx", "resource_limits": {}, "container_name": f"abuse_{n}"})
+        await asyncio.sleep(1 / rate)
+    await sio.disconnect()
+
+
+async def run_variant(get_stats, mock, make_scheduler, args, url):
+    mock.docker.reset()
+    get_stats.control_scheduler = make_scheduler()
+    deadline = time.perf_counter() + args.duration
+    rtts = []
+    counts = {"sent": 0, "completed": 0, "failed": 0, "throttled": 0}
+    await asyncio.gather(
+        abusive_client(url, deadline, counts, args.abuse_rate),
+        *[polite_client(url, deadline, rtts, args.polite_interval) for _ in range(args.polite)])
+    stats = get_stats.control_scheduler.stats()
+    get_stats.control_scheduler.executor.shutdown(wait=False, cancel_futures=True)
+    return {"polite_list_rtt_ms": percentiles(rtts), "abuser": counts, "left_queued": stats["queued"]}
+
+
+async def run(get_stats, mock, args):
+    import control
+    port = args.port
+    asyncio.create_task(get_stats.main(host="127.0.0.1", port=port))
+    await asyncio.sleep(1)
+    url = f"http://127.0.0.1:{port}"
+    report = {"docker_latency_s": args.docker_latency, "abuse_rate": args.abuse_rate, "polite_clients": args.polite}
+    for name, make_scheduler in variants(control, get_stats).items():
+        report[name] = await run_variant(get_stats, mock, make_scheduler, args, url)
+        await asyncio.sleep(1)  # Let leftovers drain
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark control-command fairness")
+    parser.add_argument("--duration", type=float, default=8)
+    parser.add_argument("--docker-latency", type=float, default=0.05, help="Seconds per mutating Docker call")
+    parser.add_argument("--abuse-rate", type=float, default=50, help="run_container per second from the abuser")
+    parser.add_argument("--polite", type=int, default=4)
+    parser.add_argument("--polite-interval", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=18780)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="control-bench-")
+    fake_nvidia_smi.install_shim(workdir)
+    os.environ["PATH"] = workdir + os.pathsep + os.environ.get("PATH", "")
+    mock = MockDockerServer(os.path.join(workdir, "docker.sock"), latency=args.docker_latency).start()
+    os.environ["DOCKER_HOST"] = mock.base_url
+    os.environ["AGENT_PUBLIC_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["AGENT_METER_LEDGER"] = os.path.join(workdir, "metering.jsonl")
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import get_stats
+    get_stats.SERVER_NOTIFICATION_URL = "http://127.0.0.1:9/unused"
+
+    report = asyncio.run(run(get_stats, mock, args))
+    print(json.dumps(report, indent=2))
+    os._exit(0)  # Leftover inline/FIFO work and the agent's tasks need not finish
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
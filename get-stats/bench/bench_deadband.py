@@ -0,0 +1,175 @@
+"""
+Measure how many usage_stats frames deadband mode saves.
+
+Replays simulated sampler traces through deadband.Deadband with the agent's
+own DEADBAND_TOLERANCES and DEADBAND_MAX_SILENCE, one snapshot per
+USAGE_INTERVAL, and counts the frames that would go out against the one
+frame per tick the agent sends without it. The traces mimic:
+
+    idle     a rented GPU box nobody is using: CPU noise of a few percent,
+             journald writes, a trickle of network, GPUs at 0 % and cool
+    busy     a training job: GPUs at 85-100 %, dataloader disk reads and
+             CPU pulses, steady network traffic, temperatures settling
+    bursty   idle most of the time with a short job every few minutes
+
+With --live SECONDS it samples this host through the agent's get_usage()
+instead (GPUs come from the fake nvidia-smi, which reports constant values).
+
+    python bench/bench_deadband.py --minutes 60
+    python bench/bench_deadband.py --live 120
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import deadband  # noqa: E402
+import fake_nvidia_smi  # noqa: E402
+
+GPUS = 2
+MIB = 1 << 20
+
+
+class Host:
+    """Slowly drifting host state that a trace perturbs every tick"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.memory = 22.0
+        self.disk = 41.3
+        self.temperatures = [34.0] * GPUS
+        self.gpu_memory = [0.0] * GPUS
+
+    def snapshot(self, cpu, gpu_usage, gpu_memory_usage, disk_read, disk_write, rx, tx):
+        rng = self.rng
+        gpus = []
+        for i in range(GPUS):
+            gpus.append({
+                "Index": i,
+                "Name": "NVIDIA A100-SXM4-80GB",
+                "Usage": gpu_usage[i],
+                "Memory_Usage": gpu_memory_usage[i],
+                "Memory_Used": round(self.gpu_memory[i]),
+                "Memory_Total": 81920,
+                "Temperature": round(self.temperatures[i]),
+            })
+        return {
+            "CPU_Usage": round(max(0.0, min(100.0, cpu)), 1),
+            "Memory_Usage": round(self.memory, 1),
+            "Disk_Usage": round(self.disk, 1),
+            "GPU_Usage": gpus[0]["Usage"],
+            "GPU_Memory_Usage": gpus[0]["Memory_Usage"],
+            "GPUs": gpus,
+            "Disks": [{"Device": "nvme0n1", "Read_Bytes_Per_Sec": round(disk_read),
+                       "Write_Bytes_Per_Sec": round(disk_write),
+                       "Read_IOPS": round(disk_read / (128 << 10), 1),
+                       "Write_IOPS": round(disk_write / (16 << 10) + rng.uniform(0, 2), 1)}],
+            "NICs": [{"Interface": "eth0", "Rx_Bytes_Per_Sec": round(rx), "Tx_Bytes_Per_Sec": round(tx)}],
+        }
+
+    def idle(self):
+        rng = self.rng
+        self.memory += rng.gauss(0, 0.02)
+        for i in range(GPUS):
+            self.temperatures[i] += (34 - self.temperatures[i]) * 0.1 + rng.gauss(0, 0.3)
+            self.gpu_memory[i] = max(0.0, self.gpu_memory[i] * 0.5)
+        write = rng.choice((0, 0, 0, rng.uniform(4, 256) * 1024))  # journald, cron, package cache
+        return self.snapshot(rng.uniform(0.3, 3.0), [0] * GPUS, [0] * GPUS, 0, write,
+                             rng.uniform(200, 4000), rng.uniform(200, 3000))
+
+    def busy(self, tick):
+        rng = self.rng
+        self.memory += (61 - self.memory) * 0.05 + rng.gauss(0, 0.05)
+        self.disk += 0.002  # Checkpoints
+        for i in range(GPUS):
+            self.temperatures[i] += (78 - self.temperatures[i]) * 0.05 + rng.gauss(0, 0.4)
+            self.gpu_memory[i] += (71000 - self.gpu_memory[i]) * 0.3 + rng.gauss(0, 40)
+        loading = tick % 5 == 0  # Dataloader refill every few ticks
+        usage = [int(max(0, min(100, rng.gauss(93, 5)))) for _ in range(GPUS)]
+        memory_usage = [int(max(0, min(100, u * 0.6 + rng.gauss(0, 4)))) for u in usage]
+        return self.snapshot(rng.gauss(65 if loading else 35, 8), usage, memory_usage,
+                             rng.uniform(150, 400) * MIB if loading else rng.uniform(0, 2) * MIB,
+                             rng.uniform(0, 3) * MIB, rng.gauss(45, 8) * MIB, rng.gauss(2, 0.5) * MIB)
+
+
+def trace(kind, ticks, rng):
+    host = Host(rng)
+    job_every, job_length = 150, 20  # Ticks: a 40 s job every 5 minutes
+    for tick in range(ticks):
+        if kind == "busy" or (kind == "bursty" and tick % job_every >= job_every - job_length):
+            yield host.busy(tick)
+        else:
+            yield host.idle()
+
+
+def replay(snapshots, get_stats):
+    interval = get_stats.USAGE_INTERVAL
+    band = deadband.Deadband(get_stats.DEADBAND_TOLERANCES, get_stats.DEADBAND_MAX_SILENCE,
+                             list_keys=get_stats.USAGE_LIST_KEYS)
+    ticks = sent = 0
+    gap = longest_gap = 0
+    for snapshot in snapshots:
+        if band.should_publish(snapshot, ticks * interval):
+            sent += 1
+            longest_gap = max(longest_gap, gap)
+            gap = 0
+        else:
+            gap += 1
+        ticks += 1
+    minutes = ticks * interval / 60
+    return {
+        "ticks": ticks,
+        "frames_sent": sent,
+        "frames_per_minute": round(sent / minutes, 2),
+        "baseline_frames_per_minute": round(ticks / minutes, 2),
+        "reduction_pct": round(100 * (1 - sent / ticks), 1),
+        "longest_silence_s": (longest_gap + 1) * interval,
+    }
+
+
+async def sample_live(get_stats, seconds):
+    get_stats.psutil.cpu_percent(interval=None)
+    snapshots = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        await asyncio.sleep(get_stats.USAGE_INTERVAL)
+        usage = await get_stats.get_usage()
+        snapshots.append(json.loads(json.dumps(usage)))  # The sampler reuses row dicts
+    return snapshots
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Measure the usage_stats emit rate with deadband mode")
+    parser.add_argument("--minutes", type=float, default=60, help="Simulated length of each trace")
+    parser.add_argument("--live", type=float, metavar="SECONDS", help="Sample this host instead of simulating")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="deadband-bench-")
+    fake_nvidia_smi.install_shim(workdir)
+    os.environ["PATH"] = workdir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_NVIDIA_SMI_GPUS"] = str(GPUS)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import get_stats
+
+    report = {"interval_s": get_stats.USAGE_INTERVAL, "max_silence_s": get_stats.DEADBAND_MAX_SILENCE}
+    if args.live:
+        report["live"] = replay(asyncio.run(sample_live(get_stats, args.live)), get_stats)
+    else:
+        ticks = int(args.minutes * 60 / get_stats.USAGE_INTERVAL)
+        for kind in ("idle", "busy", "bursty"):
+            report[kind] = replay(trace(kind, ticks, random.Random(args.seed)), get_stats)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
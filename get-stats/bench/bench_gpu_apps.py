@@ -0,0 +1,180 @@
+"""
+Check and time the per-container GPU view.
+
+Builds a fake /proc (bench/fake_proc.py) with background processes and GPU
+processes spread over containers, and points the fake nvidia-smi's
+--query-compute-apps at the GPU ones. Between ticks some GPU processes exit
+and others start, some of them reusing a PID that just exited inside a
+different container, which the PID -> container cache must notice. Every
+tick the agent's get_usage() runs, and its Container_GPUs rows are compared
+with the ones expected from the ground truth.
+
+Timing compares container_gpu_usage() with the cached PID -> container map
+against a fresh map every tick (a cgroup read per GPU process per tick).
+
+    python bench/bench_gpu_apps.py --gpus 8 --containers 6 --gpu-processes 64
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from client import percentiles  # noqa: E402
+import fake_nvidia_smi  # noqa: E402
+from fake_proc import FakeProc  # noqa: E402
+import proctop  # noqa: E402
+
+
+class Scenario:
+    def __init__(self, args, root, apps_path):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.fake = FakeProc(root)
+        self.apps_path = apps_path
+        self.containers = ["%064x" % self.rng.getrandbits(256) for _ in range(args.containers)]
+        self.apps = {}  # pid -> {"pid", "gpu", "used_memory", "container"}
+        self.next_pid = 1
+        for _ in range(args.background):
+            self.fake.add(self._pid(), "bash")
+        for _ in range(args.gpu_processes):
+            self.start_gpu_process()
+        self.write()
+
+    def _pid(self):
+        pid, self.next_pid = self.next_pid, self.next_pid + 1
+        return pid
+
+    def start_gpu_process(self, pid=None):
+        rng = self.rng
+        pid = pid or self._pid()
+        container = rng.choice(self.containers + [None])  # Some run on the host
+        self.fake.add(pid, "python", container_id=container, start=rng.randint(1, 10 ** 9))
+        self.apps[pid] = {"pid": pid, "gpu": rng.randrange(self.args.gpus),
+                          "used_memory": rng.choice((0, rng.randint(500, 40000))), "container": container}
+
+    def churn(self):
+        for pid in self.rng.sample(sorted(self.apps), self.args.exits):
+            del self.apps[pid]
+            self.fake.remove(pid)
+            # Half of the replacements reuse the PID, as a busy host eventually does
+            self.start_gpu_process(pid if self.rng.random() < 0.5 else None)
+        self.write()
+
+    def write(self):
+        with open(self.apps_path, "w") as f:
+            json.dump([{k: v for k, v in app.items() if k != "container"} for app in self.apps.values()], f)
+
+    def expected(self, gpus):
+        by_index = {gpu["Index"]: gpu for gpu in gpus}
+        totals = {}
+        for app in self.apps.values():
+            total = totals.setdefault(app["gpu"], [0, 0])
+            total[0] += app["used_memory"]
+            total[1] += 1
+        rows = {}
+        for app in self.apps.values():
+            if app["container"] is None:
+                continue
+            row = rows.setdefault(app["container"], {"GPUs": set(), "GPU_Usage": 0.0, "GPU_Memory_Used": 0,
+                                                     "Processes": 0})
+            used, count = totals[app["gpu"]]
+            share = app["used_memory"] / used if used else 1 / count
+            row["GPUs"].add(app["gpu"])
+            row["GPU_Usage"] += by_index[app["gpu"]]["Usage"] * share
+            row["GPU_Memory_Used"] += app["used_memory"]
+            row["Processes"] += 1
+        return rows
+
+
+def mismatch(rows, expected):
+    if {row["Container_ID"] for row in rows} != set(expected):
+        return True
+    for row in rows:
+        want = expected[row["Container_ID"]]
+        if (set(row["GPUs"]) != want["GPUs"] or row["Processes"] != want["Processes"]
+                or row["GPU_Memory_Used"] != want["GPU_Memory_Used"]
+                or abs(row["GPU_Usage"] - want["GPU_Usage"]) > 0.1 * len(want["GPUs"])):
+            return True
+    return False
+
+
+async def run(get_stats, scenario, args):
+    mismatches = 0
+    cached_ms, fresh_ms = [], []
+    reads_after_first_tick = None
+    fresh_reads = 0
+    for _ in range(args.ticks):
+        scenario.churn()
+        usage = await get_stats.get_usage()
+        if reads_after_first_tick is None:
+            reads_after_first_tick = get_stats.gpu_container_map.cgroup_reads
+        if mismatch(usage["Container_GPUs"], scenario.expected(usage["GPUs"])):
+            mismatches += 1
+
+        apps = await get_stats.query_compute_apps()
+        start = time.perf_counter()
+        get_stats.container_gpu_usage(usage["GPUs"], apps)
+        cached_ms.append((time.perf_counter() - start) * 1000)
+
+        cached_map = get_stats.gpu_container_map
+        get_stats.gpu_container_map = proctop.ContainerMap(args.proc_root)
+        start = time.perf_counter()
+        get_stats.container_gpu_usage(usage["GPUs"], apps)
+        fresh_ms.append((time.perf_counter() - start) * 1000)
+        fresh_reads += get_stats.gpu_container_map.cgroup_reads
+        get_stats.gpu_container_map = cached_map
+
+    return {
+        "gpus": args.gpus,
+        "containers": args.containers,
+        "gpu_processes": len(scenario.apps),
+        "ticks": args.ticks,
+        "mismatched_ticks": mismatches,
+        "cached_ms": percentiles(cached_ms),
+        "uncached_ms": percentiles(fresh_ms),
+        "gpu_processes_started_per_tick": args.exits,
+        "cgroup_reads_per_tick_cached":
+            round((cached_map.cgroup_reads - reads_after_first_tick) / (args.ticks - 1), 2),
+        "cgroup_reads_per_tick_uncached": round(fresh_reads / args.ticks, 2),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check and time per-container GPU attribution")
+    parser.add_argument("--gpus", type=int, default=8)
+    parser.add_argument("--containers", type=int, default=6)
+    parser.add_argument("--gpu-processes", type=int, default=64)
+    parser.add_argument("--background", type=int, default=500, help="Non-GPU processes in the fake /proc")
+    parser.add_argument("--exits", type=int, default=4, help="GPU processes replaced each tick")
+    parser.add_argument("--ticks", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="gpu-apps-bench-")
+    args.proc_root = os.path.join(workdir, "proc")
+    apps_path = os.path.join(workdir, "apps.json")
+    scenario = Scenario(args, args.proc_root, apps_path)
+    fake_nvidia_smi.install_shim(workdir)
+    os.environ["PATH"] = workdir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_NVIDIA_SMI_GPUS"] = str(args.gpus)
+    os.environ["FAKE_NVIDIA_SMI_APPS"] = apps_path
+    os.environ["AGENT_PROC_ROOT"] = args.proc_root
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import get_stats
+
+    report = asyncio.run(run(get_stats, scenario, args))
+    print(json.dumps(report, indent=2))
+    return 1 if report["mismatched_ticks"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,120 @@
+"""
+Benchmark HostIndex capacity queries and heartbeat updates at fleet scale.
+
+Builds a synthetic fleet (default 10k hosts with a mix of GPU models),
+times find() for representative placement queries and the cost of applying
+a heartbeat, and cross-checks every query, matches and their ranking,
+against a brute-force scan.
+
+    python bench/bench_host_index.py --hosts 10000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from client import percentiles  # noqa: E402
+from host_index import HostIndex, normalize  # noqa: E402
+
+MODELS = ["NVIDIA A100-SXM4-80GB", "NVIDIA A100-PCIE-40GB", "NVIDIA H100 80GB HBM3",
+          "NVIDIA GeForce RTX 4090", "NVIDIA L4", "Tesla T4"]
+
+QUERIES = {
+    "2_free_a100_64gb_ram": {"min_free_gpus": 2, "gpu_model": "A100", "min_free_ram_gb": 64},
+    "8_free_h100": {"min_free_gpus": 8, "gpu_model": "H100"},
+    "1_free_gpu_32_threads": {"min_free_gpus": 1, "min_cpu_threads": 32},
+    "512gb_ram": {"min_free_ram_gb": 512},
+    "4_free_4090_128gb_64_threads": {"min_free_gpus": 4, "gpu_model": "4090", "min_free_ram_gb": 128,
+                                     "min_cpu_threads": 64},
+    "512gb_ram_limit_20": {"min_free_ram_gb": 512, "limit": 20},
+    "1_free_gpu_limit_10": {"min_free_gpus": 1, "limit": 10},
+    "1_free_a100_limit_5": {"min_free_gpus": 1, "gpu_model": "A100", "limit": 5},
+    "any_host": {},
+}
+
+
+def random_summary(rng):
+    model = rng.choice(MODELS)
+    gpus = rng.choice([0, 1, 2, 4, 8])
+    free = rng.randint(0, gpus)
+    return {
+        "free_gpus": free,
+        "free_gpu_models": {model: free} if free else {},
+        "free_ram_gb": round(rng.uniform(4, 1024), 2),
+        "cpu_threads": rng.choice([8, 16, 32, 64, 128, 256]),
+    }
+
+
+def brute_force(hosts, min_free_gpus=0, gpu_model=None, min_free_ram_gb=0, min_cpu_threads=0, limit=None):
+    """Matches ranked as HostIndex.find ranks them: most free (matching) GPUs, then machine ID"""
+    result = []
+    for machine_id, summary in hosts.items():
+        host = normalize(summary)
+        if gpu_model:
+            free = sum(n for m, n in host["free_gpu_models"].items() if gpu_model.lower() in m.lower())
+            if free < max(1, min_free_gpus):
+                continue
+        else:
+            free = host["free_gpus"]
+            if free < min_free_gpus:
+                continue
+        if host["free_ram_gb"] >= min_free_ram_gb and host["cpu_threads"] >= min_cpu_threads:
+            result.append((-free, machine_id))
+    result.sort()
+    return [machine_id for _, machine_id in result][:limit]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark HostIndex")
+    parser.add_argument("--hosts", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    index = HostIndex()
+    summaries = {f"host-{i:05d}": random_summary(rng) for i in range(args.hosts)}
+
+    start = time.perf_counter()
+    for machine_id, summary in summaries.items():
+        index.update(machine_id, summary)
+    build_s = time.perf_counter() - start
+
+    # Heartbeats: a random host reports a new summary
+    update_us = []
+    machine_ids = list(summaries)
+    for _ in range(args.iterations * 10):
+        machine_id = rng.choice(machine_ids)
+        summary = random_summary(rng)
+        t = time.perf_counter()
+        index.update(machine_id, summary)
+        update_us.append((time.perf_counter() - t) * 1e6)
+        summaries[machine_id] = summary
+
+    report = {"hosts": args.hosts, "build_s": round(build_s, 4),
+              "update_us": percentiles(update_us), "queries": {}}
+    failures = []
+    for name, query in QUERIES.items():
+        expected = brute_force(summaries, **query)
+        got = index.find(**query)
+        if got != expected:
+            failures.append(name)
+        timings = []
+        for _ in range(args.iterations):
+            t = time.perf_counter()
+            index.find(**query)
+            timings.append((time.perf_counter() - t) * 1e6)
+        report["queries"][name] = {"matches": len(got), "latency_us": percentiles(timings)}
+
+    report["mismatches"] = failures
+    print(json.dumps(report, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
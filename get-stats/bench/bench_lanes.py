@@ -0,0 +1,192 @@
+"""
+Benchmark command-result latency on a link saturated with telemetry.
+
+Spawns the agent (fake nvidia-smi with many GPUs, mock Docker, no tunnel)
+and connects one dashboard through a TCP proxy that forwards agent-to-client
+bytes at --link-kbps, well below what usage_stats plus the top view need.
+Once the link is saturated the client sends run_container and
+list_containers every few seconds and records how long each result takes,
+how stale the top frames are when they arrive, and whether the connection
+survives the ping timeout.
+
+Runs once with AGENT_PRIORITY_LANES=0 (one FIFO queue per client, as
+before) and once with the lanes on.
+
+    python bench/bench_lanes.py --link-kbps 8 --gpus 96 --window 60
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+import socketio
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AGENT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, AGENT_DIR)
+
+from bench_connections import drain, wait_for_log  # noqa: E402
+from client import percentiles  # noqa: E402
+import fake_nvidia_smi  # noqa: E402
+from mock_docker import MockDockerServer  # noqa: E402
+
+CHUNK = 1024
+
+
+class ThrottledProxy:
+    """Forwards TCP to target; the target-to-client direction at a fixed rate"""
+
+    def __init__(self, target_port, bytes_per_second):
+        self.target_port = target_port
+        self.rate = bytes_per_second
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, client_reader, client_writer):
+        # A small receive window so the agent's socket, not this proxy, holds the backlog
+        upstream = socket.socket()
+        upstream.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        upstream.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(upstream, ("127.0.0.1", self.target_port))
+        reader, writer = await asyncio.open_connection(sock=upstream, limit=CHUNK)
+        with contextlib.suppress(asyncio.CancelledError):  # Proxy closed at the end of a run
+            await asyncio.gather(self.pipe(client_reader, writer, None),
+                                 self.pipe(reader, client_writer, self.rate), return_exceptions=True)
+
+    async def pipe(self, reader, writer, rate):
+        try:
+            while data := await reader.read(CHUNK):
+                writer.write(data)
+                await writer.drain()
+                if rate:
+                    await asyncio.sleep(len(data) / rate)
+        finally:
+            writer.close()
+
+    def close(self):
+        self.server.close()
+
+
+async def dashboard(url, args):
+    sio = socketio.AsyncClient(reconnection=False)
+    replies = {"container_result": asyncio.Queue(), "container_list": asyncio.Queue()}
+    staleness = []
+    counts = {"usage_stats": 0, "top": 0, "disconnected_at_s": None}
+    started = time.monotonic()
+    done = False
+
+    def on_top(data):
+        counts["top"] += 1
+        staleness.append((time.time() - data["timestamp"]) * 1000)
+
+    def on_usage(data):
+        counts["usage_stats"] += 1
+
+    def on_disconnect(*_):
+        if done:
+            return
+        counts["disconnected_at_s"] = round(time.monotonic() - started, 1)
+        for queue in replies.values():
+            queue.put_nowait(None)
+
+    for event, queue in replies.items():
+        sio.on(event, lambda data, queue=queue: queue.put_nowait(time.perf_counter()))
+    sio.on("top", on_top)
+    sio.on("usage_stats", on_usage)
+    sio.on("disconnect", on_disconnect)
+    await sio.connect(url, transports=["websocket"], wait_timeout=30)
+    await sio.emit("subscribe_top")
+    await asyncio.sleep(args.warmup)  # Let telemetry fill the link
+
+    rtts = {event: [] for event in replies}
+    unanswered = 0
+    deadline = time.monotonic() + args.window
+    n = 0
+    while time.monotonic() < deadline and counts["disconnected_at_s"] is None:
+        n += 1
+        for event, (command, payload) in {
+            "container_result": ("run_container", {"image": "nginx", "resource_limits": {},
+                                                   "container_name": f"lanes_{n}"}),
+            "container_list": ("list_containers", None),
+        }.items():
+            sent = time.perf_counter()
+            await sio.emit(command, payload)
+            try:
+                received = await asyncio.wait_for(replies[event].get(), max(1, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                received = None
+            if received is None:
+                unanswered += 1
+                break
+            rtts[event].append((received - sent) * 1000)
+        await asyncio.sleep(args.command_interval)
+    with_results = {f"{event}_ms": percentiles(values) for event, values in rtts.items()}
+    done = True
+    if sio.connected:
+        await sio.disconnect()
+    return dict(with_results, unanswered=unanswered, top_staleness_ms=percentiles(staleness), **counts)
+
+
+async def run_agent(args, mock, workdir, lanes_on):
+    env = dict(os.environ)
+    env["PATH"] = workdir + os.pathsep + env.get("PATH", "")
+    env["DOCKER_HOST"] = mock.base_url
+    env["AGENT_PUBLIC_URL"] = f"http://127.0.0.1:{args.port}"
+    env["AGENT_PORT"] = str(args.port)
+    env["AGENT_METER_LEDGER"] = os.path.join(workdir, "metering.jsonl")
+    env["AGENT_PRIORITY_LANES"] = "1" if lanes_on else "0"
+    env["FAKE_NVIDIA_SMI_GPUS"] = str(args.gpus)
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(AGENT_DIR, "get_stats.py"), "http://127.0.0.1:9/api/ngrok",
+        cwd=AGENT_DIR, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    proxy = ThrottledProxy(args.port, args.link_kbps * 1024)
+    try:
+        await wait_for_log(proc.stdout, "system_info_ready", 30)
+        drainer = asyncio.create_task(drain(proc.stdout))
+        proxy_port = await proxy.start()
+        result = await dashboard(f"http://127.0.0.1:{proxy_port}", args)
+        drainer.cancel()
+        return result
+    finally:
+        proxy.close()
+        proc.terminate()
+        await proc.wait()
+
+
+async def bench(args):
+    workdir = tempfile.mkdtemp(prefix="lanes-bench-")
+    fake_nvidia_smi.install_shim(workdir)
+    mock = MockDockerServer(os.path.join(workdir, "docker.sock")).start()
+    report = {"link_kbps": args.link_kbps, "gpus": args.gpus, "window_s": args.window}
+    try:
+        for name, lanes_on in (("single_queue", False), ("priority_lanes", True)):
+            mock.docker.reset()
+            report[name] = await run_agent(args, mock, workdir, lanes_on)
+    finally:
+        mock.stop()
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Command-result latency under telemetry saturation")
+    parser.add_argument("--link-kbps", type=float, default=8, help="KiB/s from the agent to the client")
+    parser.add_argument("--gpus", type=int, default=96)
+    parser.add_argument("--warmup", type=float, default=10)
+    parser.add_argument("--window", type=float, default=60)
+    parser.add_argument("--command-interval", type=float, default=3)
+    parser.add_argument("--port", type=int, default=18790)
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(bench(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,335 @@
+"""
+Benchmark rental metering: accuracy, tick cost, ledger writes and reports.
+
+accuracy   Containers in a fake cgroup tree (v2 and v1 layouts) burn CPU and
+           change memory in 0.1 s steps while the meter reads them at jittered
+           2 s ticks; one container restarts (its counter resets) and one
+           stops half way. Metered totals are compared with the exact ones.
+tick       Time per tick for read_container-style cgroup reads plus
+           Meter.tick() with --containers containers.
+ledger     --hours of simulated metering written with group commit (one
+           write and fsync per commit interval) against one fsync per record.
+report     Window queries answered from the in-memory checkpoints against
+           rescanning the ledger file for the same answer, plus the time to
+           replay the ledger at startup.
+retention  Half the containers stop a quarter of the way through --hours;
+           after Meter.evict() and Ledger.compact() with a retention of half
+           of --hours, the memory and ledger kept, and window reports inside
+           the retention (up to the last committed record) from the live
+           meter and the compacted ledger against the full ledger.
+
+    python bench/bench_metering.py --containers 50 --hours 24
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from client import percentiles  # noqa: E402
+from fake_cgroup import FakeCgroup  # noqa: E402
+import metering  # noqa: E402
+
+INTERVAL = 2.0
+STEP = 0.1
+
+
+def container_ids(rng, count):
+    return ["%064x" % rng.getrandbits(256) for _ in range(count)]
+
+
+def bench_accuracy(workdir, v2, args):
+    rng = random.Random(args.seed)
+    fake = FakeCgroup(os.path.join(workdir, f"cgroup-v{2 if v2 else 1}"), v2=v2)
+    reader = metering.CgroupReader(fake.root)
+    meter = metering.Meter(metering.Ledger(os.path.join(workdir, "accuracy.jsonl")), record_interval=60,
+                           max_gap=5 * INTERVAL)
+    ids = container_ids(rng, 8)
+    truth = {}
+    for i, container_id in enumerate(ids):
+        fake.add(container_id, memory=rng.randint(1, 16) << 30)
+        truth[container_id] = {"cpu": 0.0, "memory": 0.0, "gpus": i % 3, "load": rng.uniform(0.05, 4)}
+    restarted, stopped = ids[0], ids[1]
+
+    duration = args.accuracy_seconds
+    now, next_tick, last_tick = 0.0, 0.0, None
+    at_first_tick = None
+    while now < duration:
+        for container_id in list(fake.containers):
+            state = truth[container_id]
+            if container_id == stopped and now >= duration / 2:
+                fake.remove(container_id)
+                continue
+            cpu = state["load"] * STEP * rng.uniform(0.5, 1.5)
+            memory = max(64 << 20, fake.containers[container_id][1] + rng.randint(-64, 64) * (1 << 20))
+            state["cpu"] += cpu
+            state["memory"] += (fake.containers[container_id][1] + memory) / 2 * STEP
+            fake.advance(container_id, cpu, memory)
+            if container_id == restarted and abs(now - duration / 3) < STEP / 2:
+                fake.containers[container_id][0] = 0.0  # Restart: new cgroup, counter from zero
+        now = round(now + STEP, 6)
+        if now >= next_tick:
+            readings = {}
+            for container_id in fake.containers:
+                cpu, memory = reader.read(container_id)
+                readings[container_id] = (container_id[:12], cpu, memory, truth[container_id]["gpus"], None)
+            meter.tick(readings, now)
+            last_tick = now
+            at_last_tick = {cid: (state["cpu"], state["memory"]) for cid, state in truth.items()}
+            if at_first_tick is None:
+                at_first_tick = at_last_tick
+            next_tick = now + INTERVAL + rng.uniform(-0.2, 0.4)  # Sampler jitter
+
+    errors = {"cpu": [], "memory": [], "gpu": [], "cpu_restarted": [], "cpu_stopped": [], "memory_stopped": []}
+    first_tick = meter.usage[ids[0]].first_seen
+    for container_id in ids:
+        usage = meter.usage[container_id]
+        # The meter starts at its first reading; compare against the truth over the metered span
+        end = usage.last_seen if container_id == stopped else last_tick
+        cpu_truth = at_last_tick[container_id][0] - at_first_tick[container_id][0]
+        memory_truth = at_last_tick[container_id][1] - at_first_tick[container_id][1]
+        gpu_truth = truth[container_id]["gpus"] * (end - first_tick)
+        # Usage between a container's last reading and its restart or exit is never observed
+        suffix = "_restarted" if container_id == restarted else "_stopped" if container_id == stopped else ""
+        errors["cpu" + suffix].append(abs(usage.cpu_seconds - cpu_truth) / cpu_truth)
+        errors["memory" + ("_stopped" if suffix == "_stopped" else "")].append(
+            abs(usage.memory_byte_seconds - memory_truth) / memory_truth)
+        if gpu_truth:
+            errors["gpu"].append(abs(usage.gpu_seconds - gpu_truth) / gpu_truth)
+    return {name: f"{100 * max(values):.2f} % max error" for name, values in errors.items()}
+
+
+def bench_tick(workdir, args):
+    rng = random.Random(args.seed)
+    fake = FakeCgroup(os.path.join(workdir, "cgroup-tick"))
+    reader = metering.CgroupReader(fake.root)
+    meter = metering.Meter(metering.Ledger(os.path.join(workdir, "tick.jsonl")))
+    ids = container_ids(rng, args.containers)
+    for container_id in ids:
+        fake.add(container_id)
+    timings = []
+    for tick in range(args.ticks):
+        for container_id in ids:
+            fake.advance(container_id, rng.uniform(0, 2), rng.randint(1, 8) << 30)
+        start = time.perf_counter()
+        readings = {}
+        for container_id in ids:
+            cpu, memory = reader.read(container_id)
+            readings[container_id] = (container_id[:12], cpu, memory, 1, None)
+        meter.tick(readings, tick * INTERVAL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"containers": args.containers, "tick_ms": percentiles(timings)}
+
+
+def simulate(meter, ids, args, on_tick=None):
+    """Feed --hours of synthetic readings into the meter; returns the simulated end time"""
+    rng = random.Random(args.seed)
+    counters = dict.fromkeys(ids, 0.0)
+    start = 1.7e9
+    now = start
+    for _ in range(int(args.hours * 3600 / INTERVAL)):
+        now += INTERVAL
+        readings = {}
+        for container_id in ids:
+            counters[container_id] += rng.uniform(0, 2 * INTERVAL)
+            readings[container_id] = (container_id[:12], counters[container_id], rng.randint(1, 8) << 30, 1, None)
+        meter.tick(readings, now)
+        if on_tick:
+            on_tick(now)
+    return start, now
+
+
+def bench_ledger(workdir, args):
+    ids = container_ids(random.Random(args.seed), args.containers)
+    commit_every = int(args.commit_interval / INTERVAL)
+
+    path = os.path.join(workdir, "group.jsonl")
+    ledger = metering.Ledger(path)
+    meter = metering.Meter(ledger, record_interval=args.record_interval)
+    ticks = [0]
+    commit_ms = []
+
+    def on_tick(now):
+        ticks[0] += 1
+        if ticks[0] % commit_every == 0:
+            start = time.perf_counter()
+            if ledger.commit():
+                commit_ms.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    begin, end = simulate(meter, ids, args, on_tick)
+    ledger.commit()
+    group_s = time.perf_counter() - started
+
+    # The same records, one write and fsync each
+    with open(path) as f:
+        lines = f.read().splitlines()
+    single_path = os.path.join(workdir, "single.jsonl")
+    started = time.perf_counter()
+    with open(single_path, "a") as f:
+        for line in lines:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    single_s = time.perf_counter() - started
+
+    return meter, ledger, (begin, end), {
+        "containers": args.containers,
+        "simulated_hours": args.hours,
+        "records": ledger.records_written,
+        "ledger_bytes": os.path.getsize(path),
+        "group_commit": {"fsyncs": ledger.commits, "commit_ms": percentiles(commit_ms),
+                         "wall_s_including_metering": round(group_s, 2)},
+        "fsync_per_record": {"fsyncs": len(lines), "wall_s": round(single_s, 2)},
+    }
+
+
+def rescan_report(path, container_id, start, end):
+    """What a report costs without checkpoints: parse the ledger, keep the last record before each bound"""
+    before = after = None
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record["container_id"] != container_id:
+                continue
+            if record["t"] <= start:
+                before = record
+            if record["t"] <= end:
+                after = record
+    if after is None:
+        return 0.0
+    return after["cpu_seconds"] - (before["cpu_seconds"] if before else 0.0)
+
+
+def bench_report(meter, ledger, span, args):
+    rng = random.Random(args.seed)
+    begin, end = span
+    ids = list(meter.usage)
+    index_ms, rescan_ms = [], []
+    mismatches = 0
+    for _ in range(args.queries):
+        container_id = rng.choice(ids)
+        start = rng.uniform(begin, end)
+        stop = rng.uniform(start, end)
+        t0 = time.perf_counter()
+        row, = meter.report(container_id, start, stop)
+        index_ms.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        expected = rescan_report(ledger.path, container_id, start, stop)
+        rescan_ms.append((time.perf_counter() - t0) * 1000)
+        if stop < meter.usage[container_id].last_seen and abs(row["cpu_seconds"] - expected) > 0.01:
+            mismatches += 1
+
+    t0 = time.perf_counter()
+    all_rows = meter.report(start=begin, end=end)
+    all_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    restored = metering.Meter(metering.Ledger(ledger.path))
+    restored.restore(restored.ledger.replay())
+    replay_s = time.perf_counter() - t0
+    return {
+        "queries": args.queries,
+        "window_query_ms": percentiles(index_ms),
+        "ledger_rescan_ms": percentiles(rescan_ms),
+        "all_containers_report_ms": round(all_ms, 3),
+        "rows": len(all_rows),
+        "startup_replay_s": round(replay_s, 3),
+        "mismatches": mismatches,
+    }
+
+
+def bench_retention(workdir, args):
+    rng = random.Random(args.seed)
+    ids = container_ids(rng, args.containers)
+    stopping = set(ids[::2])
+    retention = args.hours * 3600 / 2
+    path = os.path.join(workdir, "retention.jsonl")
+    ledger = metering.Ledger(path)
+    meter = metering.Meter(ledger, record_interval=args.record_interval, retention=retention)
+    counters = dict.fromkeys(ids, 0.0)
+    begin = now = 1.7e9
+    ticks = int(args.hours * 3600 / INTERVAL)
+    for tick in range(ticks):
+        now += INTERVAL
+        readings = {}
+        for container_id in ids:
+            if container_id in stopping and tick >= ticks // 4:
+                continue
+            counters[container_id] += rng.uniform(0, 2 * INTERVAL)
+            readings[container_id] = (container_id[:12], counters[container_id], rng.randint(1, 8) << 30, 1, None)
+        meter.tick(readings, now)
+    ledger.commit()
+    full = metering.Meter(metering.Ledger(path))
+    full.restore(full.ledger.replay())
+    checkpoints_before = sum(len(usage.times) for usage in meter.usage.values())
+
+    t0 = time.perf_counter()
+    evicted = meter.evict(now)
+    before, after = ledger.compact(set(meter.usage), now - retention)
+    compact_s = time.perf_counter() - t0
+    compacted = metering.Meter(metering.Ledger(path))
+    compacted.restore(compacted.ledger.replay())
+
+    # The restored meters only know what was recorded; the live one has also
+    # seen the ticks since, so windows end at the last committed record
+    last = ledger.committed_t
+    mismatches = 0
+    for _ in range(args.queries):
+        start = rng.uniform(now - retention, last)
+        stop = rng.uniform(start, last)
+        expected = {row["container_id"]: row["cpu_seconds"] for row in full.report(start=start, end=stop)}
+        for rows in (meter.report(start=start, end=stop), compacted.report(start=start, end=stop)):
+            got = {row["container_id"]: row["cpu_seconds"] for row in rows}
+            if got.keys() != expected.keys() or any(abs(got[key] - expected[key]) > 0.01 for key in got):
+                mismatches += 1
+    wrong_eviction = len(stopping & set(meter.usage)) + len(set(ids) - stopping - set(meter.usage))
+    return {
+        "containers": args.containers,
+        "evicted": evicted,
+        "wrong_eviction": wrong_eviction,
+        "checkpoints": {"before": checkpoints_before,
+                        "after": sum(len(usage.times) for usage in meter.usage.values())},
+        "ledger_records": {"before": before, "after": after},
+        "ledger_bytes_after": os.path.getsize(path),
+        "evict_and_compact_s": round(compact_s, 3),
+        "span_hours": round((now - begin) / 3600, 2),
+        "mismatches": mismatches,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark per-container metering and its ledger")
+    parser.add_argument("--containers", type=int, default=50)
+    parser.add_argument("--hours", type=float, default=24, help="Simulated metering for the ledger benchmark")
+    parser.add_argument("--ticks", type=int, default=200, help="Ticks for the tick-cost benchmark")
+    parser.add_argument("--accuracy-seconds", type=float, default=600)
+    parser.add_argument("--record-interval", type=float, default=60)
+    parser.add_argument("--commit-interval", type=float, default=5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="metering-bench-")
+    report = {
+        "accuracy_cgroup_v2": bench_accuracy(workdir, True, args),
+        "accuracy_cgroup_v1": bench_accuracy(workdir, False, args),
+        "tick": bench_tick(workdir, args),
+    }
+    meter, ledger, span, report["ledger"] = bench_ledger(workdir, args)
+    report["report"] = bench_report(meter, ledger, span, args)
+    report["retention"] = bench_retention(workdir, args)
+    print(json.dumps(report, indent=2))
+    failed = report["report"]["mismatches"] or report["retention"]["mismatches"] or \
+        report["retention"]["wrong_eviction"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
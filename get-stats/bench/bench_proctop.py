@@ -0,0 +1,166 @@
+"""
+Benchmark the top-N process view on a host with thousands of processes.
+
+Builds a fake /proc with --processes PIDs (a share of them inside
+containers), then runs refresh ticks with churn between them: some
+processes burn CPU, some exit and new ones start. Each tick is timed for
+proctop.ProcessTable (incremental, one stat read per PID) and for the
+approach it replaces, which builds new psutil.Process objects every tick
+(psutil.PROCFS_PATH pointed at the fake tree) and reads each cgroup file.
+The top-N lists from both are cross-checked on every tick.
+
+    python bench/bench_proctop.py --processes 5000
+    python bench/bench_proctop.py --proc-root /proc   # time the real host only
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import psutil
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from client import percentiles  # noqa: E402
+from fake_proc import FakeProc  # noqa: E402
+import proctop  # noqa: E402
+
+
+class RecreatingTop:
+    """The per-tick psutil.Process approach, kept for comparison"""
+
+    def __init__(self, proc_root):
+        psutil.PROCFS_PATH = proc_root
+        self.proc_root = proc_root
+        self.previous = {}  # (pid, create_time) -> cpu seconds
+
+    def refresh(self, elapsed):
+        rows = []
+        current = {}
+        for pid in psutil.pids():
+            try:
+                process = psutil.Process(pid)
+                times = process.cpu_times()
+                rss = process.memory_info().rss
+                key = (pid, process.create_time())
+            except psutil.Error:
+                continue
+            with open(f"{self.proc_root}/{pid}/cgroup", "rb") as f:
+                container_id = proctop.container_id_from_cgroup(f.read())
+            cpu = times.user + times.system
+            before = self.previous.get(key)
+            current[key] = cpu
+            cpu_percent = round((cpu - before) / elapsed * 100, 1) if before is not None and elapsed else 0.0
+            rows.append((pid, process.name(), cpu_percent, rss, container_id))
+        self.previous = current
+        return rows
+
+
+def churn(fake, rng, args, next_pid, containers):
+    pids = list(fake.processes)
+    for pid in rng.sample(pids, max(1, int(len(pids) * args.busy))):
+        fake.advance(pid, utime=rng.randint(1, 2 * proctop.CLK_TCK), stime=rng.randint(0, 20),
+                     rss_pages=rng.randint(256, 1 << 20))
+    for pid in rng.sample(pids, args.exits):
+        fake.remove(pid)
+    for _ in range(args.exits):
+        fake.add(next_pid, f"worker-{next_pid}", rss_pages=rng.randint(256, 65536),
+                 container_id=rng.choice(containers) if rng.random() < args.containerized else None)
+        next_pid += 1
+    return next_pid
+
+
+def bench_real(args):
+    table = proctop.ProcessTable(args.proc_root)
+    table.refresh()
+    timings = []
+    for _ in range(args.ticks):
+        time.sleep(args.interval)
+        start = time.perf_counter()
+        table.refresh()
+        table.top(args.top, "cpu_percent")
+        table.top(args.top, "rss_bytes")
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"proc_root": args.proc_root, "processes": len(table.records), "refresh_ms": percentiles(timings)}
+
+
+def bench_fake(args):
+    rng = random.Random(args.seed)
+    root = os.path.join(tempfile.mkdtemp(prefix="fake-proc-"), "proc")
+    fake = FakeProc(root)
+    containers = ["%064x" % rng.getrandbits(256) for _ in range(args.containers)]
+    for pid in range(1, args.processes + 1):
+        in_container = rng.random() < args.containerized
+        fake.add(pid, f"proc-{pid}", utime=rng.randint(0, 10 ** 6), rss_pages=rng.randint(256, 65536),
+                 container_id=rng.choice(containers) if in_container else None, cgroup_v1=pid % 2 == 0)
+    next_pid = args.processes + 1
+
+    table = proctop.ProcessTable(root)
+    baseline = RecreatingTop(root)
+    last = time.monotonic()
+    table.refresh(now=last)
+    baseline.refresh(0)
+
+    incremental_ms, recreate_ms = [], []
+    mismatches = 0
+    for _ in range(args.ticks):
+        next_pid = churn(fake, rng, args, next_pid, containers)
+        now = last + args.interval  # Same simulated interval for both
+        last = now
+
+        start = time.perf_counter()
+        table.refresh(now=now)
+        top_cpu = table.top(args.top, "cpu_percent")
+        top_rss = table.top(args.top, "rss_bytes")
+        table.containers()
+        incremental_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        rows = baseline.refresh(args.interval)
+        expected_cpu = heapq.nlargest(args.top, rows, key=lambda r: r[2])
+        expected_rss = heapq.nlargest(args.top, rows, key=lambda r: r[3])
+        recreate_ms.append((time.perf_counter() - start) * 1000)
+
+        if ([r.cpu_percent for r in top_cpu] != [r[2] for r in expected_cpu]
+                or [r.rss_bytes for r in top_rss] != [r[3] for r in expected_rss]):
+            mismatches += 1
+
+    return {
+        "processes": len(fake.processes),
+        "containers": args.containers,
+        "ticks": args.ticks,
+        "incremental_refresh_ms": percentiles(incremental_ms),
+        "psutil_recreate_refresh_ms": percentiles(recreate_ms),
+        "speedup_p50": round(percentiles(recreate_ms)["p50"] / percentiles(incremental_ms)["p50"], 2),
+        "stat_reads": table.stat_reads,
+        "cgroup_reads": table.cgroup_reads,
+        "mismatched_ticks": mismatches,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the incremental process table")
+    parser.add_argument("--processes", type=int, default=5000)
+    parser.add_argument("--containers", type=int, default=40)
+    parser.add_argument("--containerized", type=float, default=0.6, help="Share of processes in a container")
+    parser.add_argument("--busy", type=float, default=0.05, help="Share of processes using CPU each tick")
+    parser.add_argument("--exits", type=int, default=20, help="Processes replaced each tick")
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between ticks")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--proc-root", help="Benchmark an existing procfs (e.g. /proc) instead of a fake one")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    report = bench_real(args) if args.proc_root else bench_fake(args)
+    print(json.dumps(report, indent=2))
+    return 1 if report.get("mismatched_ticks") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
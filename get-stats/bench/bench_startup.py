@@ -0,0 +1,133 @@
+"""
+Benchmark agent cold start: process spawn to listening, and to registered.
+
+Each trial launches `python get_stats.py <registration URL>` as a fresh
+process against the fake nvidia-smi and the mock Docker Engine, with
+AGENT_PUBLIC_URL set so no ngrok tunnel is opened. The agent's JSON log
+lines give the wall-clock time of "listening" (the Socket.IO port is
+bound) and "registration_sent" (the control plane acknowledged the URL);
+a local endpoint stands in for the control plane.
+
+    python bench/bench_startup.py --trials 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AGENT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, AGENT_DIR)
+
+import fake_nvidia_smi  # noqa: E402
+from client import percentiles  # noqa: E402
+from mock_docker import MockDockerServer  # noqa: E402
+
+MILESTONES = ("listening", "registration_sent", "docker_connected", "system_info_ready")
+
+
+async def start_registration_endpoint(port):
+    """Stand-in for the control plane's /api/ngrok"""
+    received = []
+
+    async def register(request):
+        received.append((time.time(), await request.json()))
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_post("/api/ngrok", register)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, received
+
+
+async def run_trial(env, registration_url, timeout):
+    """Spawn one agent and return seconds from spawn to each milestone"""
+    spawned = time.time()
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(AGENT_DIR, "get_stats.py"), registration_url,
+        cwd=AGENT_DIR, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    seen = {}
+    try:
+        deadline = time.monotonic() + timeout
+        while not all(m in seen for m in MILESTONES):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                line = await asyncio.wait_for(proc.stdout.readline(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not line:
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("event") in MILESTONES and record["event"] not in seen:
+                seen[record["event"]] = record["ts"] - spawned
+    finally:
+        proc.terminate()
+        await proc.wait()
+    return seen
+
+
+async def bench(args):
+    workdir = tempfile.mkdtemp(prefix="agent-startup-")
+    fake_nvidia_smi.install_shim(workdir)
+    mock = MockDockerServer(os.path.join(workdir, "docker.sock")).start()
+    mock.docker.reset(containers=3)
+    runner, received = await start_registration_endpoint(args.registration_port)
+
+    env = dict(os.environ)
+    env["PATH"] = workdir + os.pathsep + env.get("PATH", "")
+    env["DOCKER_HOST"] = mock.base_url
+    env["AGENT_PUBLIC_URL"] = f"http://127.0.0.1:{args.port}"
+    env["AGENT_PORT"] = str(args.port)
+    env["AGENT_METER_LEDGER"] = os.path.join(workdir, "metering.jsonl")
+    registration_url = f"http://127.0.0.1:{args.registration_port}/api/ngrok"
+
+    results = {m: [] for m in MILESTONES}
+    missing = 0
+    try:
+        for _ in range(args.trials):
+            seen = await run_trial(env, registration_url, args.timeout)
+            missing += len(MILESTONES) - len(seen)
+            for milestone, seconds in seen.items():
+                results[milestone].append(seconds * 1000)
+    finally:
+        await runner.cleanup()
+        mock.stop()
+
+    return {
+        "trials": args.trials,
+        "time_to_listening_ms": percentiles(results["listening"]),
+        "time_to_registered_ms": percentiles(results["registration_sent"]),
+        "time_to_docker_ms": percentiles(results["docker_connected"]),
+        "time_to_system_info_ms": percentiles(results["system_info_ready"]),
+        "registrations_received": len(received),
+        "missing_milestones": missing,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark agent cold start")
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument("--port", type=int, default=18765, help="Port the agent under test listens on")
+    parser.add_argument("--registration-port", type=int, default=18780)
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for each trial")
+    args = parser.parse_args(argv)
+    report = asyncio.run(bench(args))
+    print(json.dumps(report, indent=2))
+    return 1 if report["missing_milestones"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,100 @@
+"""
+Benchmark topology discovery and NUMA-local CPU pinning.
+
+Builds a fake sysfs for a two-socket host (--cores-per-socket cores with two
+threads each, --gpus GPUs split over the sockets) and runs the agent's own
+run_docker_container against the mock Docker daemon, one rental per GPU
+with --cpus CPUs, first with CPU_PINNING off (a CFS quota only, so the
+renter's threads may run on any CPU) and then on. Reported:
+
+locality   share of each rental's allowed CPUs that sit on its GPU's NUMA
+           node, and how many rentals share a physical core with another
+           (both before and after pinning)
+latency    run_container time with and without the pinning step, and the
+           time to read the topology and to allocate one cpuset
+
+    python bench/bench_topology.py --gpus 8 --cpus 6
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from client import percentiles  # noqa: E402
+from fake_sysfs import FakeSysfs  # noqa: E402
+import fake_nvidia_smi  # noqa: E402
+from mock_docker import MockDockerServer  # noqa: E402
+import reservations  # noqa: E402
+import topology  # noqa: E402
+
+
+def rentals(get_stats, mock, sysfs, args, pinning):
+    mock.docker.reset()
+    get_stats.CPU_PINNING = pinning
+    get_stats.reservation_book.reservations.clear()
+    host = get_stats.load_topology()
+    times, local, shared_cores = [], [], 0
+    core_of = {cpu: siblings for _, _, siblings in host.cores for cpu in siblings}
+    used_cores = {}
+    for gpu in range(args.gpus):
+        started = time.perf_counter()
+        result = get_stats.run_docker_container("nginx", {"cpu_count": args.cpus, "memory": "1g", "gpu_count": 1,
+                                                          "gpu_devices": [str(gpu)]}, f"rental_{gpu}")
+        times.append((time.perf_counter() - started) * 1000)
+        assert result["success"], result
+        cpuset = mock.docker.containers[result["container"]["id"]]["HostConfig"].get("CpusetCpus")
+        allowed = reservations.parse_cpuset(cpuset) if cpuset else host.cpus
+        node_cpus = host.nodes[sysfs.gpu_nodes[gpu]]["cpus"]
+        local.append(len(allowed & node_cpus) / len(allowed))
+        cores = {core_of[cpu] for cpu in allowed}
+        if any(core in used_cores for core in cores):
+            shared_cores += 1
+        used_cores.update(dict.fromkeys(cores, gpu))
+    return {"run_ms": percentiles(times), "gpu_local_cpu_share": percentiles([100 * share for share in local]),
+            "rentals_sharing_a_core": shared_cores}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Topology discovery and NUMA-local CPU pinning")
+    parser.add_argument("--gpus", type=int, default=8)
+    parser.add_argument("--cores-per-socket", type=int, default=16)
+    parser.add_argument("--cpus", type=int, default=6, help="CPUs per rental")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="topology-bench-")
+    sysfs = FakeSysfs(os.path.join(workdir, "sys"), cores_per_socket=args.cores_per_socket, gpus=args.gpus)
+    fake_nvidia_smi.install_shim(workdir)
+    os.environ["PATH"] = workdir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_NVIDIA_SMI_GPUS"] = str(args.gpus)
+    mock = MockDockerServer(os.path.join(workdir, "docker.sock")).start()
+    os.environ["DOCKER_HOST"] = mock.base_url
+    os.environ["AGENT_SYSFS_ROOT"] = sysfs.root
+    os.environ["AGENT_METER_LEDGER"] = os.path.join(workdir, "metering.jsonl")
+    os.environ["AGENT_MEMORY_OVERCOMMIT"] = "100"  # The fake host's memory, not this machine's, is the limit
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import get_stats
+
+    started = time.perf_counter()
+    host = get_stats.load_topology()
+    report = {"topology_read_ms": round((time.perf_counter() - started) * 1000, 2), "topology": host.as_dict()}
+    allocations = []
+    for _ in range(200):
+        started = time.perf_counter()
+        topology.allocate_cpuset(host, args.cpus, ["0"], frozenset(range(0, len(host.cpus), 3)))
+        allocations.append((time.perf_counter() - started) * 1000)
+    report["allocate_ms"] = percentiles(allocations)
+    report["quota_only"] = rentals(get_stats, mock, sysfs, args, False)
+    report["pinned"] = rentals(get_stats, mock, sysfs, args, True)
+    mock.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
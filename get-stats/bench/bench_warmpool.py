@@ -0,0 +1,115 @@
+"""
+Benchmark rental start latency with and without the warm pool.
+
+Runs the agent in-process against the mock Docker daemon, with per-call
+daemon costs standing in for a real daemon (defaults are assumptions:
+create 150 ms, start 400 ms for network setup plus the entrypoint, pause
+and unpause 20 ms, update 10 ms, rename 5 ms). One client sends
+run_container every --interval seconds and records the time to the
+acknowledged result, first with the pool switched off (containers.run,
+i.e. create + start) and then with a pool of --pool-size paused
+containers for the requested image.
+
+    python bench/bench_warmpool.py --starts 20 --pool-size 4 --interval 1
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import socketio
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from client import percentiles  # noqa: E402
+import fake_nvidia_smi  # noqa: E402
+from mock_docker import MockDockerServer  # noqa: E402
+
+IMAGE = "pytorch/pytorch:latest"
+LIMITS = {"cpu_count": 2, "memory": "4g"}
+
+
+async def start_rentals(url, args, label):
+    sio = socketio.AsyncClient(reconnection=False)
+    await sio.connect(url, transports=["websocket"], wait_timeout=10)
+    rtts, warm, failed = [], 0, 0
+    for n in range(args.starts):
+        sent = time.perf_counter()
+        result = await sio.call("run_container", {"image": IMAGE, "resource_limits": LIMITS,
+                                                  "container_name": f"{label}_{n}",
+                                                  "request_id": str(uuid.uuid4())}, timeout=60)
+        rtts.append((time.perf_counter() - sent) * 1000)
+        if not result.get("success"):
+            failed += 1
+        elif result["container"]["warm"]:
+            warm += 1
+        await asyncio.sleep(max(0, args.interval - (time.perf_counter() - sent)))
+    await sio.disconnect()
+    return {"start_ms": percentiles(rtts), "warm_starts": warm, "failed": failed}
+
+
+async def wait_for_pool(pool, size, timeout=60):
+    deadline = time.monotonic() + timeout
+    while pool.stats()["waiting"]["bench"] < size and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+
+async def run(get_stats, mock, args):
+    pool = get_stats.warm_pool
+    url = f"http://127.0.0.1:{args.port}"
+    asyncio.create_task(get_stats.main(host="127.0.0.1", port=args.port))
+    await asyncio.sleep(1)
+    report = {"daemon_latency_s": mock.docker.latencies, "pool_size": args.pool_size,
+              "interval_s": args.interval, "starts": args.starts}
+
+    get_stats.control_scheduler.rate = math.inf  # One client starting rentals back to back is not abuse
+
+    pool.match = lambda image, resource_limits: None  # Cold: what run_container did before
+    report["cold"] = await start_rentals(url, args, "cold")
+
+    del pool.match
+    await wait_for_pool(pool, args.pool_size)
+    report["warm_pool"] = await start_rentals(url, args, "warm")
+    report["warm_pool"]["pool"] = pool.stats()
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Rental start latency with and without the warm pool")
+    parser.add_argument("--starts", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=1, help="Seconds between run_container requests")
+    parser.add_argument("--create", type=float, default=0.15)
+    parser.add_argument("--start", type=float, default=0.4)
+    parser.add_argument("--port", type=int, default=18800)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="warmpool-bench-")
+    fake_nvidia_smi.install_shim(workdir)
+    os.environ["PATH"] = workdir + os.pathsep + os.environ.get("PATH", "")
+    latencies = {"create": args.create, "start": args.start, "pause": 0.02, "unpause": 0.02,
+                 "update": 0.01, "rename": 0.005, "stop": 0.3}
+    mock = MockDockerServer(os.path.join(workdir, "docker.sock"), latencies=latencies).start()
+    os.environ["DOCKER_HOST"] = mock.base_url
+    os.environ["AGENT_PUBLIC_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["AGENT_METER_LEDGER"] = os.path.join(workdir, "metering.jsonl")
+    os.environ["AGENT_WARM_POOL"] = json.dumps([{"name": "bench", "image": IMAGE, "size": args.pool_size}])
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import get_stats
+    get_stats.SERVER_NOTIFICATION_URL = "http://127.0.0.1:9/unused"
+
+    report = asyncio.run(run(get_stats, mock, args))
+    print(json.dumps(report, indent=2))
+    os._exit(0)  # The agent's background tasks need not finish
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,99 @@
+"""
+A fake cgroup filesystem for benchmarks.
+
+Writes the files metering.CgroupReader reads for a container, in the
+cgroup v2 layout (system.slice/docker-<id>.scope/cpu.stat and
+memory.current) or the v1 one (cpuacct/docker/<id>/cpuacct.usage and
+memory/docker/<id>/memory.usage_in_bytes). Containers can use CPU, change
+their memory and go away. set_io() adds the block I/O and pids files
+(io.stat, io.pressure and pids.* on v2; blkio.throttle.* and the pids
+controller on v1). Point the agent at it with AGENT_CGROUP_ROOT.
+"""
+import os
+import shutil
+
+
+class FakeCgroup:
+    def __init__(self, root, v2=True):
+        self.root = root
+        self.v2 = v2
+        self.containers = {}  # container id -> [cpu seconds, memory bytes]
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        if v2:
+            with open(os.path.join(root, "cgroup.controllers"), "w") as f:
+                f.write("cpuset cpu io memory pids\n")
+
+    def _dirs(self, container_id):
+        if self.v2:
+            directory = os.path.join(self.root, "system.slice", f"docker-{container_id}.scope")
+            return directory, directory
+        return (os.path.join(self.root, "cpuacct", "docker", container_id),
+                os.path.join(self.root, "memory", "docker", container_id))
+
+    def add(self, container_id, memory=64 << 20):
+        for directory in self._dirs(container_id):
+            os.makedirs(directory, exist_ok=True)
+        self.containers[container_id] = [0.0, memory]
+        self._write(container_id)
+
+    def advance(self, container_id, cpu_seconds=0.0, memory=None):
+        state = self.containers[container_id]
+        state[0] += cpu_seconds
+        if memory is not None:
+            state[1] = memory
+        self._write(container_id)
+
+    def remove(self, container_id):
+        self.containers.pop(container_id, None)
+        for directory in self._dirs(container_id) + self._io_dirs(container_id):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _io_dirs(self, container_id):
+        if self.v2:
+            return self._dirs(container_id)
+        return (os.path.join(self.root, "blkio", "docker", container_id),
+                os.path.join(self.root, "pids", "docker", container_id))
+
+    def set_io(self, container_id, read_bytes=0, write_bytes=0, reads=0, writes=0, stall_seconds=0.0,
+               pids=1, pids_max=None, pids_limit_hits=0, device="259:0"):
+        """Write cumulative I/O counters and the PID count for a container"""
+        io_dir, pids_dir = self._io_dirs(container_id)
+        os.makedirs(io_dir, exist_ok=True)
+        os.makedirs(pids_dir, exist_ok=True)
+        if self.v2:
+            with open(os.path.join(io_dir, "io.stat"), "w") as f:
+                f.write(f"{device} rbytes={read_bytes} wbytes={write_bytes} rios={reads} wios={writes} "
+                        "dbytes=0 dios=0\n")
+            usec = int(stall_seconds * 1e6)
+            with open(os.path.join(io_dir, "io.pressure"), "w") as f:
+                f.write(f"some avg10=0.00 avg60=0.00 avg300=0.00 total={usec * 2}\n"
+                        f"full avg10=0.00 avg60=0.00 avg300=0.00 total={usec}\n")
+        else:
+            for name, read, write in (("blkio.throttle.io_service_bytes_recursive", read_bytes, write_bytes),
+                                      ("blkio.throttle.io_serviced_recursive", reads, writes)):
+                with open(os.path.join(io_dir, name), "w") as f:
+                    f.write(f"{device} Read {read}\n{device} Write {write}\n{device} Sync 0\n{device} Async 0\n"
+                            f"{device} Total {read + write}\nTotal {read + write}\n")
+        with open(os.path.join(pids_dir, "pids.current"), "w") as f:
+            f.write(f"{pids}\n")
+        with open(os.path.join(pids_dir, "pids.max"), "w") as f:
+            f.write(f"{'max' if pids_max is None else pids_max}\n")
+        with open(os.path.join(pids_dir, "pids.events"), "w") as f:
+            f.write(f"max {pids_limit_hits}\n")
+
+    def _write(self, container_id):
+        cpu, memory = self.containers[container_id]
+        cpu_dir, memory_dir = self._dirs(container_id)
+        if self.v2:
+            usec = int(cpu * 1e6)
+            with open(os.path.join(cpu_dir, "cpu.stat"), "w") as f:
+                f.write(f"usage_usec {usec}\nuser_usec {usec * 4 // 5}\nsystem_usec {usec // 5}\n"
+                        "nr_periods 0\nnr_throttled 0\nthrottled_usec 0\n")
+            with open(os.path.join(memory_dir, "memory.current"), "w") as f:
+                f.write(f"{memory}\n")
+        else:
+            with open(os.path.join(cpu_dir, "cpuacct.usage"), "w") as f:
+                f.write(f"{int(cpu * 1e9)}\n")
+            with open(os.path.join(memory_dir, "memory.usage_in_bytes"), "w") as f:
+                f.write(f"{memory}\n")
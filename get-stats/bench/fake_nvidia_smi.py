@@ -0,0 +1,120 @@
+"""
+Stand-in for nvidia-smi on machines without an NVIDIA GPU.
+
+Answers --query-gpu=... with deterministic values for a configurable number
+of GPUs, honouring the csv/noheader/nounits format flags, which covers both
+the agent's own queries and GPUtil's. --query-compute-apps=... lists the
+processes in a JSON file, re-read on every call so a benchmark can start
+and stop GPU processes; as on a real GPU, each of them also adds its memory
+plus a CUDA context to its GPU's memory.used. Use install_shim() to put it on PATH as
+"nvidia-smi".
+
+Environment:
+    FAKE_NVIDIA_SMI_GPUS   number of GPUs to report (default 2)
+    FAKE_NVIDIA_SMI_MODEL  GPU name (default "NVIDIA A100-SXM4-80GB")
+    FAKE_NVIDIA_SMI_APPS   JSON file with a list of compute processes,
+                           {"pid": 1234, "gpu": 0, "used_memory": 2048, "name": "python"}
+"""
+import json
+import os
+import stat
+import sys
+
+MEMORY_TOTAL_MIB = 81920
+CONTEXT_MIB = 300  # Device memory of a CUDA context, even where used_memory reads [N/A]
+
+
+def load_apps():
+    """The compute processes in the FAKE_NVIDIA_SMI_APPS file"""
+    path = os.environ.get("FAKE_NVIDIA_SMI_APPS")
+    if not path or not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def gpu_table(count, model, apps=()):
+    """Deterministic per-GPU values keyed by nvidia-smi field name"""
+    gpus = []
+    for i in range(count):
+        used = 1024 * (i + 1) + sum(app["used_memory"] + CONTEXT_MIB for app in apps if app["gpu"] == i)
+        gpus.append({
+            "index": (str(i), ""),
+            "uuid": (f"GPU-00000000-0000-0000-0000-{i:012d}", ""),
+            "name": (model, ""),
+            "pci.bus_id": (f"00000000:{0x17 + i:02X}:00.0", ""),
+            "driver_version": ("550.54.15", ""),
+            "gpu_serial": (f"1320000000{i:03d}", ""),
+            "display_active": ("Disabled", ""),
+            "display_mode": ("Disabled", ""),
+            "utilization.gpu": (str(10 * (i + 1) % 100), " %"),
+            "utilization.memory": (str(5 * (i + 1) % 100), " %"),
+            "memory.total": (str(MEMORY_TOTAL_MIB), " MiB"),
+            "memory.used": (str(used), " MiB"),
+            "memory.free": (str(MEMORY_TOTAL_MIB - used), " MiB"),
+            "temperature.gpu": (str(40 + i), ""),
+            "power.draw": (f"{60 + 5 * i:.2f}", " W"),
+        })
+    return gpus
+
+
+def query_gpu(fields, fmt, gpus):
+    nounits = "nounits" in fmt
+    lines = []
+    if "noheader" not in fmt:
+        lines.append(", ".join(fields))
+    for gpu in gpus:
+        values = []
+        for field in fields:
+            value, unit = gpu.get(field, ("[N/A]", ""))
+            values.append(value if nounits else value + unit)
+        lines.append(", ".join(values))
+    return "\n".join(lines) + "\n"
+
+
+def compute_apps(gpus, apps):
+    """Rows for --query-compute-apps"""
+    rows = []
+    for app in apps:
+        gpu = gpus[app["gpu"]]
+        rows.append({
+            "pid": (str(app["pid"]), ""),
+            "process_name": (app.get("name", "python"), ""),
+            "gpu_uuid": gpu["uuid"],
+            "gpu_bus_id": gpu["pci.bus_id"],
+            "used_memory": (str(app["used_memory"]), " MiB"),
+        })
+    return rows
+
+
+def main(argv):
+    count = int(os.environ.get("FAKE_NVIDIA_SMI_GPUS", "2"))
+    model = os.environ.get("FAKE_NVIDIA_SMI_MODEL", "NVIDIA A100-SXM4-80GB")
+    options = dict(arg.split("=", 1) for arg in argv if arg.startswith("--") and "=" in arg)
+    fmt = options.get("--format", "csv").split(",")
+    if count <= 0:
+        sys.stderr.write("NVIDIA-SMI has failed because it couldn't communicate with the NVIDIA driver.\n")
+        return 9
+    apps = load_apps()
+    if "--query-gpu" in options:
+        sys.stdout.write(query_gpu(options["--query-gpu"].split(","), fmt, gpu_table(count, model, apps)))
+        return 0
+    if "--query-compute-apps" in options:
+        apps = compute_apps(gpu_table(count, model, apps), apps)
+        sys.stdout.write(query_gpu(options["--query-compute-apps"].split(","), fmt, apps) if apps else "")
+        return 0
+    sys.stderr.write("fake nvidia-smi: only --query-gpu and --query-compute-apps are supported\n")
+    return 2
+
+
+def install_shim(directory):
+    """Write an executable 'nvidia-smi' into directory that runs this script"""
+    path = os.path.join(directory, "nvidia-smi")
+    with open(path, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
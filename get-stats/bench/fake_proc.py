@@ -0,0 +1,72 @@
+"""
+A fake procfs tree for benchmarks.
+
+Writes just enough of /proc for the agent's process view and for psutil
+(with psutil.PROCFS_PATH pointed at it): /proc/stat, and per PID stat,
+statm, status and cgroup. Processes can be given a container ID (written as
+a cgroup v2 docker-<id>.scope path, or a v1 /docker/<id> path), have CPU
+time added, and exit.
+"""
+import os
+import shutil
+import time
+
+from proctop import CLK_TCK
+
+
+class FakeProc:
+    def __init__(self, root):
+        self.root = root
+        self.boot_time = int(time.time()) - 86400
+        self.processes = {}  # pid -> dict of the values written
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        with open(os.path.join(root, "stat"), "w") as f:
+            f.write("cpu  100 0 100 10000 0 0 0 0 0 0\n"
+                    "cpu0 100 0 100 10000 0 0 0 0 0 0\n"
+                    f"btime {self.boot_time}\n")
+        with open(os.path.join(root, "uptime"), "w") as f:
+            f.write("86400.00 86000.00\n")
+
+    def add(self, pid, name, utime=0, stime=0, rss_pages=2048, container_id=None, cgroup_v1=False, start=None):
+        directory = os.path.join(self.root, str(pid))
+        os.makedirs(directory, exist_ok=True)
+        if container_id is None:
+            cgroup = "0::/user.slice/user-1000.slice/session-1.scope\n"
+        elif cgroup_v1:
+            cgroup = "".join(f"{i}:{controller}:/docker/{container_id}\n"
+                             for i, controller in enumerate(("cpu,cpuacct", "memory", "pids", "blkio"), 1))
+        else:
+            cgroup = f"0::/system.slice/docker-{container_id}.scope\n"
+        with open(os.path.join(directory, "cgroup"), "w") as f:
+            f.write(cgroup)
+        self.processes[pid] = {"name": name, "utime": utime, "stime": stime, "rss": rss_pages,
+                               "start": start if start is not None
+                               else (int(time.time()) - self.boot_time) * CLK_TCK + pid % CLK_TCK}
+        self._write(pid)
+
+    def advance(self, pid, utime=0, stime=0, rss_pages=None):
+        proc = self.processes[pid]
+        proc["utime"] += utime
+        proc["stime"] += stime
+        if rss_pages is not None:
+            proc["rss"] = rss_pages
+        self._write(pid)
+
+    def remove(self, pid):
+        self.processes.pop(pid, None)
+        shutil.rmtree(os.path.join(self.root, str(pid)), ignore_errors=True)
+
+    def _write(self, pid):
+        proc = self.processes[pid]
+        directory = os.path.join(self.root, str(pid))
+        vsize = proc["rss"] * 4096 * 4
+        with open(os.path.join(directory, "stat"), "w") as f:
+            f.write(f"{pid} ({proc['name']}) S 1 {pid} {pid} 0 -1 4194304 0 0 0 0 "
+                    f"{proc['utime']} {proc['stime']} 0 0 20 0 1 0 {proc['start']} {vsize} {proc['rss']} "
+                    "18446744073709551615 0 0 0 0 0 0 0 0 0 0 0 0 17 0 0 0 0 0 0 0 0 0 0 0 0 0 0\n")
+        with open(os.path.join(directory, "statm"), "w") as f:
+            f.write(f"{proc['rss'] * 4} {proc['rss']} 512 64 0 {proc['rss']} 0\n")
+        with open(os.path.join(directory, "status"), "w") as f:
+            f.write(f"Name:\t{proc['name']}\nState:\tS (sleeping)\nPid:\t{pid}\nPPid:\t1\n"
+                    f"Uid:\t0\t0\t0\t0\nGid:\t0\t0\t0\t0\nVmRSS:\t{proc['rss'] * 4} kB\nThreads:\t1\n")
@@ -0,0 +1,52 @@
+"""
+A fake sysfs tree for benchmarks.
+
+Writes the files topology.read_topology reads for a multi-socket host:
+devices/system/node/node<N>/{cpulist,meminfo,distance}, devices/system/cpu/
+online and cpu<N>/topology/{thread_siblings_list,physical_package_id,core_id},
+and bus/pci/devices/<bus id>/numa_node for each GPU. CPUs are numbered as
+Linux does on x86: the first thread of every core on every socket, then
+the second threads. GPU bus ids match fake_nvidia_smi's, and the GPUs are
+split evenly over the sockets. Point the agent at it with AGENT_SYSFS_ROOT.
+"""
+import os
+import shutil
+
+from reservations import format_cpuset
+
+
+class FakeSysfs:
+    def __init__(self, root, sockets=2, cores_per_socket=16, threads_per_core=2, gpus=8,
+                 memory_per_node=256 << 30):
+        self.root = root
+        shutil.rmtree(root, ignore_errors=True)
+        total_cores = sockets * cores_per_socket
+        self.node_cpus = {node: [] for node in range(sockets)}
+        for thread in range(threads_per_core):
+            for core in range(total_cores):
+                cpu = thread * total_cores + core
+                node = core // cores_per_socket
+                self.node_cpus[node].append(cpu)
+                siblings = [t * total_cores + core for t in range(threads_per_core)]
+                self._write(f"devices/system/cpu/cpu{cpu}/topology/thread_siblings_list", format_cpuset(siblings))
+                self._write(f"devices/system/cpu/cpu{cpu}/topology/physical_package_id", node)
+                self._write(f"devices/system/cpu/cpu{cpu}/topology/core_id", core % cores_per_socket)
+        self._write("devices/system/cpu/online", f"0-{total_cores * threads_per_core - 1}")
+        for node, cpus in self.node_cpus.items():
+            self._write(f"devices/system/node/node{node}/cpulist", format_cpuset(cpus))
+            self._write(f"devices/system/node/node{node}/meminfo",
+                        f"Node {node} MemTotal:       {memory_per_node // 1024} kB\n"
+                        f"Node {node} MemFree:        {memory_per_node // 2048} kB")
+            self._write(f"devices/system/node/node{node}/distance",
+                        " ".join("10" if other == node else "21" for other in range(sockets)))
+        self.gpu_nodes = {}
+        for i in range(gpus):
+            node = i * sockets // gpus if gpus else 0
+            self.gpu_nodes[i] = node
+            self._write(f"bus/pci/devices/0000:{0x17 + i:02x}:00.0/numa_node", node)
+
+    def _write(self, relative, value):
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(f"{value}\n")
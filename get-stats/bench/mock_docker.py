@@ -0,0 +1,308 @@
+"""
+Minimal Docker Engine HTTP API served on a unix socket.
+
+Implements just enough of the API for docker-py's containers.run/list/get/stop,
+the create/rename/update/pause/unpause a warm pool uses, and images.get, so the agent's Docker paths can be exercised on a machine
+without a Docker daemon. Point the agent at it with
+DOCKER_HOST=unix:///path/to/socket.
+
+    python mock_docker.py /tmp/mock-docker.sock
+"""
+import asyncio
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import sys
+import threading
+
+from aiohttp import web
+
+API_VERSION = "1.45"
+
+# Images the mock pretends are already pulled
+DEFAULT_IMAGES = ("nginx", "nginx:latest", "ubuntu:22.04", "pytorch/pytorch:latest")
+
+VERSION_PREFIX = "/{api_version:(?:v[0-9]+\\.[0-9]+/)?}"
+
+ZERO_TIME = "0001-01-01T00:00:00Z"  # What Docker reports for a container never started
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _image_id(name):
+    return "sha256:" + hashlib.sha256(name.encode()).hexdigest()
+
+
+class MockDocker:
+    """In-memory container store plus the aiohttp routes that expose it"""
+
+    def __init__(self, images=DEFAULT_IMAGES, latency=0.0, latencies=None):
+        self.images = set(images)
+        self._image_names = {_image_id(name).split(":")[1]: name for name in self.images}
+        self.latency = latency  # Seconds of simulated daemon work per mutating call
+        self.latencies = dict(latencies or {})  # Per operation ("create", "start", ...), overriding latency
+        self.containers = {}
+        self._ids = itertools.count(1)
+        self.requests = 0
+
+    def reset(self, containers=0, image="nginx"):
+        """Drop all containers and optionally pre-create some running ones"""
+        self.containers.clear()
+        self._ids = itertools.count(1)
+        for i in range(containers):
+            self._create(f"seed_{i}", {"Image": image}, running=True)
+
+    def add(self, name, image="nginx", running=True):
+        """Pre-create one container, e.g. one seen in a recorded trace; returns its id"""
+        self.images.add(image)
+        self._image_names[_image_id(image).split(":")[1]] = image
+        return self._create(name, {"Image": image}, running=running)
+
+    def _create(self, name, config, running=False):
+        n = next(self._ids)
+        container_id = hashlib.sha256(f"container-{n}".encode()).hexdigest()
+        image = config.get("Image", "")
+        self.containers[container_id] = {
+            "Id": container_id,
+            "Name": "/" + (name or f"mock_{n}"),
+            "Created": "2025-01-01T00:00:00Z",
+            "Image": _image_id(image),
+            "Config": {
+                "Image": image,
+                "Labels": config.get("Labels") or {},
+                "Tty": config.get("Tty", False),
+                "OpenStdin": config.get("OpenStdin", False),
+            },
+            "HostConfig": dict(config.get("HostConfig") or {}, LogConfig={"Type": "json-file"}),
+            "State": {"Status": "running" if running else "created", "Running": running,
+                      "Paused": False, "Pid": 0, "StartedAt": _now() if running else ZERO_TIME},
+        }
+        return container_id
+
+    def _find(self, ref):
+        if ref in self.containers:
+            return self.containers[ref]
+        for container in self.containers.values():
+            if container["Name"] == "/" + ref or container["Id"].startswith(ref):
+                return container
+        return None
+
+    @staticmethod
+    def _summary(container):
+        return {
+            "Id": container["Id"],
+            "Names": [container["Name"]],
+            "Image": container["Config"]["Image"],
+            "ImageID": container["Image"],
+            "Labels": container["Config"]["Labels"],
+            "State": container["State"]["Status"],
+            "Status": container["State"]["Status"],
+            "HostConfig": {"NetworkMode": "default"},
+        }
+
+    @staticmethod
+    def _has_label(container, label):
+        key, _, value = label.partition("=")
+        labels = container["Config"]["Labels"]
+        return key in labels and (not value or labels[key] == value)
+
+    @staticmethod
+    def _not_found(message):
+        return web.json_response({"message": message}, status=404)
+
+    async def _work(self, op):
+        latency = self.latencies.get(op, self.latency)
+        if latency:
+            await asyncio.sleep(latency)
+
+    # Routes
+
+    async def ping(self, request):
+        return web.Response(text="OK")
+
+    async def version(self, request):
+        return web.json_response({"Version": "mock", "ApiVersion": API_VERSION,
+                                  "MinAPIVersion": "1.24", "Os": "linux", "Arch": "amd64"})
+
+    async def list_containers(self, request):
+        include_all = request.query.get("all") in ("1", "true", "True")
+        labels = json.loads(request.query.get("filters") or "{}").get("label", [])
+        result = [self._summary(c) for c in self.containers.values()
+                  if (include_all or c["State"]["Running"])
+                  and all(self._has_label(c, label) for label in labels)]
+        return web.json_response(result)
+
+    async def create_container(self, request):
+        config = await request.json()
+        name = request.query.get("name")
+        if config.get("Image") not in self.images:
+            return self._not_found(f"No such image: {config.get('Image')}")
+        if name and self._find(name):
+            return web.json_response({"message": f"Conflict. The container name \"/{name}\" is already in use"},
+                                     status=409)
+        await self._work("create")
+        return web.json_response({"Id": self._create(name, config), "Warnings": []}, status=201)
+
+    async def inspect_container(self, request):
+        container = self._find(request.match_info["ref"])
+        if container is None:
+            return self._not_found(f"No such container: {request.match_info['ref']}")
+        return web.json_response(container)
+
+    async def start_container(self, request):
+        container = self._find(request.match_info["ref"])
+        if container is None:
+            return self._not_found(f"No such container: {request.match_info['ref']}")
+        await self._work("start")
+        container["State"].update(Status="running", Running=True, StartedAt=_now())
+        return web.Response(status=204)
+
+    async def stop_container(self, request):
+        container = self._find(request.match_info["ref"])
+        if container is None:
+            return self._not_found(f"No such container: {request.match_info['ref']}")
+        await self._work("stop")
+        container["State"].update(Status="exited", Running=False, Paused=False)
+        return web.Response(status=204)
+
+    async def pause_container(self, request):
+        container = self._find(request.match_info["ref"])
+        if container is None:
+            return self._not_found(f"No such container: {request.match_info['ref']}")
+        if not container["State"]["Running"]:
+            return web.json_response({"message": f"Container {container['Id']} is not running"}, status=409)
+        await self._work("pause")
+        container["State"].update(Status="paused", Paused=True)
+        return web.Response(status=204)
+
+    async def unpause_container(self, request):
+        container = self._find(request.match_info["ref"])
+        if container is None:
+            return self._not_found(f"No such container: {request.match_info['ref']}")
+        if not container["State"]["Paused"]:
+            return web.json_response({"message": f"Container {container['Id']} is not paused"}, status=409)
+        await self._work("unpause")
+        container["State"].update(Status="running", Paused=False)
+        return web.Response(status=204)
+
+    async def rename_container(self, request):
+        container = self._find(request.match_info["ref"])
+        if container is None:
+            return self._not_found(f"No such container: {request.match_info['ref']}")
+        name = request.query.get("name", "")
+        other = self._find(name)
+        if other is not None and other is not container:
+            return web.json_response({"message": f"Conflict. The container name \"/{name}\" is already in use"},
+                                     status=409)
+        await self._work("rename")
+        container["Name"] = "/" + name
+        return web.Response(status=204)
+
+    async def update_container(self, request):
+        container = self._find(request.match_info["ref"])
+        if container is None:
+            return self._not_found(f"No such container: {request.match_info['ref']}")
+        await self._work("update")
+        container["HostConfig"].update(await request.json())
+        return web.json_response({"Warnings": []})
+
+    async def remove_container(self, request):
+        container = self._find(request.match_info["ref"])
+        if container is None:
+            return self._not_found(f"No such container: {request.match_info['ref']}")
+        del self.containers[container["Id"]]
+        return web.Response(status=204)
+
+    async def inspect_image(self, request):
+        name = request.match_info["name"]
+        # docker-py looks images up by the bare hex ID of a container's image
+        name = self._image_names.get(name, name)
+        if name not in self.images and name + ":latest" not in self.images:
+            return self._not_found(f"No such image: {name}")
+        return web.json_response({"Id": _image_id(name), "RepoTags": [name]})
+
+    async def pull_image(self, request):
+        name = request.query.get("fromImage", "")
+        return self._not_found(f"No such image: {name}")
+
+    @web.middleware
+    async def _count_requests(self, request, handler):
+        self.requests += 1
+        return await handler(request)
+
+    def make_app(self):
+        app = web.Application(middlewares=[self._count_requests])
+        routes = [
+            ("GET", "_ping", self.ping),
+            ("GET", "version", self.version),
+            ("GET", "containers/json", self.list_containers),
+            ("POST", "containers/create", self.create_container),
+            ("GET", "containers/{ref}/json", self.inspect_container),
+            ("POST", "containers/{ref}/start", self.start_container),
+            ("POST", "containers/{ref}/stop", self.stop_container),
+            ("POST", "containers/{ref}/pause", self.pause_container),
+            ("POST", "containers/{ref}/unpause", self.unpause_container),
+            ("POST", "containers/{ref}/rename", self.rename_container),
+            ("POST", "containers/{ref}/update", self.update_container),
+            ("DELETE", "containers/{ref}", self.remove_container),
+            ("POST", "images/create", self.pull_image),
+            ("GET", "images/{name:.+}/json", self.inspect_image),
+        ]
+        for method, path, handler in routes:
+            # docker-py prefixes every path with /v1.xx; accept both forms
+            app.router.add_route(method, VERSION_PREFIX + path, handler)
+        return app
+
+
+class MockDockerServer:
+    """Run a MockDocker on a unix socket from a background thread"""
+
+    def __init__(self, socket_path, **kwargs):
+        self.socket_path = socket_path
+        self.docker = MockDocker(**kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._runner = None
+
+    @property
+    def base_url(self):
+        return "unix://" + self.socket_path
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._runner = web.AppRunner(self.docker.make_app())
+        await self._runner.setup()
+        await web.UnixSite(self._runner, self.socket_path).start()
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        future = asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop)
+        future.result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/mock-docker.sock"
+    server = MockDockerServer(path).start()
+    print(f"Mock Docker Engine listening on {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,208 @@
+"""
+Replay a recorded agent trace (see tracing.py) against a fresh agent.
+
+Runs the agent in-process against the mock Docker daemon and the fake
+nvidia-smi, with the sampler's collectors (get_usage,
+get_container_summary, read_container_io) replaced by the recorded
+snapshots: at replay time t the agent sees the snapshot taken at t * speed.
+The containers of the first snapshot are pre-created in the mock daemon.
+Every recorded client gets its own Socket.IO connection that connects,
+sends its events and disconnects on the recorded schedule, compressed by
+--speed; events that asked for an acknowledgement are pipelined and
+timed. Reported:
+
+trace      records by kind, duration, size on disk and bytes per record
+events     per event: how many were sent and, for calls, ack latency and
+           how many got no ack
+frames     frames received by the replayed clients, by event
+lag        how late each send went out against its schedule
+
+Record a trace by running the agent with AGENT_TRACE=/path/to/trace, then
+
+    python bench/replay.py /path/to/trace --speed 4
+"""
+import argparse
+import asyncio
+import bisect
+import collections
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import socketio
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from client import percentiles  # noqa: E402
+import fake_nvidia_smi  # noqa: E402
+from mock_docker import MockDockerServer  # noqa: E402
+import tracing  # noqa: E402
+
+
+def load(path):
+    """Snapshots as ([seconds], [payload]) and each client's records in order"""
+    times, snapshots = [], []
+    clients = collections.defaultdict(list)
+    kinds = collections.Counter()
+    for kind, seconds, client, payload in tracing.read_trace(path):
+        kinds[tracing.KIND_NAMES.get(kind, str(kind))] += 1
+        if kind == tracing.SNAPSHOT:
+            times.append(seconds)
+            snapshots.append(json.dumps(payload))  # Decoded afresh on every read; the agent mutates it
+        elif client:
+            clients[client].append((kind, seconds, payload))
+    return times, snapshots, clients, kinds
+
+
+class Replayer:
+    def __init__(self, url, speed, call_timeout):
+        self.url = url
+        self.speed = speed
+        self.call_timeout = call_timeout
+        self.started = time.monotonic()
+        self.sent = collections.Counter()
+        self.acks = collections.defaultdict(list)
+        self.unacked = collections.Counter()
+        self.frames = collections.Counter()
+        self.lag = []
+        self.connect_failed = 0
+
+    def now(self):
+        """Trace time the replay has reached"""
+        return (time.monotonic() - self.started) * self.speed
+
+    async def wait_until(self, seconds):
+        await asyncio.sleep(max(0, self.started + seconds / self.speed - time.monotonic()))
+        self.lag.append(max(0, time.monotonic() - self.started - seconds / self.speed) * 1000)
+
+    async def call(self, sio, event, data):
+        sent_at = time.perf_counter()
+        try:
+            await sio.call(event, data, timeout=self.call_timeout)
+        except (socketio.exceptions.TimeoutError, socketio.exceptions.BadNamespaceError):
+            self.unacked[event] += 1
+            return
+        self.acks[event].append((time.perf_counter() - sent_at) * 1000)
+
+    async def client(self, records):
+        sio = socketio.AsyncClient(reconnection=False)
+
+        async def on_any(event, *args):
+            self.frames[event] += 1
+        sio.on("*", on_any)
+        calls = set()
+        for kind, seconds, payload in records:
+            await self.wait_until(seconds)
+            if kind == tracing.CONNECT:
+                try:
+                    await sio.connect(self.url, auth=payload, transports=["websocket"], wait_timeout=10)
+                except Exception:
+                    self.connect_failed += 1
+                    return
+            elif kind == tracing.DISCONNECT:
+                break
+            elif sio.connected and payload:
+                event, args = payload[0], payload[1:]
+                data = args[0] if len(args) == 1 else tuple(args) if args else None
+                self.sent[event] += 1
+                if kind == tracing.CALL:
+                    task = asyncio.create_task(self.call(sio, event, data))
+                    calls.add(task)
+                    task.add_done_callback(calls.discard)
+                else:
+                    await sio.emit(event, data)
+        if calls:
+            await asyncio.wait(calls)
+        if sio.connected:
+            await sio.disconnect()
+
+    def report(self):
+        events = {}
+        for event, count in sorted(self.sent.items()):
+            events[event] = {"sent": count}
+            if event in self.acks or event in self.unacked:
+                events[event]["ack_ms"] = percentiles(self.acks[event])
+                events[event]["unacked"] = self.unacked[event]
+        return {"events": events, "frames": dict(sorted(self.frames.items())), "lag_ms": percentiles(self.lag),
+                "connect_failed": self.connect_failed}
+
+
+def mock_collectors(get_stats, replayer, times, snapshots):
+    """Serve the snapshot recorded at the replay's trace time instead of collecting"""
+    def snapshot():
+        index = max(0, bisect.bisect_right(times, replayer.now()) - 1)
+        return json.loads(snapshots[index])
+
+    async def get_usage():
+        return snapshot()["usage"]
+
+    def get_container_summary():
+        return snapshot()["containers"]
+
+    def read_container_io(containers, now):
+        return snapshot()["usage"].get("Container_IO", [])
+
+    get_stats.get_usage = get_usage
+    get_stats.get_container_summary = get_container_summary
+    get_stats.read_container_io = read_container_io
+
+
+async def run(get_stats, args, times, snapshots, clients):
+    replayer = Replayer(f"http://127.0.0.1:{args.port}", args.speed, args.call_timeout)
+    if len(times) > 1:
+        get_stats.USAGE_INTERVAL = statistics.median(b - a for a, b in zip(times, times[1:])) / args.speed
+    mock_collectors(get_stats, replayer, times, snapshots)
+    asyncio.create_task(get_stats.main(host="127.0.0.1", port=args.port))
+    await asyncio.sleep(0.5)  # Bind before the first recorded connect
+    replayer.started = time.monotonic()
+    await asyncio.gather(*(replayer.client(records) for records in clients.values()))
+    report = replayer.report()
+    report["wall_s"] = round(time.monotonic() - replayer.started, 2)
+    report["agent_samples"] = get_stats.agent_counters["samples"]
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Replay a recorded agent trace")
+    parser.add_argument("trace")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay this many times faster than recorded")
+    parser.add_argument("--docker-latency", type=float, default=0.0, help="Seconds per mutating Docker call")
+    parser.add_argument("--call-timeout", type=float, default=15, help="Seconds to wait for an acknowledgement")
+    parser.add_argument("--port", type=int, default=18790)
+    args = parser.parse_args(argv)
+
+    times, snapshots, clients, kinds = load(args.trace)
+    records = sum(kinds.values())
+    size = os.path.getsize(args.trace)
+    duration = max([r[-1][1] for r in clients.values()] + times[-1:], default=0)
+    trace = {"records": dict(kinds), "clients": len(clients), "duration_s": round(duration, 2), "bytes": size,
+             "bytes_per_record": round(size / records, 1) if records else None}
+
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    fake_nvidia_smi.install_shim(workdir)
+    os.environ["PATH"] = workdir + os.pathsep + os.environ.get("PATH", "")
+    mock = MockDockerServer(os.path.join(workdir, "docker.sock"), latency=args.docker_latency).start()
+    for container in json.loads(snapshots[0])["containers"] if snapshots else []:
+        mock.docker.add(container["name"], container.get("image") or "nginx")
+    os.environ["DOCKER_HOST"] = mock.base_url
+    os.environ["AGENT_PUBLIC_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["AGENT_METER_LEDGER"] = os.path.join(workdir, "metering.jsonl")
+    os.environ.pop("AGENT_TRACE", None)  # Don't record the replay
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import get_stats
+    get_stats.SERVER_NOTIFICATION_URL = "http://127.0.0.1:9/unused"
+
+    report = {"trace": trace, "speed": args.speed, "docker_latency_s": args.docker_latency}
+    report.update(asyncio.run(run(get_stats, args, times, snapshots, clients)))
+    print(json.dumps(report, indent=2))
+    os._exit(0)  # The agent's background tasks need not finish
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,215 @@
+"""
+Simulate a fleet of agents behind the aggregator, all in one process.
+
+Starts the aggregator plus N fake agents (each a real Socket.IO server on
+its own localhost port), registers the agents through /api/ngrok, then
+connects D dashboards that subscribe to random hosts and send control
+commands. Reports telemetry delivery latency, routed command round-trips,
+misrouted replies and how many upstream connections each agent saw,
+which must stay at one no matter how many dashboards watch it.
+
+    python bench/sim_agents.py --agents 300 --dashboards 200 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import aiohttp
+import socketio
+from aiohttp import web
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import aggregator  # noqa: E402
+from client import percentiles  # noqa: E402
+
+
+class FakeAgent:
+    """A Socket.IO server speaking the agent's protocol with canned data"""
+
+    def __init__(self, index):
+        self.machine_id = f"sim-{index:04d}"
+        self.sio = socketio.AsyncServer(async_mode='aiohttp')
+        self.app = web.Application()
+        self.sio.attach(self.app)
+        self.url = None
+        self.runner = None
+        self.connections = 0
+        self.max_connections = 0
+        self.connects_total = 0
+
+        self.sio.on('connect', self.on_connect)
+        self.sio.on('disconnect', self.on_disconnect)
+        self.sio.on('list_containers', self.on_list_containers)
+        self.sio.on('run_container', self.on_run_container)
+        self.sio.on('stop_container_request', self.on_stop_container)
+
+    async def on_connect(self, sid, environ, auth=None):
+        self.connections += 1
+        self.connects_total += 1
+        self.max_connections = max(self.max_connections, self.connections)
+        await self.sio.emit('system_info', {"OS": "Linux sim", "Threads": 64, "RAM": 256.0,
+                                            "GPU": [{"Name": "NVIDIA A100", "Memory": 81920}]}, room=sid)
+
+    async def on_disconnect(self, sid, *args):
+        self.connections -= 1
+
+    async def reply(self, sid, event, data, result):
+        """Acknowledge with the result, or send the reply event without a request_id, as the agent does"""
+        result = dict(result, host=self.machine_id)
+        request_id = data.get('request_id') if isinstance(data, dict) else None
+        if request_id is None:
+            await self.sio.emit(event, result, room=sid)
+            return result
+        return dict(result, request_id=request_id)
+
+    async def on_list_containers(self, sid, data=None):
+        return await self.reply(sid, 'container_list', data, {'success': True, 'containers': []})
+
+    async def on_run_container(self, sid, data):
+        return await self.reply(sid, 'container_result', data,
+                                {'success': True, 'container': {'id': 'sim', 'name': data.get('container_name')}})
+
+    async def on_stop_container(self, sid, data):
+        return await self.reply(sid, 'container_stop_result', data, {'success': True, 'message': 'stopped'})
+
+    async def tick(self, seq):
+        await self.sio.emit('usage_stats', {"CPU_Usage": 12.5, "Memory_Usage": 40.0, "GPU_Usage": 0,
+                                            "seq": seq, "ts": time.time()})
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class Dashboard:
+    """A viewer connected to the aggregator"""
+
+    def __init__(self, stats, rng, machine_ids, subscriptions):
+        self.stats = stats
+        self.rng = rng
+        self.machine_ids = machine_ids
+        self.watching = rng.sample(machine_ids, min(subscriptions, len(machine_ids)))
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.pending = {}  # machine_id -> list of send times
+        self.sio.on('usage_stats', self.on_usage_stats)
+        self.sio.on('container_list', self.on_container_list)
+
+    async def on_usage_stats(self, data):
+        self.stats["frame_latency_ms"].append((time.time() - data["ts"]) * 1000)
+
+    async def on_container_list(self, data):
+        target = data.get('machine_id')
+        sent = self.pending.get(target)
+        if not sent:
+            self.stats["unmatched"] += 1
+            return
+        self.stats["command_rtt_ms"].append((time.perf_counter() - sent.pop(0)) * 1000)
+        if data.get('host') != target:
+            self.stats["misrouted"] += 1
+
+    async def run(self, url, deadline, command_rate):
+        await self.sio.connect(url, transports=["websocket"], wait_timeout=10)
+        for machine_id in self.watching:
+            await self.sio.emit('subscribe', {'machine_id': machine_id})
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.rng.expovariate(command_rate) if command_rate > 0 else 1)
+            if command_rate > 0 and time.perf_counter() < deadline:
+                target = self.rng.choice(self.machine_ids)
+                self.pending.setdefault(target, []).append(time.perf_counter())
+                self.stats["commands"] += 1
+                await self.sio.emit('list_containers', {'machine_id': target})
+        await asyncio.sleep(1)  # Let in-flight replies land
+        await self.sio.disconnect()
+
+
+async def simulate(args):
+    rng = random.Random(args.seed)
+    runner = await aggregator.start(host="127.0.0.1", port=args.port)
+    agg_url = f"http://127.0.0.1:{args.port}"
+
+    agents = [FakeAgent(i) for i in range(args.agents)]
+    await asyncio.gather(*(agent.start() for agent in agents))
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        for agent in agents:
+            payload = {"ngrok_url": agent.url, "timestamp": str(time.time()), "machine_id": agent.machine_id}
+            async with session.post(agg_url + "/api/ngrok", json=payload) as response:
+                assert response.status == 200, await response.text()
+    while sum(1 for up in aggregator.hosts.values() if up.connected) < args.agents:
+        await asyncio.sleep(0.05)
+    upstream_setup = time.perf_counter() - started
+
+    stats = {"frame_latency_ms": [], "command_rtt_ms": [], "commands": 0, "misrouted": 0, "unmatched": 0}
+    machine_ids = [agent.machine_id for agent in agents]
+    dashboards = [Dashboard(stats, random.Random(rng.random()), machine_ids, args.subscriptions)
+                  for _ in range(args.dashboards)]
+    deadline = time.perf_counter() + args.duration
+
+    async def ticker():
+        seq = 0
+        while time.perf_counter() < deadline:
+            seq += 1
+            for agent in agents:
+                await agent.tick(seq)
+            await asyncio.sleep(args.interval)
+
+    tick_task = asyncio.create_task(ticker())
+    await asyncio.gather(*(d.run(agg_url, deadline, args.command_rate) for d in dashboards))
+    await tick_task
+
+    report = {
+        "agents": args.agents,
+        "dashboards": args.dashboards,
+        "subscriptions_per_dashboard": args.subscriptions,
+        "upstream_setup_s": round(upstream_setup, 3),
+        "max_upstream_connections_per_agent": max(agent.max_connections for agent in agents),
+        "total_agent_connects": sum(agent.connects_total for agent in agents),
+        "frames_forwarded": aggregator.aggregator_counters["frames_forwarded"],
+        "frames_delivered": len(stats["frame_latency_ms"]),
+        "frame_latency_ms": percentiles(stats["frame_latency_ms"]),
+        "commands": stats["commands"],
+        "command_rtt_ms": percentiles(stats["command_rtt_ms"]),
+        "misrouted": stats["misrouted"],
+        "unmatched": stats["unmatched"],
+    }
+
+    for upstream in list(aggregator.hosts.values()):
+        await upstream.close()
+    await asyncio.gather(*(agent.stop() for agent in agents))
+    await runner.cleanup()
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Simulated agent fleet behind the aggregator")
+    parser.add_argument("--agents", type=int, default=300)
+    parser.add_argument("--dashboards", type=int, default=100)
+    parser.add_argument("--subscriptions", type=int, default=5, help="Hosts each dashboard watches")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--interval", type=float, default=2, help="Seconds between agent telemetry frames")
+    parser.add_argument("--command-rate", type=float, default=0.5,
+                        help="list_containers per second per dashboard")
+    parser.add_argument("--port", type=int, default=18766)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    report = asyncio.run(simulate(args))
+    print(json.dumps(report, indent=2))
+    bad = report["max_upstream_connections_per_agent"] > 1 or report["misrouted"]
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,11 +1,21 @@
+import argparse
 import asyncio
+import json
+import multiprocessing
+import random
+import sys
+import time
+import uuid
+
 import socketio
 
+import compression
+
 # Server address (replace with actual ngrok or server URL)
 SERVER_URL = "http://localhost:8765"
 
 # Create a Socket.IO client
-sio = socketio.AsyncClient()
+sio = socketio.AsyncClient(websocket_extra_options=compression.CLIENT_OPTIONS)
 
 @sio.event
 async def connect():
@@ -21,27 +31,46 @@ async def usage_stats(data):
     print("Received usage stats:", data)
 
 @sio.event
-async def container_result(data):
-    print("Container result:", data)
+async def disconnect():
+    print("Disconnected from server.")
 
-@sio.event
-async def container_list(data):
-    print("Running containers:", data)
+COMMAND_TIMEOUT = 30  # Seconds to wait for an acknowledged result before retrying
 
-@sio.event
-async def container_stop_result(data):
-    print("Container stop result:", data)
+# Sent as auth on connect. The agent scopes cached command results to it,
+# so retries after a reconnect are answered from the cache
+CLIENT_ID = uuid.uuid4().hex
 
-@sio.event
-async def disconnect():
-    print("Disconnected from server.")
+async def call(client, command, data=None, timeout=COMMAND_TIMEOUT, attempts=3):
+    """
+    Send a control command with a request_id and await its acknowledged
+    result. A timeout, a dropped connection or a rate-limit rejection is
+    retried with the same request_id, so the agent runs the command at
+    most once however often the request is sent. Across a reconnect that
+    holds only if the client connected with auth {"client_id": CLIENT_ID}
+    or another id of its own; otherwise the agent scopes results to the
+    connection.
+    """
+    data = dict(data or {})
+    data.setdefault("request_id", uuid.uuid4().hex)
+    for attempt in range(1, attempts + 1):
+        try:
+            result = await client.call(command, data, timeout=timeout)
+        except (socketio.exceptions.TimeoutError, socketio.exceptions.BadNamespaceError):
+            if attempt == attempts:
+                raise
+            await asyncio.sleep(min(2 ** attempt, 10))  # Give reconnection a chance
+            continue
+        if attempt < attempts and (result.get("pending") or "retry_after" in result):
+            await asyncio.sleep(result.get("retry_after", 0))
+            continue
+        return result
 
 async def main():
-    await sio.connect(SERVER_URL)
-    await asyncio.sleep(2)  # Allow time to receive system info
+    await sio.connect(SERVER_URL, auth={"client_id": CLIENT_ID})
+    print("System info:", await sio.call("request_system_info", timeout=COMMAND_TIMEOUT))
 
     print("Starting a container...")
-    await sio.emit("run_container", {
+    result = await call(sio, "run_container", {
         "image": "nginx",  # Replace with desired image
         "resource_limits": {
             "cpu_count": 1,
@@ -50,20 +79,327 @@ async def main():
         },
         "container_name": "test_nginx"
     })
-    
-    await asyncio.sleep(3)  # Wait for container to start
-    
+    print("Container result:", result)
+
     print("Listing running containers...")
-    await sio.emit("list_containers")
-    
-    await asyncio.sleep(3)
-    
+    print("Running containers:", await call(sio, "list_containers"))
+
+    print("Resizing the container...")
+    print("Container update result:", await call(sio, "update_container", {
+        "container_id": "test_nginx",
+        "resource_limits": {"cpu_count": 2, "memory": "1g"},
+    }))
+
     print("Stopping the container...")
-    await sio.emit("stop_container_request", {"container_id": "test_nginx"})
-    
-    await asyncio.sleep(5)  # Allow time for response
-    
+    print("Container stop result:", await call(sio, "stop_container_request", {"container_id": "test_nginx"}))
+
     await sio.disconnect()
 
+# ---------------------------------------------------------------------------
+# Load-testing mode
+#
+#   python client.py load --url http://localhost:8765 --clients 2000 --processes 4
+#
+# Every simulated client is its own socketio.AsyncClient. Clients are spread
+# over worker processes, each running its own event loop, and the raw samples
+# are merged in the parent so the percentiles cover the whole run.
+# ---------------------------------------------------------------------------
+
+# Control commands, each answered by acknowledgement
+COMMANDS = ("list_containers", "run_container", "stop_container_request")
+
+DEFAULT_MIX = "list_containers=8,run_container=1,stop_container_request=1"
+
+
+def parse_mix(text):
+    """Parse a command mix like 'list_containers=8,run_container=1'"""
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in COMMANDS:
+            raise argparse.ArgumentTypeError(f"Unknown command in mix: {name}")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def percentiles(samples):
+    """Summarise a list of millisecond samples"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    count = len(ordered)
+
+    def pick(q):
+        return round(ordered[min(count - 1, int(q * count))], 3)
+
+    return {
+        "count": count,
+        "min": round(ordered[0], 3),
+        "mean": round(sum(ordered) / count, 3),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+class LoadClient:
+    """One simulated dashboard connection"""
+
+    def __init__(self, url, name, samples, options, rng):
+        self.url = url
+        self.name = name
+        self.samples = samples
+        self.options = options
+        self.rng = rng
+        ws_options = compression.CLIENT_OPTIONS if options["compress"] else {}
+        self.sio = socketio.AsyncClient(reconnection=False, websocket_extra_options=ws_options)
+        self.connect_started = None
+        self.last_frame = None
+        self.last_interval = None
+        self.in_flight = set()  # Commands awaiting their acknowledgement
+        self.started_containers = []
+        self.request_counter = 0
+
+        self.sio.on("usage_stats", self.on_usage_stats)
+
+    async def on_usage_stats(self, data):
+        now = time.perf_counter()
+        self.samples["frames"] += 1
+        if self.last_frame is None:
+            self.samples["first_frame_ms"].append((now - self.connect_started) * 1000)
+        else:
+            interval = (now - self.last_frame) * 1000
+            self.samples["frame_interval_ms"].append(interval)
+            if self.last_interval is not None:
+                # Jitter as the change between consecutive inter-frame gaps (RFC 3550 style)
+                self.samples["jitter_ms"].append(abs(interval - self.last_interval))
+            self.last_interval = interval
+        self.last_frame = now
+
+    async def send_command(self, command):
+        self.request_counter += 1
+        payload = {"request_id": uuid.uuid4().hex}
+        if command == "run_container":
+            payload.update({
+                "image": self.options["image"],
+                "resource_limits": {"cpu_count": 0.1, "memory": "64m", "gpu_count": 0},
+                "container_name": f"{self.name}_{self.request_counter}",
+            })
+        elif command == "stop_container_request":
+            if not self.started_containers:
+                return  # Nothing of ours to stop yet
+            payload["container_id"] = self.started_containers.pop(0)
+
+        stats = self.samples["commands"][command]
+        stats["sent"] += 1
+        sent_at = time.perf_counter()
+        try:
+            data = await self.sio.call(command, payload, timeout=self.options["reply_timeout"])
+        except (socketio.exceptions.TimeoutError, socketio.exceptions.BadNamespaceError):
+            stats["timeouts"] += 1
+            return
+        stats["rtt_ms"].append((time.perf_counter() - sent_at) * 1000)
+        if isinstance(data, dict) and data.get("success"):
+            stats["completed"] += 1
+            if command == "run_container":
+                self.started_containers.append(data["container"]["name"])
+        elif isinstance(data, dict) and "retry_after" in data:
+            stats["throttled"] += 1
+        else:
+            stats["failed"] += 1
+
+    def start_command(self, command):
+        """Send without waiting for the result, so commands pipeline as a real dashboard's would"""
+        task = asyncio.create_task(self.send_command(command))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+
+    async def run(self, deadline):
+        self.connect_started = time.perf_counter()
+        try:
+            await self.sio.connect(self.url, transports=["websocket"],
+                                   wait_timeout=self.options["connect_timeout"])
+        except Exception:
+            self.samples["connect_failed"] += 1
+            return
+        self.samples["connect_ms"].append((time.perf_counter() - self.connect_started) * 1000)
+        self.samples["connected"] += 1
+
+        commands = list(self.options["mix"])
+        weights = [self.options["mix"][c] for c in commands]
+        rate = self.options["command_rate"]
+        try:
+            while time.perf_counter() < deadline and self.sio.connected:
+                if rate > 0 and commands:
+                    delay = self.rng.expovariate(rate)
+                    await asyncio.sleep(min(delay, max(0, deadline - time.perf_counter())))
+                    if time.perf_counter() >= deadline or not self.sio.connected:
+                        break
+                    self.start_command(self.rng.choices(commands, weights)[0])
+                else:
+                    await asyncio.sleep(max(0, deadline - time.perf_counter()))
+            # Outstanding commands each time out after reply_timeout
+            if self.in_flight:
+                await asyncio.wait(self.in_flight)
+        finally:
+            if self.sio.connected:
+                await self.sio.disconnect()
+
+
+def new_samples():
+    return {
+        "connected": 0,
+        "connect_failed": 0,
+        "frames": 0,
+        "connect_ms": [],
+        "first_frame_ms": [],
+        "frame_interval_ms": [],
+        "jitter_ms": [],
+        "commands": {
+            command: {"sent": 0, "completed": 0, "failed": 0, "throttled": 0, "timeouts": 0, "rtt_ms": []}
+            for command in COMMANDS
+        },
+    }
+
+
+async def load_worker_main(worker_id, client_count, options):
+    samples = new_samples()
+    rng = random.Random(options["seed"] * 1000 + worker_id)
+    start = time.perf_counter()
+    deadline = start + options["ramp"] + options["duration"]
+    tasks = []
+    for i in range(client_count):
+        # Spread connects over the ramp-up window instead of a thundering herd
+        ramp_at = start + options["ramp"] * i / max(1, client_count)
+        await asyncio.sleep(max(0, ramp_at - time.perf_counter()))
+        client = LoadClient(options["url"], f"load_{worker_id}_{i}", samples, options,
+                            random.Random(rng.random()))
+        tasks.append(asyncio.create_task(client.run(deadline)))
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return samples
+
+
+def load_worker(args):
+    worker_id, client_count, options = args
+    return asyncio.run(load_worker_main(worker_id, client_count, options))
+
+
+def merge_samples(parts):
+    merged = new_samples()
+    for part in parts:
+        for key in ("connected", "connect_failed", "frames"):
+            merged[key] += part[key]
+        for key in ("connect_ms", "first_frame_ms", "frame_interval_ms", "jitter_ms"):
+            merged[key].extend(part[key])
+        for command, stats in part["commands"].items():
+            target = merged["commands"][command]
+            for key in ("sent", "completed", "failed", "throttled", "timeouts"):
+                target[key] += stats[key]
+            target["rtt_ms"].extend(stats["rtt_ms"])
+    return merged
+
+
+def run_load_test(options):
+    """Run the load test and return the JSON-serialisable report"""
+    processes = max(1, min(options["processes"], options["clients"]))
+    base, extra = divmod(options["clients"], processes)
+    jobs = [(w, base + (1 if w < extra else 0), options) for w in range(processes)]
+
+    started_at = time.time()
+    wall_start = time.perf_counter()
+    if processes == 1:
+        parts = [load_worker(jobs[0])]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            parts = pool.map(load_worker, jobs)
+    wall = time.perf_counter() - wall_start
+    samples = merge_samples(parts)
+
+    report = {
+        "config": {key: value for key, value in options.items()},
+        "started_at": started_at,
+        "wall_time_s": round(wall, 3),
+        "clients": {
+            "requested": options["clients"],
+            "connected": samples["connected"],
+            "failed": samples["connect_failed"],
+        },
+        "frames": samples["frames"],
+        "connect_ms": percentiles(samples["connect_ms"]),
+        "first_frame_ms": percentiles(samples["first_frame_ms"]),
+        "frame_interval_ms": percentiles(samples["frame_interval_ms"]),
+        "jitter_ms": percentiles(samples["jitter_ms"]),
+        "commands": {},
+    }
+    for command, stats in samples["commands"].items():
+        report["commands"][command] = {
+            "sent": stats["sent"],
+            "completed": stats["completed"],
+            "failed": stats["failed"],
+            "throttled": stats["throttled"],
+            "timeouts": stats["timeouts"],
+            "rtt_ms": percentiles(stats["rtt_ms"]),
+        }
+    return report
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Socket.IO client for the stats agent")
+    sub = parser.add_subparsers(dest="mode")
+
+    demo = sub.add_parser("demo", help="Run the one-shot demo (default)")
+    demo.add_argument("--url", default=SERVER_URL)
+
+    load = sub.add_parser("load", help="Run a load test")
+    load.add_argument("--url", default=SERVER_URL)
+    load.add_argument("--clients", type=int, default=100, help="Total simulated clients")
+    load.add_argument("--processes", type=int, default=max(1, multiprocessing.cpu_count() // 2),
+                      help="Worker processes to spread the clients over")
+    load.add_argument("--duration", type=float, default=30, help="Seconds to hold all clients connected")
+    load.add_argument("--ramp", type=float, default=5, help="Seconds over which clients connect")
+    load.add_argument("--command-rate", type=float, default=0.2,
+                      help="Control commands per second per client (0 disables)")
+    load.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                      help=f"Weighted command mix (default: {DEFAULT_MIX})")
+    load.add_argument("--image", default="nginx", help="Image used for run_container")
+    load.add_argument("--connect-timeout", type=float, default=10)
+    load.add_argument("--reply-timeout", type=float, default=10,
+                      help="Seconds to wait for each command's acknowledgement")
+    load.add_argument("--no-compress", dest="compress", action="store_false",
+                      help="Do not offer WebSocket permessage-deflate")
+    load.add_argument("--seed", type=int, default=1)
+    load.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args(sys.argv[1:])
+    if args.mode == "load":
+        options = {
+            "url": args.url,
+            "clients": args.clients,
+            "processes": args.processes,
+            "duration": args.duration,
+            "ramp": args.ramp,
+            "command_rate": args.command_rate,
+            "mix": args.mix,
+            "image": args.image,
+            "connect_timeout": args.connect_timeout,
+            "reply_timeout": args.reply_timeout,
+            "seed": args.seed,
+            "compress": args.compress,
+        }
+        report = json.dumps(run_load_test(options), indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(report + "\n")
+        else:
+            print(report)
+    else:
+        if args.mode == "demo":
+            SERVER_URL = args.url
+        asyncio.run(main())
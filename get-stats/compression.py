@@ -0,0 +1,114 @@
+"""
+WebSocket permessage-deflate with per-event size thresholds.
+
+aiohttp negotiates permessage-deflate whenever the peer offers it, and then
+deflates every frame, including 300-byte usage_stats ticks where zlib costs
+more CPU than it saves bytes. install() swaps Engine.IO's aiohttp WebSocket
+driver for one that looks at the Socket.IO event name of each outgoing
+packet and sends it as a plain (RSV1 clear) frame unless the packet is at
+least that event's threshold. Long-polling responses keep Engine.IO's own
+http_compression.
+
+Clients opt in by passing CLIENT_OPTIONS as websocket_extra_options.
+"""
+import inspect
+import re
+
+from aiohttp.http_websocket import WebSocketWriter
+from aiohttp.web import WebSocketResponse
+from engineio.async_drivers import aiohttp as eio_aiohttp
+
+
+DEFAULT_THRESHOLD = 1024  # Bytes; events without an entry compress above this
+# Per-event minimum packet size before deflating; None never compresses.
+# A 2-GPU usage_stats tick (~360 bytes) stays plain, an 8-GPU one deflates.
+EVENT_THRESHOLDS = {
+    "usage_stats": 1024,
+    "system_info": 256,  # Once per connection, so no shared window to lean on
+    "container_list": 512,
+    "agent_stats": 1024,
+}
+CLIENT_OPTIONS = {"compress": 15}  # ws_connect() offer: permessage-deflate, 32 KiB window
+
+# '4' (Engine.IO message) + '2'/'5' (Socket.IO event/binary event), then an
+# optional attachment count, namespace and ack id before the JSON array
+_EVENT_RE = re.compile(r'4[25](?:\d+-)?(?:/[^,]*,)?\d*\["((?:[^"\\]|\\.)*)"')
+
+
+def event_name(message):
+    """Socket.IO event name of an outgoing Engine.IO packet, or None"""
+    if isinstance(message, bytes):
+        return None
+    match = _EVENT_RE.match(message)
+    return match.group(1) if match else None
+
+
+class CompressionPolicy:
+    """Per-event thresholds plus frame and byte counts for /metrics"""
+
+    def __init__(self, thresholds=None, default=DEFAULT_THRESHOLD):
+        self.thresholds = dict(EVENT_THRESHOLDS, **(thresholds or {}))  # event -> bytes or None
+        self.default = default
+        self.stats = {}  # (event, compressed) -> [frames, payload bytes]
+
+    def should_compress(self, event, size):
+        threshold = self.thresholds.get(event, self.default)
+        return threshold is not None and size >= threshold
+
+    def record(self, event, compressed, size):
+        entry = self.stats.get((event, compressed))
+        if entry is None:
+            entry = self.stats[(event, compressed)] = [0, 0]
+        entry[0] += 1
+        entry[1] += size
+
+    def series(self):
+        """(labels, frames) and (labels, bytes) pairs for the metrics renderer"""
+        frames, sizes = [], []
+        for (event, compressed), (count, size) in self.stats.items():
+            labels = {"event": event, "compressed": "true" if compressed else "false"}
+            frames.append((labels, count))
+            sizes.append((labels, size))
+        return frames, sizes
+
+
+def websocket_driver(policy):
+    """Engine.IO aiohttp WebSocket driver that compresses according to policy"""
+
+    class ThresholdWebSocket(eio_aiohttp.WebSocket):
+        async def send(self, message):
+            size = len(message)
+            event = event_name(message) or "other"
+            writer = getattr(self._sock, "_writer", None)
+            negotiated = writer is not None and writer.compress
+            if not negotiated or policy.should_compress(event, size):
+                policy.record(event, bool(negotiated), size)
+                return await super().send(message)
+
+            # Engine.IO sends one packet at a time per socket, so the
+            # writer's setting can be switched off for just this frame
+            policy.record(event, False, size)
+            writer.compress = 0
+            try:
+                await super().send(message)
+            finally:
+                writer.compress = negotiated
+
+    return ThresholdWebSocket
+
+
+def install(server, thresholds=None, default=DEFAULT_THRESHOLD):
+    """
+    Use threshold compression for a socketio.AsyncServer; thresholds
+    override EVENT_THRESHOLDS per event. Returns the policy.
+    """
+    drivers = getattr(server.eio, "_async", None)
+    if not isinstance(drivers, dict) or "websocket" not in drivers:
+        raise RuntimeError("Cannot install compression: python-engineio has no AsyncServer._async['websocket'] "
+                           "driver; install the version in requirements.txt")
+    if not hasattr(WebSocketResponse(), "_writer") or "compress" not in inspect.signature(WebSocketWriter).parameters:
+        raise RuntimeError("Cannot install compression: aiohttp's WebSocketResponse._writer or "
+                           "WebSocketWriter.compress is missing; install the version in requirements.txt")
+    policy = CompressionPolicy(thresholds, default)
+    server.eio._async = dict(server.eio._async, websocket=websocket_driver(policy))
+    return policy
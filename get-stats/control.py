@@ -0,0 +1,179 @@
+"""
+Fair scheduling and rate limiting for control commands.
+
+Commands that talk to the Docker daemon (run, list, stop) are blocking
+calls. They run on a small dedicated thread pool, so a flood of them can
+neither block the event loop nor take the threads the sampler uses.
+
+Every client (Socket.IO sid) gets a token bucket; a command costs tokens
+by how hard it is on the daemon. A client whose bucket is empty, or that
+already has max_pending commands waiting, is rejected at once with a
+retry_after instead of queueing without bound. Accepted commands wait in
+a per-client FIFO, and the workers take the next command from the clients
+in round-robin order, so one client's backlog cannot delay another
+client's next command by more than one command per worker.
+
+ResultCache makes commands idempotent by request id: a retry of a request
+that is still running waits for the same result, and one that finished
+gets the cached result instead of running the command again.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import time
+
+
+class Throttled(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    def __init__(self, workers=4, rate=2.0, burst=10, max_pending=8, costs=None):
+        self.workers = workers
+        self.rate = rate  # Tokens per second per client
+        self.burst = burst
+        self.max_pending = max_pending  # Queued (not yet running) commands per client
+        self.costs = dict(costs or {})  # command -> tokens, default 1
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="control")
+        self.buckets = {}  # client -> [tokens, last refill]
+        self.queues = {}  # client -> deque of (command, func, args, future)
+        self.ready = collections.deque()  # Clients with queued commands, in service order
+        self.running = 0
+        self.service_time = 0.0  # EWMA of seconds per command, for retry_after estimates
+        self.completed = 0
+        self.rejected = 0
+
+    def _take(self, client, cost, now):
+        """0 if the client can spend cost tokens now, else seconds until it can"""
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < cost:
+            return (cost - bucket[0]) / self.rate
+        bucket[0] -= cost
+        return 0.0
+
+    async def submit(self, client, command, func, *args):
+        """Run func(*args) on the pool in the client's turn; raises Throttled when over limit"""
+        cost = self.costs.get(command, 1)
+        queue = self.queues.get(client)
+        if queue is not None and len(queue) >= self.max_pending:
+            self.rejected += 1
+            backlog = sum(len(q) for q in self.queues.values()) + self.running
+            raise Throttled("Too many pending commands",
+                            round(max(self.service_time * backlog / self.workers, 1 / self.rate), 2))
+        wait = self._take(client, cost, time.monotonic())
+        if wait:
+            self.rejected += 1
+            raise Throttled(f"Rate limit exceeded for {command}", round(wait, 2))
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self.queues[client] = collections.deque()
+            self.ready.append(client)
+        queue.append((command, func, args, future))
+        self._dispatch()
+        return await future
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.running < self.workers and self.ready:
+            client = self.ready.popleft()
+            queue = self.queues[client]
+            command, func, args, future = queue.popleft()
+            if queue:
+                self.ready.append(client)  # Back of the line
+            else:
+                del self.queues[client]
+            if future.done():
+                continue  # Caller went away
+            self.running += 1
+            started = time.monotonic()
+            job = loop.run_in_executor(self.executor, func, *args)
+            job.add_done_callback(lambda job, future=future, started=started: self._finished(job, future, started))
+
+    def _finished(self, job, future, started):
+        self.running -= 1
+        self.completed += 1
+        self.service_time += 0.2 * (time.monotonic() - started - self.service_time)
+        if not future.done():
+            if job.exception() is not None:
+                future.set_exception(job.exception())
+            else:
+                future.set_result(job.result())
+        self._dispatch()
+
+    def drop(self, client):
+        """Forget a disconnected client: its queued commands are cancelled, running ones finish"""
+        self.buckets.pop(client, None)
+        queue = self.queues.pop(client, None)
+        if queue is None:
+            return
+        self.ready.remove(client)
+        for _, _, _, future in queue:
+            future.cancel()
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "queued": sum(len(q) for q in self.queues.values()),
+            "clients_waiting": len(self.ready),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "service_time_ms": round(self.service_time * 1000, 2),
+        }
+
+
+class ResultCache:
+    """
+    Results of control commands by (client, command, request_id), kept for
+    ttl seconds. client is whoever sent the command, so one client can
+    never be answered with another's result by reusing its request_id.
+    """
+
+    def __init__(self, ttl=300, max_entries=4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()  # key -> [expires, future], oldest first
+        self.hits = 0
+
+    def _expire(self, now):
+        while self.entries:
+            key, (expires, future) = next(iter(self.entries.items()))
+            if expires > now and len(self.entries) <= self.max_entries:
+                break
+            if not future.done():
+                break  # Still running; a retry must not start it again
+            del self.entries[key]
+
+    async def run(self, client, command, request_id, factory, timeout):
+        """
+        Result of factory() for this client's request id, shared with any
+        earlier call for it. Raises asyncio.TimeoutError after timeout
+        seconds; the command keeps running and a retry gets its result.
+        """
+        key = (client, command, request_id)
+        now = time.monotonic()
+        self._expire(now)
+        while True:
+            entry = self.entries.get(key)
+            if entry is None or entry[1].cancelled():
+                entry = self.entries[key] = [now + self.ttl, asyncio.ensure_future(factory())]
+            else:
+                self.hits += 1
+            future = entry[1]
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # This caller was cancelled
+                # The first caller went away before its command ran; run it for this one
+
+    def forget(self, client, command, request_id):
+        """Drop a result that must not be replayed, such as a rate-limit rejection"""
+        self.entries.pop((client, command, request_id), None)
@@ -0,0 +1,72 @@
+"""
+Change-driven telemetry: deadband filtering of sampler snapshots.
+
+Deadband remembers the values of the last snapshot that was published and
+says whether a new snapshot differs from it by more than each metric's
+tolerance. Metrics are named like alert rules: "CPU_Usage" for top-level
+values, "GPUs.Temperature" for a field of every item of a list, with list
+items matched by their identity field (GPU index, disk device, interface).
+A GPU, disk or NIC appearing or disappearing, or any non-numeric value
+changing, always counts as a change, and a snapshot is published anyway
+once max_silence seconds have passed so clients can tell the host is alive.
+
+The reference is flattened into its own dict rather than kept as the
+snapshot, because the sampler reuses per-device row dicts between ticks.
+"""
+import time
+
+
+class Deadband:
+    def __init__(self, tolerances, max_silence, list_keys=None, default=0.0):
+        self.tolerances = dict(tolerances)  # metric -> absolute tolerance
+        self.max_silence = max_silence
+        self.list_keys = dict(list_keys or {})
+        self.default = default  # Tolerance for numeric metrics not listed
+        self.reference = None  # (key, identity, field) -> value at the last publish
+        self.last_published = None
+
+    def _flatten(self, snapshot):
+        flat = {}
+        for key, value in snapshot.items():
+            if isinstance(value, list):
+                identity = self.list_keys.get(key)
+                for position, item in enumerate(value):
+                    if not isinstance(item, dict):
+                        flat[(key, position, None)] = item
+                        continue
+                    subject = item.get(identity, position)
+                    for field, field_value in item.items():
+                        flat[(key, subject, field)] = field_value
+            else:
+                flat[(key, None, None)] = value
+        return flat
+
+    def _differs(self, flat):
+        reference = self.reference
+        if len(flat) != len(reference):
+            return True
+        tolerances = self.tolerances
+        for path, value in flat.items():
+            old = reference.get(path, reference)  # The dict itself as a 'missing' sentinel
+            if old is reference:
+                return True
+            if value == old:
+                continue
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                return True
+            key, subject, field = path
+            metric = key if field is None else f"{key}.{field}"
+            if abs(value - old) > tolerances.get(metric, self.default):
+                return True
+        return False
+
+    def should_publish(self, snapshot, now=None):
+        """True if the snapshot moved past a deadband or max_silence elapsed; records it as published"""
+        now = time.monotonic() if now is None else now
+        flat = self._flatten(snapshot)
+        if (self.reference is not None and now - self.last_published < self.max_silence
+                and not self._differs(flat)):
+            return False
+        self.reference = flat
+        self.last_published = now
+        return True
@@ -1,66 +1,485 @@
+import time
+_process_started = time.monotonic()
+
 import asyncio
+import importlib
+import os
 import socketio
 import json
-import psutil
 import platform
-import GPUtil
 import subprocess
-import requests
-import docker
+import sys
+import threading
+import aiohttp
 from aiohttp import web
-from pyngrok import ngrok
 import datetime
+import random
+import metrics
+import instrumentation
+import compression
+import iostats
+import proctop
+import alerts
+import deadband
+import metering
+import control
+import lanes
+import warmpool
+import reservations
+import topology
+import tracing
+import jsonlog
+
+class LazyModule:
+    """
+    A module imported on first attribute access to keep startup fast.
+
+    The import runs once under a lock, whichever thread gets there first;
+    importlib's LazyLoader is not safe to trigger from several threads at
+    once, and the control workers touch docker and psutil concurrently.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return getattr(module, attr)
+
+def lazy_import(name):
+    """The module if it is already imported, else a LazyModule for it"""
+    return sys.modules.get(name) or LazyModule(name)
+
+# Heavy modules, loaded when first used rather than before the server binds
+psutil = lazy_import("psutil")
+GPUtil = lazy_import("GPUtil")
+docker = lazy_import("docker")
+ngrok = lazy_import("pyngrok.ngrok")
 
 # Create a Socket.IO server
 sio = socketio.AsyncServer(cors_allowed_origins='*', async_mode='aiohttp')
 app = web.Application()
 sio.attach(app)
 
-# Initialize Docker client
-docker_client = docker.from_env()
+# Docker client, connected in the background at startup (see get_docker_client)
+docker_client = None
+_docker_client_lock = threading.Lock()
+
+# Host CPU, NUMA and GPU topology, read on first use (see load_topology)
+host_topology = None
+_topology_lock = threading.Lock()
 
 # Connected clients tracking
 connected_clients = set()
+client_identities = {}  # sid -> whose control results it may replay (see connect)
+
+# Structured, queue-backed logging (configured in __main__)
+log = jsonlog.get_logger("agent")
+
+# Latency histograms, event-loop lag and process stats for the agent itself
+instrument = instrumentation.Instrumentation()
 
 # Cache the system info to avoid recalculating it
 system_info_cache = None
 
+# Latest snapshot from the shared sampler (see sample_usage_loop)
+latest_usage = None
+latest_containers = []
+latest_sample_time = 0.0
+latest_usage_version = 0  # Bumped whenever latest_usage should go out to clients
+
+# Top-N process view, computed by the sampler only while someone subscribes
+latest_top = None
+top_subscribers = set()
+
+# Clients that asked for alert events only, without the usage_stats stream
+alerts_only_clients = set()
+
+# Pre-rendered /metrics body, refreshed once per sampler tick
+metrics_body = b""
+
+# Running totals exposed as Prometheus counters
+agent_counters = {
+    "samples": 0,
+    "sample_errors": 0,
+    "usage_frames_sent": 0,
+    "usage_frames_suppressed": 0,
+    "containers_started": 0,
+    "containers_stopped": 0,
+    "containers_updated": 0,
+    "registrations_sent": 0,
+    "registration_failures": 0,
+    "alerts_fired": 0,
+    "meter_errors": 0,
+    "compute_app_queries": 0,
+}
+
 # Configuration
 SERVER_NOTIFICATION_URL = "https://theweb3rental.vercel.app/api/ngrok"  # Replace with your server URL
+PORT = int(os.environ.get("AGENT_PORT", 8765))
+PUBLIC_URL = os.environ.get("AGENT_PUBLIC_URL")  # Register this URL instead of opening an ngrok tunnel
+USAGE_INTERVAL = 2  # Seconds between sampler ticks and usage_stats frames
+HEARTBEAT_INTERVAL = 30  # Seconds between registrations while healthy
+HEARTBEAT_BACKOFF_BASE = 1  # First retry delay after a failed registration
+HEARTBEAT_BACKOFF_MAX = 120  # Upper bound for the retry delay
+# Connection-scale mode for thousands of mostly idle dashboards: no task per
+# client, one usage_stats broadcast per tick to TELEMETRY_ROOM, slower pings
+CONNECTION_SCALE = os.environ.get("AGENT_CONNECTION_SCALE") == "1"
+TELEMETRY_ROOM = "telemetry"
+SCALE_PING_INTERVAL = 60  # Seconds; Engine.IO's default is 25
+PROC_ROOT = os.environ.get("AGENT_PROC_ROOT", "/proc")  # Host procfs; set when the agent runs in a container
+TOP_N = 10  # Processes and containers per list in a top frame
+TOP_ROOM = "top"
+ALERTS_ROOM = "alerts"
+# Deadband mode: usage_stats goes out only when a metric moves past its
+# tolerance below (absolute, in the metric's unit; unlisted numbers on any
+# change), or after DEADBAND_MAX_SILENCE seconds without a frame
+DEADBAND = os.environ.get("AGENT_DEADBAND") == "1"
+DEADBAND_MAX_SILENCE = 30
+DEADBAND_TOLERANCES = {
+    "CPU_Usage": 2.0,
+    "Memory_Usage": 0.5,
+    "Disk_Usage": 0.5,
+    "GPU_Usage": 2.0,
+    "GPU_Memory_Usage": 2.0,
+    "GPUs.Usage": 2.0,
+    "GPUs.Memory_Usage": 2.0,
+    "GPUs.Memory_Used": 256,  # MiB
+    "GPUs.Temperature": 1,
+    "Disks.Read_Bytes_Per_Sec": 1 << 20,
+    "Disks.Write_Bytes_Per_Sec": 1 << 20,
+    "Disks.Read_IOPS": 20,
+    "Disks.Write_IOPS": 20,
+    "NICs.Rx_Bytes_Per_Sec": 128 << 10,
+    "NICs.Tx_Bytes_Per_Sec": 128 << 10,
+    "Container_GPUs.GPU_Usage": 2.0,
+    "Container_GPUs.GPU_Memory_Used": 256,  # MiB
+    "Container_IO.Read_Bytes_Per_Sec": 1 << 20,
+    "Container_IO.Write_Bytes_Per_Sec": 1 << 20,
+    "Container_IO.Read_IOPS": 20,
+    "Container_IO.Write_IOPS": 20,
+    "Container_IO.IO_Stall_Seconds": 1.0,
+    "Container_IO.PIDs": 4,
+}
+
+# Alert rules over usage_stats fields; "GPUs.Temperature" applies to every
+# GPU separately. AGENT_ALERT_RULES may name a JSON file with a replacement list.
+ALERT_RULES = [
+    {"name": "gpu_temperature_high", "metric": "GPUs.Temperature", "threshold": 90, "duration": 30,
+     "hysteresis": 5, "ewma_alpha": 0.5, "severity": "critical"},
+    {"name": "gpu_memory_full", "metric": "GPUs.Memory_Usage", "threshold": 98, "duration": 60,
+     "hysteresis": 5, "ewma_alpha": 0.5},
+    {"name": "memory_high", "metric": "Memory_Usage", "threshold": 95, "duration": 10,
+     "hysteresis": 3, "ewma_alpha": 0.5, "severity": "critical"},
+    {"name": "cpu_saturated", "metric": "CPU_Usage", "threshold": 98, "duration": 60,
+     "hysteresis": 5, "ewma_alpha": 0.3},
+    {"name": "disk_full", "metric": "Disk_Usage", "threshold": 95, "hysteresis": 2, "severity": "critical"},
+]
+ALERT_RULES_FILE = os.environ.get("AGENT_ALERT_RULES")
+ALERT_EXPIRE_SAMPLES = 3  # A subject missing from this many samples in a row (a removed GPU) is resolved
+FREE_GPU_UTILIZATION = 10  # A GPU below this core and memory utilization (%) counts as free
+
+# Per-event log rate limits (records per second, burst) so a reconnect
+# storm logs a burst and then a trickle instead of a flood
+LOG_RATE_LIMITS = {
+    "client_connected": (2.0, 20),
+    "client_disconnected": (2.0, 20),
+    "system_info_sent": (1.0, 10),
+    "usage_updates_error": (1.0, 10),
+    "control_throttled": (1.0, 10),
+    "warm_pool_error": (0.2, 5),
+}
+# Log 1 in N of the info events a reconnect or command storm repeats per client
+LOG_SAMPLES = {"client_connected": 10, "client_disconnected": 10, "control_throttled": 10}
+
+# Per-event overrides of compression.EVENT_THRESHOLDS: minimum packet size in
+# bytes before a WebSocket frame is deflated, or None to never compress
+COMPRESSION_THRESHOLDS = {}
+
+# Priority lanes: command results, alerts and pings go out ahead of queued
+# telemetry, and a queued telemetry frame is replaced by a newer one
+PRIORITY_LANES = os.environ.get("AGENT_PRIORITY_LANES", "1") == "1"
+TELEMETRY_EVENTS = ("usage_stats", "top")
+SEND_BUFFER_BYTES = 8192  # Unsent bytes the kernel, and again the transport, may hold per client
+
+# Disks and NICs reported with I/O rates. *_DEVICES (regex) restricts to
+# matching names; the exclude patterns skip partitions and virtual devices
+DISK_DEVICES = os.environ.get("AGENT_DISK_DEVICES")
+DISK_EXCLUDE = r"^(loop|ram|zram|sr|fd)\d+$|^(sd|vd|xvd|hd)[a-z]+\d+$|^(nvme\d+n\d+|mmcblk\d+)p\d+$"
+NET_DEVICES = os.environ.get("AGENT_NET_DEVICES")
+NET_EXCLUDE = r"^(lo|ifb\d+|veth.*|docker\d+|br-[0-9a-f]+|virbr\d+.*)$"
+
+# Rental metering (see metering.py): cgroup counters per container, an
+# append-only ledger of cumulative totals, one record per container per
+# METER_RECORD_INTERVAL and one fsync per METER_COMMIT_INTERVAL at most.
+# Every METER_COMPACT_INTERVAL, containers stopped for over METER_RETENTION
+# are forgotten and the ledger is compacted to the retained window
+CGROUP_ROOT = os.environ.get("AGENT_CGROUP_ROOT", "/sys/fs/cgroup")
+# Next to the agent by default, not in whatever directory it was started from,
+# so a restart elsewhere keeps the billing history
+METER_LEDGER = os.environ.get("AGENT_METER_LEDGER",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "metering.jsonl"))
+METER_RECORD_INTERVAL = 60  # Seconds; also the time resolution of usage reports
+METER_COMMIT_INTERVAL = 5
+METER_RETENTION = 7 * 86400  # Seconds of history usage reports cover
+METER_COMPACT_INTERVAL = 3600
+
+# Control commands (run/list/stop/update containers) run on their own worker pool,
+# round-robin between clients. Each client gets CONTROL_RATE tokens per
+# second up to CONTROL_BURST; a command costs CONTROL_COSTS tokens (default 1)
+CONTROL_WORKERS = 4
+CONTROL_RATE = 2.0
+CONTROL_BURST = 10
+CONTROL_MAX_PENDING = 8  # Queued commands per client before rejecting
+CONTROL_COSTS = {"run_container": 4, "stop_container_request": 2, "update_container": 1, "list_containers": 1}
+# Commands that carry a request_id are answered by acknowledgement within
+# CONTROL_TIMEOUTS seconds (a slower command keeps running), and their result
+# is kept CONTROL_RESULT_TTL seconds so a retry after a reconnect replays it
+CONTROL_TIMEOUTS = {"run_container": 120, "stop_container_request": 30, "update_container": 15, "list_containers": 15}
+CONTROL_RESULT_TTL = 300
+
+# Warm pool (see warmpool.py): a JSON list of profiles in AGENT_WARM_POOL, e.g.
+# [{"name": "torch", "image": "pytorch/pytorch:latest", "gpu_count": 1, "size": 2}]
+WARM_POOL_PROFILES = json.loads(os.environ.get("AGENT_WARM_POOL") or "[]")
+WARM_POOL_INTERVAL = 2  # Seconds between top-ups
+
+# Reservation accounting for in-place resizes (see reservations.py). Above 1,
+# the CPU quotas or memory limits of running containers may add up to more
+# than the host has
+CPU_OVERCOMMIT = float(os.environ.get("AGENT_CPU_OVERCOMMIT", "1"))
+MEMORY_OVERCOMMIT = float(os.environ.get("AGENT_MEMORY_OVERCOMMIT", "1"))
+
+# Topology (see topology.py) is read from the host's sysfs. With CPU_PINNING,
+# a container with a cpu_count gets exclusive cpuset_cpus/cpuset_mems on the
+# NUMA nodes of its GPUs
+SYSFS_ROOT = os.environ.get("AGENT_SYSFS_ROOT", "/sys")
+CPU_PINNING = os.environ.get("AGENT_CPU_PINNING") == "1"
+
+# Per-container block I/O and PID limits (see io_limit_options). Device
+# limits name whole disks; AGENT_DISK_CAPACITY may give what each disk can
+# do, and a limit above that is refused, e.g.
+# {"nvme0n1": {"read_bps": "3g", "write_bps": "2g", "read_iops": 500000, "write_iops": 200000}}
+DISK_CAPACITY = json.loads(os.environ.get("AGENT_DISK_CAPACITY") or "{}")
+DEVICE_LIMIT_KEYS = ("device_read_bps", "device_write_bps", "device_read_iops", "device_write_iops")
+DEFAULT_PID_MAX = 4194304  # Linux's ceiling, when PROC_ROOT does not say
+
+# With AGENT_TRACE set to a file, every inbound event and sampler snapshot is
+# recorded there for bench/replay.py (see tracing.py)
+TRACE_PATH = os.environ.get("AGENT_TRACE")
+TRACE_FLUSH_INTERVAL = 1  # Seconds between compressed batches
+
+# Identity field of the items in each usage_stats list
+USAGE_LIST_KEYS = {"GPUs": "Index", "Disks": "Device", "NICs": "Interface", "Container_GPUs": "Container_ID",
+                   "Container_IO": "Container_ID"}
+
+# Fields read from nvidia-smi for every GPU, in column order
+GPU_QUERY_FIELDS = [
+    "index",
+    "name",
+    "utilization.gpu",
+    "utilization.memory",
+    "memory.used",
+    "memory.total",
+    "temperature.gpu",
+    "uuid",
+]
+
+# Fields read from nvidia-smi once, to find each GPU's NUMA node
+GPU_TOPOLOGY_FIELDS = ["index", "uuid", "pci.bus_id"]
+
+# Fields read from nvidia-smi for every process with a GPU context
+COMPUTE_APP_FIELDS = ["pid", "gpu_uuid", "used_memory"]
+# The compute apps cost a second nvidia-smi spawn, so they are queried again
+# only when a GPU's memory.used moves by this many MiB (a process started,
+# exited or grew) or the last list is COMPUTE_APPS_MAX_AGE seconds old
+COMPUTE_APPS_MEMORY_DELTA = 16
+COMPUTE_APPS_MAX_AGE = 10
+
+# Per-device throughput from counter deltas, advanced once per sampler tick
+disk_rates = iostats.IoRates({
+    "Read_Bytes_Per_Sec": "read_bytes",
+    "Write_Bytes_Per_Sec": "write_bytes",
+    "Read_IOPS": "read_count",
+    "Write_IOPS": "write_count",
+}, "Device", iostats.DeviceFilter(DISK_DEVICES, DISK_EXCLUDE))
+# Per-container block I/O rates from cgroup counters (see read_container_io)
+container_io_rates = iostats.IoRates({
+    "Read_Bytes_Per_Sec": "read_bytes",
+    "Write_Bytes_Per_Sec": "write_bytes",
+    "Read_IOPS": "read_count",
+    "Write_IOPS": "write_count",
+}, "Container_ID")
+net_rates = iostats.IoRates({
+    "Rx_Bytes_Per_Sec": "bytes_recv",
+    "Tx_Bytes_Per_Sec": "bytes_sent",
+}, "Interface", iostats.DeviceFilter(NET_DEVICES, NET_EXCLUDE))
+
+def load_alert_rules():
+    if not ALERT_RULES_FILE:
+        return ALERT_RULES
+    with open(ALERT_RULES_FILE) as f:
+        return json.load(f)
+
+# Alert state per rule and GPU/disk/NIC, advanced once per sampler tick
+alert_engine = alerts.AlertEngine(load_alert_rules(), list_keys=USAGE_LIST_KEYS, expire_after=ALERT_EXPIRE_SAMPLES)
+
+# Last published usage values, when DEADBAND is on
+usage_deadband = deadband.Deadband(DEADBAND_TOLERANCES, DEADBAND_MAX_SILENCE, list_keys=USAGE_LIST_KEYS)
+
+# Per-container CPU-seconds, GPU-seconds and memory GB-hours, integrated every sampler tick
+cgroup_reader = metering.CgroupReader(CGROUP_ROOT)
+meter_ledger = metering.Ledger(METER_LEDGER)
+meter = metering.Meter(meter_ledger, METER_RECORD_INTERVAL, max_gap=5 * USAGE_INTERVAL, retention=METER_RETENTION)
+container_grants = {}  # container id -> (GPUs in its device requests, start time), inspected once
+container_io_totals = {}  # container id -> latest metering.IoStats, for /metrics
+
+# Fair queuing and rate limiting for Docker commands (see control.py)
+control_scheduler = control.FairScheduler(CONTROL_WORKERS, CONTROL_RATE, CONTROL_BURST, CONTROL_MAX_PENDING,
+                                          CONTROL_COSTS)
+control_results = control.ResultCache(CONTROL_RESULT_TTL)
+
+# CPU, memory and cpusets promised to running containers (see reservations.py)
+reservation_book = reservations.Book(lambda: (load_topology().cpus, psutil.virtual_memory().total),
+                                     CPU_OVERCOMMIT, MEMORY_OVERCOMMIT)
+
+# Container of each GPU process, cached while the process lives
+gpu_container_map = proctop.ContainerMap(PROC_ROOT)
+
+# Per-PID CPU and RSS between sampler ticks (see proctop.py)
+process_table = proctop.ProcessTable(PROC_ROOT)
+
+# Deflate large frames only (see compression.py)
+ws_compression = compression.install(sio, COMPRESSION_THRESHOLDS)
+
+# Per-client outbound lanes (see lanes.py)
+outbound_lanes = lanes.install(sio, TELEMETRY_EVENTS, SEND_BUFFER_BYTES) if PRIORITY_LANES else None
+
+# Record-and-replay trace of inbound traffic (see tracing.py)
+trace_writer = tracing.TraceWriter(TRACE_PATH) if TRACE_PATH else None
+if trace_writer is not None:
+    tracing.install(sio, trace_writer)
+
+if CONNECTION_SCALE:
+    sio.eio.ping_interval = SCALE_PING_INTERVAL
+
+def get_docker_client():
+    """Connect to the Docker daemon on first use (blocking; call from a thread)"""
+    global docker_client
+    if docker_client is None:
+        with _docker_client_lock:
+            if docker_client is None:
+                docker_client = docker.from_env()
+    return docker_client
+
+def query_gpu_bus_ids():
+    """(index, UUID, PCI bus id) of every GPU (blocking)"""
+    try:
+        output = subprocess.run(
+            ["nvidia-smi", "--query-gpu=" + ",".join(GPU_TOPOLOGY_FIELDS), "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=30,
+        ).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return []  # No nvidia-smi on this host
+    rows = []
+    for line in output.splitlines():
+        values = [value.strip() for value in line.split(',')]
+        if len(values) == len(GPU_TOPOLOGY_FIELDS) and values[0].isdigit():
+            rows.append(tuple(values))
+    return rows
+
+def load_topology():
+    """Read the host topology on first use (blocking; call from a thread)"""
+    global host_topology
+    if host_topology is None:
+        with _topology_lock:
+            if host_topology is None:
+                host_topology = topology.read_topology(SYSFS_ROOT, query_gpu_bus_ids())
+    return host_topology
 
 # Start ngrok and expose server
 def start_ngrok(port):
     public_url = ngrok.connect(port, "http").public_url
-    print(f"Ngrok tunnel created: {public_url}")
-    
-    # Send the URL to your server
-    send_url_to_server(public_url)
-    
+    log.info("ngrok_tunnel_created", public_url=public_url)
     return public_url
 
-def send_url_to_server(url):
-    """Send the ngrok URL to your server for tracking"""
+def load_summary():
+    """Tiny load summary from the latest sample, piggybacked on registration"""
+    usage = latest_usage or {}
+    free_gpus = [
+        gpu for gpu in usage.get("GPUs", [])
+        if gpu["Usage"] < FREE_GPU_UTILIZATION and gpu["Memory_Usage"] < FREE_GPU_UTILIZATION
+    ]
+    free_gpu_models = {}
+    for gpu in free_gpus:
+        free_gpu_models[gpu["Name"]] = free_gpu_models.get(gpu["Name"], 0) + 1
+    return {
+        "free_gpus": len(free_gpus),
+        "free_gpu_models": free_gpu_models,
+        "gpu_count": len(usage.get("GPUs", [])),
+        "free_ram_gb": round(psutil.virtual_memory().available / (1024 ** 3), 2),
+        "cpu_threads": psutil.cpu_count(logical=True),
+        "cpu_percent": usage.get("CPU_Usage"),
+        "container_count": len(latest_containers),
+    }
+
+def registration_payload(url):
+    return {
+        "ngrok_url": url,
+        "timestamp": str(datetime.datetime.now()),
+        "machine_id": platform.node(),  # Use hostname as machine identifier
+        "load": load_summary(),
+    }
+
+async def send_registration(session, url):
+    """POST the public URL to the registry; True when it was accepted"""
+    payload = registration_payload(url)
+    log.debug("registration_sending", payload=payload)
     try:
-        payload = {
-            "ngrok_url": url,
-            "timestamp": str(datetime.datetime.now()),
-            "machine_id": platform.node()  # Use hostname as machine identifier
-        }
-        
-        print(f"Sending payload to server: {payload}")
-        
-        headers = {"Content-Type": "application/json"}
-        response = requests.post(SERVER_NOTIFICATION_URL, json=payload, headers=headers, timeout=10)
-        
-        print(f"Server response: Status={response.status_code}, Body={response.text}")
-        
-        if response.status_code == 200:
-            print(f"Successfully sent URL to server: {url}")
-        else:
-            print(f"Failed to send URL to server. Status code: {response.status_code}")
-    except Exception as e:
-        print(f"Error sending URL to server: {e}")
-        
+        async with session.post(SERVER_NOTIFICATION_URL, json=payload) as response:
+            body = await response.text()
+            log.debug("registration_response", status=response.status, body=body)
+            if response.status == 200:
+                agent_counters["registrations_sent"] += 1
+                return True
+            log.warning("registration_failed", url=url, status=response.status)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        log.warning("registration_error", url=url, error=str(e) or type(e).__name__)
+    agent_counters["registration_failures"] += 1
+    return False
+
+def next_heartbeat_delay(failures):
+    """Jittered interval while healthy, jittered exponential backoff while failing"""
+    if not failures:
+        return HEARTBEAT_INTERVAL * random.uniform(0.9, 1.1)
+    cap = min(HEARTBEAT_BACKOFF_MAX, HEARTBEAT_BACKOFF_BASE * 2 ** failures)
+    return random.uniform(HEARTBEAT_BACKOFF_BASE, cap)
+
+async def registration_heartbeat(url):
+    """Keep the public URL registered for as long as the agent runs"""
+    timeout = aiohttp.ClientTimeout(total=10)
+    # One kept-alive connection to the registry for every heartbeat
+    connector = aiohttp.TCPConnector(limit=1, keepalive_timeout=HEARTBEAT_INTERVAL + 15)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        failures = 0
+        registered = False
+        while True:
+            if await send_registration(session, url):
+                if not registered or failures:
+                    log.info("registration_sent", url=url, retries=failures, startup_ms=startup_ms())
+                registered = True
+                failures = 0
+            else:
+                failures += 1
+            await asyncio.sleep(next_heartbeat_delay(failures))
+
+@instrument.collector
 async def get_system_info():
     """Fetch system information (sent once)."""
     global system_info_cache
@@ -76,33 +495,169 @@ async def get_system_info():
         "Threads": psutil.cpu_count(logical=True),
         "RAM": round(psutil.virtual_memory().total / (1024 ** 3), 2),
     }
-    gpus = GPUtil.getGPUs()
+    gpus, host = await asyncio.gather(asyncio.to_thread(GPUtil.getGPUs),  # Runs nvidia-smi
+                                      asyncio.to_thread(load_topology), return_exceptions=True)
+    if isinstance(gpus, Exception):
+        raise gpus
+    if isinstance(host, Exception):
+        log.warning("topology_error", sysfs_root=SYSFS_ROOT, error=str(host))
+        host = None
+    else:
+        info.update(host.as_dict())
     if gpus:
-        info["GPU"] = [{"Name": gpu.name, "Memory": gpu.memoryTotal} for gpu in gpus]
+        info["GPU"] = [{"Name": gpu.name, "Memory": gpu.memoryTotal,
+                        "NUMA_Node": host.gpus.get(str(gpu.id)) if host else None} for gpu in gpus]
     
     # Cache the result
     system_info_cache = info
     return info
 
+def _number(value):
+    """Parse an nvidia-smi value, treating [N/A] and friends as 0"""
+    try:
+        return float(value)
+    except ValueError:
+        return 0
+
+@instrument.collector
+async def query_gpus():
+    """Read per-GPU utilization from nvidia-smi without blocking the event loop"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "nvidia-smi",
+            "--query-gpu=" + ",".join(GPU_QUERY_FIELDS),
+            "--format=csv,noheader,nounits",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+    except OSError:
+        return []  # No nvidia-smi on this host
+
+    gpus = []
+    for line in stdout.decode(errors="replace").splitlines():
+        values = [value.strip() for value in line.split(',')]
+        if len(values) != len(GPU_QUERY_FIELDS):
+            continue
+        gpus.append({
+            "Index": int(_number(values[0])),
+            "Name": values[1],
+            "Usage": _number(values[2]),
+            "Memory_Usage": _number(values[3]),
+            "Memory_Used": _number(values[4]),
+            "Memory_Total": _number(values[5]),
+            "Temperature": _number(values[6]),
+            "UUID": values[7],
+        })
+    return gpus
+
+@instrument.collector
+async def query_compute_apps():
+    """(pid, GPU UUID, used MiB) for every process running on a GPU"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "nvidia-smi",
+            "--query-compute-apps=" + ",".join(COMPUTE_APP_FIELDS),
+            "--format=csv,noheader,nounits",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+    except OSError:
+        return []
+
+    apps = []
+    for line in stdout.decode(errors="replace").splitlines():
+        values = [value.strip() for value in line.split(',')]
+        if len(values) != len(COMPUTE_APP_FIELDS) or not values[0].isdigit():
+            continue
+        apps.append((int(values[0]), values[1], _number(values[2])))
+    return apps
+
+compute_apps_cache = {"apps": [], "memory_used": None, "at": 0.0}
+
+async def current_compute_apps(gpus):
+    """query_compute_apps(), reused while no GPU's memory use has moved (see COMPUTE_APPS_MEMORY_DELTA)"""
+    if not gpus:
+        return []
+    now = time.monotonic()
+    memory_used = {gpu["UUID"]: gpu["Memory_Used"] for gpu in gpus}
+    previous = compute_apps_cache["memory_used"]
+    if (previous is not None and previous.keys() == memory_used.keys()
+            and now - compute_apps_cache["at"] < COMPUTE_APPS_MAX_AGE
+            and all(abs(used - previous[uuid]) < COMPUTE_APPS_MEMORY_DELTA for uuid, used in memory_used.items())):
+        return compute_apps_cache["apps"]
+    apps = await query_compute_apps()
+    agent_counters["compute_app_queries"] += 1
+    compute_apps_cache.update(apps=apps, memory_used=memory_used, at=now)
+    return apps
+
+def container_gpu_usage(gpus, apps):
+    """
+    Per-container GPU memory and utilization from nvidia-smi's compute apps.
+
+    PIDs resolve to containers through their cgroup (cached per process).
+    A GPU's utilization is split between the containers on it by their
+    share of the GPU memory its processes use, which is exact for the usual
+    one-renter-per-GPU case and an estimate when a GPU is shared.
+    """
+    by_uuid = {gpu["UUID"]: gpu for gpu in gpus}
+    gpu_memory = {}  # uuid -> [MiB, processes] over all processes
+    per_container = {}  # container id -> {uuid: [MiB, processes]}
+    for pid, uuid, used in apps:
+        total = gpu_memory.setdefault(uuid, [0, 0])
+        total[0] += used
+        total[1] += 1
+        container_id = gpu_container_map.lookup(pid)
+        if container_id is None:
+            continue  # Host process
+        entry = per_container.setdefault(container_id, {}).setdefault(uuid, [0, 0])
+        entry[0] += used
+        entry[1] += 1
+    gpu_container_map.retain([pid for pid, _, _ in apps])
+
+    names = {c['id']: c['name'] for c in latest_containers}
+    rows = []
+    for container_id, on_gpus in per_container.items():
+        memory = utilization = 0.0
+        indices = []
+        processes = 0
+        for uuid, (used, count) in on_gpus.items():
+            memory += used
+            processes += count
+            gpu = by_uuid.get(uuid)
+            if gpu is None:
+                continue
+            indices.append(gpu["Index"])
+            total_used, total_count = gpu_memory[uuid]
+            share = used / total_used if total_used else count / total_count
+            utilization += gpu["Usage"] * share
+        rows.append({
+            "Container_ID": container_id,
+            "Container_Name": names.get(container_id),
+            "GPUs": sorted(indices),
+            "GPU_Usage": round(utilization, 1),
+            "GPU_Memory_Used": memory,
+            "Processes": processes,
+        })
+    rows.sort(key=lambda row: row["Container_ID"])
+    return rows
+
+@instrument.collector
 async def get_usage():
     """Fetch real-time usage statistics."""
-    try:
-        command = "nvidia-smi --query-gpu=utilization.gpu,utilization.memory --format=csv"
-        result = subprocess.run(command, capture_output=True, text=True, shell=True)
-        gpu_util, gpu_mem_util = 0, 0
-        if result.stdout:
-            lines = result.stdout.strip().split('\n')
-            if len(lines) > 1:
-                values = lines[1].split(',')
-                if len(values) >= 2:
-                    gpu_util = float(values[0].strip().replace('%', '')) if values[0].strip().replace('%', '').isdigit() else 0
-                    gpu_mem_util = float(values[1].strip().replace('%', '')) if values[1].strip().replace('%', '').isdigit() else 0
-    except:
-        gpu_util, gpu_mem_util = 0, 0
-    
-    cpu_usage = psutil.cpu_percent(interval=0.1)
+    gpus = await query_gpus()
+    apps = await current_compute_apps(gpus)
+    gpu_util = gpus[0]["Usage"] if gpus else 0
+    gpu_mem_util = gpus[0]["Memory_Usage"] if gpus else 0
+
+    # Non-blocking: CPU usage since the previous call (the sampler primes it)
+    cpu_usage = psutil.cpu_percent(interval=None)
     memory = psutil.virtual_memory()
     disk = psutil.disk_usage('/')
+    now = time.monotonic()
+    disks = disk_rates.update(psutil.disk_io_counters(perdisk=True, nowrap=False) or {}, now)
+    nics = net_rates.update(psutil.net_io_counters(pernic=True, nowrap=False) or {}, now)
 
     usage = {
         "CPU_Usage": cpu_usage,
@@ -110,9 +665,135 @@ async def get_usage():
         "Disk_Usage": disk.percent,
         "GPU_Usage": gpu_util,
         "GPU_Memory_Usage": gpu_mem_util,
+        "GPUs": gpus,
+        "Disks": disks,
+        "NICs": nics,
+        "Container_GPUs": container_gpu_usage(gpus, apps) if apps else [],
     }
     return usage
 
+def container_options(resource_limits):
+    """containers.create()/run() keyword arguments for GPU, CPU and memory limits"""
+    # Prepare device requests for GPUs
+    device_requests = []
+    if resource_limits.get('gpu_count', 0) > 0:
+        # Specific GPU devices requested
+        if 'gpu_devices' in resource_limits and resource_limits['gpu_devices']:
+            device_ids = resource_limits['gpu_devices']
+            device_requests.append(
+                docker.types.DeviceRequest(
+                    count=-1,  # Use all specified devices
+                    device_ids=device_ids,
+                    capabilities=[['gpu']]
+                )
+            )
+        else:
+            # Just request a number of GPUs
+            device_requests.append(
+                docker.types.DeviceRequest(
+                    count=resource_limits['gpu_count'],
+                    capabilities=[['gpu']]
+                )
+            )
+    
+    # Prepare CPU and memory limits
+    cpu_count = resource_limits.get('cpu_count', 0)
+    memory_limit = resource_limits.get('memory', '1g')
+    
+    # Convert CPU count to CPU period and quota
+    cpu_period = 100000  # Default in Docker
+    cpu_quota = int(cpu_period * cpu_count) if cpu_count > 0 else -1
+    
+    options = {
+        'device_requests': device_requests,
+        'mem_limit': memory_limit,
+        'cpu_period': cpu_period,
+        'cpu_quota': cpu_quota,
+    }
+    # Pinning, as given or chosen by run_docker_container
+    for key in ('cpuset_cpus', 'cpuset_mems'):
+        if resource_limits.get(key):
+            options[key] = resource_limits[key]
+    options.update(io_limit_options(resource_limits))
+    return options
+
+def io_limit_options(resource_limits):
+    """
+    containers.create()/run() keyword arguments for blkio_weight, the
+    device_{read,write}_{bps,iops} limits and pids_limit. Device limits take
+    {"/dev/nvme0n1": rate} or Docker's [{"Path": ..., "Rate": ...}]; bps
+    rates may be strings like '200m'. Raises ValueError for a limit this
+    host cannot apply.
+    """
+    options = {}
+    weight = resource_limits.get('blkio_weight')
+    if weight is not None:
+        if not 10 <= int(weight) <= 1000:
+            raise ValueError(f"blkio_weight must be between 10 and 1000: {weight}")
+        options['blkio_weight'] = int(weight)
+
+    for key in DEVICE_LIMIT_KEYS:
+        limits = resource_limits.get(key)
+        if not limits:
+            continue
+        if isinstance(limits, dict):
+            limits = [{'Path': path, 'Rate': rate} for path, rate in limits.items()]
+        bps = key.endswith('_bps')
+        throttles = []
+        for limit in limits:
+            path = limit['Path']
+            device = os.path.basename(os.path.realpath(path))
+            # The kernel throttles whole disks only; partitions are not under /sys/block
+            if not os.path.isdir(os.path.join(SYSFS_ROOT, 'block', device)):
+                raise ValueError(f"{key}: {path} is not a disk on this host")
+            rate = docker.utils.parse_bytes(limit['Rate']) if bps else int(limit['Rate'])
+            if rate <= 0:
+                raise ValueError(f"{key}: the rate for {path} must be positive")
+            capacity = DISK_CAPACITY.get(device, {}).get(key[len('device_'):])
+            if capacity is not None:
+                capacity = docker.utils.parse_bytes(capacity) if bps else int(capacity)
+                if rate > capacity:
+                    raise ValueError(f"{key}: {limit['Rate']} for {path} is more than the disk's {capacity}")
+            throttles.append({'Path': path, 'Rate': rate})
+        options[key] = throttles
+
+    pids_limit = resource_limits.get('pids_limit')
+    if pids_limit is not None:
+        try:
+            with open(os.path.join(PROC_ROOT, 'sys', 'kernel', 'pid_max')) as f:
+                pid_max = int(f.read())
+        except (OSError, ValueError):
+            pid_max = DEFAULT_PID_MAX
+        if not 0 < int(pids_limit) <= pid_max:
+            raise ValueError(f"pids_limit must be between 1 and the host's pid_max of {pid_max}: {pids_limit}")
+        options['pids_limit'] = int(pids_limit)
+    return options
+
+# Pre-created containers for fast starts (see warmpool.py)
+warm_pool = warmpool.WarmPool(WARM_POOL_PROFILES, get_docker_client, container_options) if WARM_POOL_PROFILES else None
+
+def start_container(image, resource_limits, container_name=None):
+    """Claim a warm pool container or run a new one; returns (container, from the pool)"""
+    profile = warm_pool.match(image, resource_limits) if warm_pool else None
+    if profile is not None:
+        try:
+            container = warm_pool.claim(profile, resource_limits, container_name)
+            if container is not None:
+                return container, True
+        except Exception as e:
+            log.warning("warm_pool_error", profile=profile["name"], error=str(e))
+    # Create and run the container
+    container = get_docker_client().containers.run(
+        image,
+        name=container_name,
+        detach=True,
+        stdin_open=True,       # Keep STDIN open (important for interactive mode)
+        tty=True,
+        **container_options(resource_limits),
+    )
+    return container, False
+
+@instrument.collector
 def run_docker_container(image, resource_limits, container_name=None):
     """
     Run a Docker container with specified resource limits
@@ -124,54 +805,50 @@ def run_docker_container(image, resource_limits, container_name=None):
         - memory: Memory limit (e.g., '2g')
         - gpu_count: Number of GPUs to use
         - gpu_devices: List of specific GPU device IDs to use (optional)
+        - cpuset_cpus, cpuset_mems: CPUs and NUMA nodes to pin to (optional;
+          chosen next to the GPUs when CPU pinning is on)
+        - blkio_weight: Relative block I/O weight, 10-1000 (optional)
+        - device_read_bps, device_write_bps, device_read_iops,
+          device_write_iops: Per-disk limits, e.g. {'/dev/nvme0n1': '200m'} (optional)
+        - pids_limit: Maximum number of processes and threads (optional)
     container_name (str): Optional name for the container
     
     Returns:
     dict: Container information
     """
     try:
-        # Prepare device requests for GPUs
-        device_requests = []
-        if resource_limits.get('gpu_count', 0) > 0:
-            # Specific GPU devices requested
-            if 'gpu_devices' in resource_limits and resource_limits['gpu_devices']:
-                device_ids = resource_limits['gpu_devices']
-                device_requests.append(
-                    docker.types.DeviceRequest(
-                        count=-1,  # Use all specified devices
-                        device_ids=device_ids,
-                        capabilities=[['gpu']]
-                    )
-                )
-            else:
-                # Just request a number of GPUs
-                device_requests.append(
-                    docker.types.DeviceRequest(
-                        count=resource_limits['gpu_count'],
-                        capabilities=[['gpu']]
-                    )
-                )
-        
-        # Prepare CPU and memory limits
-        cpu_count = resource_limits.get('cpu_count', 0)
-        memory_limit = resource_limits.get('memory', '1g')
-        
-        # Convert CPU count to CPU period and quota
-        cpu_period = 100000  # Default in Docker
-        cpu_quota = int(cpu_period * cpu_count) if cpu_count > 0 else -1
-        
-        # Create and run the container
-        container = docker_client.containers.run(
-            image,
-            name=container_name,
-            detach=True,
-            device_requests=device_requests,
-            mem_limit=memory_limit,
-            cpu_period=cpu_period,
-            cpu_quota=cpu_quota,
-            stdin_open=True,       # Keep STDIN open (important for interactive mode)
-            tty=True,
-        )
+        hold = None
+        if (CPU_PINNING and resource_limits.get('cpu_count', 0) > 0) or resource_limits.get('cpuset_cpus'):
+            # Choose or check the cpuset and hold it under the book's lock,
+            # so no other command can take the same CPUs. The container is
+            # started outside the lock, as that may pull the image
+            with reservation_book.lock:
+                sync_reservations(get_docker_client())
+                if not resource_limits.get('cpuset_cpus'):
+                    allocation = topology.allocate_cpuset(load_topology(), resource_limits['cpu_count'],
+                                                          resource_limits.get('gpu_devices') or (),
+                                                          reservation_book.pinned())
+                    if allocation is None:
+                        return {'success': False, 'error': f"Not enough free CPUs to pin "
+                                                           f"{resource_limits['cpu_count']} CPUs"}
+                    resource_limits = dict(resource_limits, cpuset_cpus=allocation[0], cpuset_mems=allocation[1])
+                cpu_count = resource_limits.get('cpu_count', 0)
+                reservation = reservations.Reservation(
+                    cpu_count if cpu_count > 0 else 0.0,
+                    docker.utils.parse_bytes(resource_limits.get('memory', '1g')),
+                    reservations.parse_cpuset(resource_limits['cpuset_cpus']))
+                error = reservation_book.check(None, reservation)
+                if error is not None:
+                    return {'success': False, 'error': error}
+                hold = reservation_book.hold(reservation)
+        try:
+            container, warm = start_container(image, resource_limits, container_name)
+        except BaseException:
+            if hold is not None:
+                reservation_book.release(hold)
+            raise
+        if hold is not None:
+            reservation_book.confirm(hold, container.id)
         
         # Get container info
         container_info = {
@@ -179,32 +856,41 @@ def run_docker_container(image, resource_limits, container_name=None):
             'name': container.name,
             'status': container.status,
             'image': image,
-            'resource_limits': resource_limits
+            'resource_limits': resource_limits,
+            'warm': warm,
         }
         
-        print(f"Container started: {container.name} (ID: {container.id})")
+        log.info("container_started", name=container.name, id=container.id, image=image,
+                 warm=warm)
+        agent_counters["containers_started"] += 1
         return {'success': True, 'container': container_info}
         
+    except ValueError as e:
+        log.warning("container_run_refused", image=image, error=str(e))
+        return {'success': False, 'error': str(e)}
     except docker.errors.ImageNotFound:
         error_msg = f"Docker image not found: {image}"
-        print(error_msg)
+        log.warning("container_run_failed", image=image, error=error_msg)
         return {'success': False, 'error': error_msg}
     except docker.errors.APIError as e:
         error_msg = f"Docker API error: {str(e)}"
-        print(error_msg)
+        log.warning("container_run_failed", image=image, error=error_msg)
         return {'success': False, 'error': error_msg}
     except Exception as e:
         error_msg = f"Error running container: {str(e)}"
-        print(error_msg)
+        log.error("container_run_failed", image=image, error=error_msg)
         return {'success': False, 'error': error_msg}
 
+@instrument.collector
 def get_container_list():
     """Get list of running Docker containers"""
     try:
-        containers = docker_client.containers.list()
+        containers = get_docker_client().containers.list()
         container_list = []
         
         for container in containers:
+            if warmpool.is_pool_name(container.name):
+                continue
             container_info = {
                 'id': container.id,
                 'name': container.name,
@@ -216,27 +902,545 @@ def get_container_list():
         return {'success': True, 'containers': container_list}
     except Exception as e:
         error_msg = f"Error listing containers: {str(e)}"
-        print(error_msg)
+        log.error("container_list_failed", error=error_msg)
         return {'success': False, 'error': error_msg}
 
+@instrument.collector
 def stop_container(container_id):
     """Stop a running Docker container"""
     try:
-        container = docker_client.containers.get(container_id)
+        container = get_docker_client().containers.get(container_id)
         container.stop()
+        agent_counters["containers_stopped"] += 1
         return {'success': True, 'message': f"Container {container_id} stopped"}
     except docker.errors.NotFound:
         return {'success': False, 'error': f"Container {container_id} not found"}
     except Exception as e:
         error_msg = f"Error stopping container: {str(e)}"
-        print(error_msg)
+        log.error("container_stop_failed", container_id=container_id, error=error_msg)
         return {'success': False, 'error': error_msg}
 
+def update_options(resource_limits):
+    """container.update() keyword arguments for the limits present in resource_limits"""
+    options = {}
+    if 'cpu_count' in resource_limits:
+        cpu_count = resource_limits['cpu_count'] or 0
+        options['cpu_period'] = reservations.CPU_PERIOD
+        options['cpu_quota'] = int(reservations.CPU_PERIOD * cpu_count) if cpu_count > 0 else -1
+    if 'memory' in resource_limits:
+        memory = docker.utils.parse_bytes(resource_limits['memory'])
+        if memory <= 0:
+            raise ValueError("Memory limit must be positive")
+        options['mem_limit'] = memory
+        options['memswap_limit'] = 2 * memory  # As create() leaves it: swap up to the memory limit again
+    if 'cpuset_cpus' in resource_limits:
+        cpuset = reservations.parse_cpuset(resource_limits['cpuset_cpus'])
+        if not cpuset:
+            raise ValueError("cpuset_cpus cannot be cleared in place")
+        options['cpuset_cpus'] = reservations.format_cpuset(cpuset)
+    return options
+
+def sync_reservations(client):
+    """Bring the reservation book up to date with the running containers (blocking)"""
+    running = [c.id for c in client.containers.list(sparse=True)
+               if not warmpool.is_pool_name((c.attrs.get('Names') or [''])[0])]  # Pool limits change on claim
+    for container_id in reservation_book.retain(running):
+        try:
+            host_config = client.api.inspect_container(container_id).get('HostConfig') or {}
+        except docker.errors.NotFound:
+            continue  # Gone since the listing
+        reservation_book.set(container_id, reservations.Reservation.from_host_config(host_config))
+
+@instrument.collector
+def update_docker_container(container_id, resource_limits):
+    """
+    Change a running container's CPU quota, memory limit or cpuset in place
+
+    Parameters:
+    container_id (str): Container ID or name
+    resource_limits (dict): Any of:
+        - cpu_count: Number of CPUs (0 for no limit)
+        - memory: Memory limit (e.g., '2g')
+        - cpuset_cpus: CPUs to pin to (e.g., '0-3,8')
+
+    Returns:
+    dict: The container's new limits and reservation, or why they were refused
+    """
+    try:
+        if 'gpu_count' in resource_limits or 'gpu_devices' in resource_limits:
+            return {'success': False, 'error': 'GPUs cannot be changed in place; start a new container'}
+        options = update_options(resource_limits)
+        if not options:
+            return {'success': False, 'error': 'No limits to change'}
+        client = get_docker_client()
+        with reservation_book.lock:
+            container = client.containers.get(container_id)
+            if container.status not in ('running', 'paused') or warmpool.is_pool_name(container.name):
+                return {'success': False, 'error': f"Container {container_id} is not running"}
+            sync_reservations(client)
+            current = reservations.Reservation.from_host_config(container.attrs['HostConfig'])
+            reservation = current.updated(**options)
+            error = reservation_book.check(container.id, reservation)
+            if error is not None:
+                log.info("container_update_refused", container_id=container_id, error=error)
+                return {'success': False, 'error': error}
+            container.update(**options)
+            reservation_book.set(container.id, reservation)
+        agent_counters["containers_updated"] += 1
+        log.info("container_updated", name=container.name, id=container.id, **reservation.as_dict())
+        return {'success': True, 'container': {
+            'id': container.id,
+            'name': container.name,
+            'resource_limits': resource_limits,
+            'reservation': reservation.as_dict(),
+        }}
+    except docker.errors.NotFound:
+        return {'success': False, 'error': f"Container {container_id} not found"}
+    except docker.errors.APIError as e:
+        error_msg = f"Docker API error: {str(e)}"
+        log.warning("container_update_failed", container_id=container_id, error=error_msg)
+        return {'success': False, 'error': error_msg}
+    except Exception as e:
+        error_msg = f"Error updating container: {str(e)}"
+        log.error("container_update_failed", container_id=container_id, error=error_msg)
+        return {'success': False, 'error': error_msg}
+
+@instrument.collector
+def get_top_processes(containers):
+    """Refresh the process table and build a top frame (blocking; run in a thread)"""
+    process_table.refresh()
+    names = {c['id']: c['name'] for c in containers}
+
+    def process_row(record):
+        return {
+            'PID': record.pid,
+            'Name': record.name,
+            'CPU_Percent': record.cpu_percent,
+            'Memory_Bytes': record.rss_bytes,
+            'Container_ID': record.container_id,
+            'Container_Name': names.get(record.container_id),
+        }
+
+    by_container = sorted(process_table.containers().items(), key=lambda item: item[1][0], reverse=True)
+    return {
+        'processes_by_cpu': [process_row(r) for r in process_table.top(TOP_N, 'cpu_percent')],
+        'processes_by_memory': [process_row(r) for r in process_table.top(TOP_N, 'rss_bytes')],
+        'containers': [{
+            'Container_ID': container_id,
+            'Container_Name': names.get(container_id),
+            'CPU_Percent': round(cpu, 1),
+            'Memory_Bytes': rss,
+            'Processes': count,
+        } for container_id, (cpu, rss, count) in by_container[:TOP_N]],
+        'process_count': len(process_table.records),
+        'timestamp': time.time(),
+    }
+
+def inspect_grants(container_id):
+    """
+    GPUs a container was given through its device requests, and when it
+    last started (seconds since the epoch, or None if Docker doesn't say)
+    """
+    attrs = get_docker_client().api.inspect_container(container_id)
+    try:
+        started = datetime.datetime.fromisoformat((attrs.get('State') or {}).get('StartedAt') or '').timestamp()
+    except ValueError:
+        started = None
+    if started is not None and started <= 0:
+        started = None  # Docker's zero time: never started
+    host_config = attrs.get('HostConfig') or {}
+    count = 0
+    for request in host_config.get('DeviceRequests') or []:
+        if not any('gpu' in capabilities for capabilities in request.get('Capabilities') or []):
+            continue
+        if request.get('DeviceIDs'):
+            count += len(request['DeviceIDs'])
+        elif request.get('Count') == -1:
+            count += len((latest_usage or {}).get('GPUs', []))  # All GPUs
+        else:
+            count += request.get('Count') or 0
+    return count, started
+
+@instrument.collector
+def read_container_meters(containers, gpus_in_use):
+    """
+    cgroup CPU and memory, GPUs held and start time for each running
+    container (blocking; run in a thread). GPUs held are those in the
+    container's device requests, or the GPUs it has processes on if that
+    is more.
+    """
+    readings = {}
+    running = set()
+    for container in containers:
+        container_id = container['id']
+        running.add(container_id)
+        reading = cgroup_reader.read(container_id)
+        if reading is None:
+            continue
+        grants = container_grants.get(container_id)
+        if grants is None:
+            grants = container_grants[container_id] = inspect_grants(container_id)
+        gpus, started = grants
+        readings[container_id] = (container['name'], reading[0], reading[1],
+                                  max(gpus, gpus_in_use.get(container_id, 0)), started)
+    for container_id in list(container_grants):
+        if container_id not in running:
+            del container_grants[container_id]
+    return readings
+
+@instrument.collector
+def read_container_io(containers, now):
+    """
+    Block I/O rates, I/O stall time and PIDs against the limit for each
+    running container, from its cgroup (blocking; run in a thread)
+    """
+    readings = {}
+    names = {}
+    for container in containers:
+        reading = cgroup_reader.read_io(container['id'])
+        if reading is not None:
+            readings[container['id']] = reading
+            names[container['id']] = container['name']
+    rows = container_io_rates.update(readings, now)
+    for row in rows:
+        reading = readings[row['Container_ID']]
+        row['Container_Name'] = names[row['Container_ID']]
+        row['IO_Stall_Seconds'] = reading.io_stall_seconds
+        row['PIDs'] = reading.pids
+        row['PIDs_Limit'] = reading.pids_max
+        row['PIDs_Limit_Hits'] = reading.pids_limit_hits
+    container_io_totals.clear()
+    container_io_totals.update(readings)
+    return rows
+
+async def meter_containers(containers, usage, now):
+    """Integrate one tick of per-container usage into the meter"""
+    gpus_in_use = {row['Container_ID']: len(row['GPUs']) for row in usage.get('Container_GPUs', [])}
+    try:
+        meter.tick(await asyncio.to_thread(read_container_meters, containers, gpus_in_use), now)
+    except Exception as e:
+        agent_counters["meter_errors"] += 1
+        log.error("metering_error", error=str(e))
+
+async def compact_meter(now):
+    """Forget long-stopped containers and compact the ledger to the retained window"""
+    evicted = meter.evict(now)
+    before, after = await asyncio.to_thread(meter_ledger.compact, set(meter.usage), now - METER_RETENTION)
+    log.info("meter_ledger_compacted", evicted=evicted, containers=len(meter.usage),
+             records_before=before, records_after=after)
+
+async def metering_loop():
+    """Restore totals from the ledger, then group-commit new records and compact now and then"""
+    try:
+        records = await asyncio.to_thread(meter_ledger.replay)
+    except Exception as e:
+        log.error("meter_ledger_replay_failed", path=METER_LEDGER, error=str(e))
+        records = []
+    meter.restore(records)
+    log.info("metering_ready", records=len(records), containers=len(meter.usage))
+    compacted = None
+    while True:
+        await asyncio.sleep(METER_COMMIT_INTERVAL)
+        try:
+            await asyncio.to_thread(meter_ledger.commit)
+        except Exception as e:
+            agent_counters["meter_errors"] += 1
+            log.error("meter_ledger_commit_failed", path=METER_LEDGER, error=str(e))
+            continue
+        now = time.time()
+        if compacted is None or now - compacted >= METER_COMPACT_INTERVAL:
+            compacted = now
+            try:
+                await compact_meter(now)
+            except Exception as e:
+                agent_counters["meter_errors"] += 1
+                log.error("meter_ledger_compact_failed", path=METER_LEDGER, error=str(e))
+
+async def warm_pool_loop():
+    """Adopt pool containers left by a previous run, then keep every profile topped up"""
+    try:
+        await asyncio.to_thread(warm_pool.adopt)
+    except Exception as e:
+        log.error("warm_pool_adopt_failed", error=str(e))
+    log.info("warm_pool_ready", **warm_pool.stats()["waiting"])
+    while True:
+        try:
+            created = await asyncio.to_thread(warm_pool.refill)
+            if created:
+                log.info("warm_pool_refilled", created=created)
+        except Exception as e:
+            warm_pool.counters["errors"] += 1
+            log.warning("warm_pool_error", error=str(e))
+        await asyncio.sleep(WARM_POOL_INTERVAL)
+
+async def trace_loop():
+    """Compress and append recorded traffic off the event loop"""
+    log.info("trace_recording", path=TRACE_PATH)
+    while True:
+        await asyncio.sleep(TRACE_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(trace_writer.flush)
+        except Exception as e:
+            log.error("trace_flush_failed", path=TRACE_PATH, error=str(e))
+
+@instrument.collector
+def get_container_summary():
+    """Cheap running-container listing for the sampler (one Docker API call)"""
+    summary = []
+    for container in get_docker_client().containers.list(sparse=True):
+        names = container.attrs.get('Names') or ['']
+        if warmpool.is_pool_name(names[0]):
+            continue  # Waiting in the warm pool, not rented
+        summary.append({
+            'id': container.id,
+            'name': names[0].lstrip('/'),
+            'image': container.attrs.get('Image', ''),
+            'status': container.attrs.get('State', ''),
+        })
+    return summary
+
+def render_metrics(usage, containers):
+    """Render the Prometheus text for one sampler snapshot"""
+    out = metrics.MetricsText(prefix="agent_")
+    if usage:
+        out.gauge("cpu_usage_percent", "Host CPU utilization.", usage["CPU_Usage"])
+        out.gauge("memory_usage_percent", "Host memory utilization.", usage["Memory_Usage"])
+        out.gauge("disk_usage_percent", "Usage of the root filesystem.", usage["Disk_Usage"])
+
+        gpus = usage.get("GPUs", [])
+        gpu_labels = [{"gpu": gpu["Index"], "name": gpu["Name"]} for gpu in gpus]
+        out.family("gpu_utilization_percent", "gauge", "GPU core utilization.",
+                   [(labels, gpu["Usage"]) for labels, gpu in zip(gpu_labels, gpus)])
+        out.family("gpu_memory_utilization_percent", "gauge", "GPU memory controller utilization.",
+                   [(labels, gpu["Memory_Usage"]) for labels, gpu in zip(gpu_labels, gpus)])
+        out.family("gpu_memory_used_bytes", "gauge", "GPU memory in use.",
+                   [(labels, gpu["Memory_Used"] * 1024 ** 2) for labels, gpu in zip(gpu_labels, gpus)])
+        out.family("gpu_memory_total_bytes", "gauge", "Total GPU memory.",
+                   [(labels, gpu["Memory_Total"] * 1024 ** 2) for labels, gpu in zip(gpu_labels, gpus)])
+        out.family("gpu_temperature_celsius", "gauge", "GPU core temperature.",
+                   [(labels, gpu["Temperature"]) for labels, gpu in zip(gpu_labels, gpus)])
+
+        gpu_rows = usage.get("Container_GPUs", [])
+        container_labels = [{"container": row["Container_ID"][:12], "name": row["Container_Name"] or ""}
+                            for row in gpu_rows]
+        out.family("container_gpu_utilization_percent", "gauge",
+                   "GPU utilization attributed to each container, summed over its GPUs.",
+                   [(labels, row["GPU_Usage"]) for labels, row in zip(container_labels, gpu_rows)])
+        out.family("container_gpu_memory_used_bytes", "gauge", "GPU memory used by each container's processes.",
+                   [(labels, row["GPU_Memory_Used"] * 1024 ** 2)
+                    for labels, row in zip(container_labels, gpu_rows)])
+
+        io_labels = {c['id']: {"container": c['id'][:12], "name": c['name']} for c in containers}
+        io_totals = [(io_labels[cid], totals) for cid, totals in container_io_totals.items() if cid in io_labels]
+        out.family("container_io_read_bytes_total", "counter", "Bytes each container read from block devices.",
+                   [(labels, t.read_bytes) for labels, t in io_totals])
+        out.family("container_io_write_bytes_total", "counter", "Bytes each container wrote to block devices.",
+                   [(labels, t.write_bytes) for labels, t in io_totals])
+        out.family("container_io_stall_seconds_total", "counter",
+                   "Time all of each container's tasks waited on I/O (cgroup v2).",
+                   [(labels, t.io_stall_seconds) for labels, t in io_totals if t.io_stall_seconds is not None])
+        out.family("container_pids", "gauge", "Processes and threads in each container.",
+                   [(labels, t.pids) for labels, t in io_totals])
+        out.family("container_pids_limit_hits_total", "counter", "Forks refused by each container's pids_limit.",
+                   [(labels, t.pids_limit_hits) for labels, t in io_totals if t.pids_limit_hits is not None])
+
+        disks = usage.get("Disks", [])
+        out.family("disk_read_bytes_per_second", "gauge", "Disk read throughput.",
+                   [({"device": d["Device"]}, d["Read_Bytes_Per_Sec"]) for d in disks])
+        out.family("disk_write_bytes_per_second", "gauge", "Disk write throughput.",
+                   [({"device": d["Device"]}, d["Write_Bytes_Per_Sec"]) for d in disks])
+        out.family("disk_read_iops", "gauge", "Disk reads completed per second.",
+                   [({"device": d["Device"]}, d["Read_IOPS"]) for d in disks])
+        out.family("disk_write_iops", "gauge", "Disk writes completed per second.",
+                   [({"device": d["Device"]}, d["Write_IOPS"]) for d in disks])
+        nics = usage.get("NICs", [])
+        out.family("network_receive_bytes_per_second", "gauge", "Network receive throughput.",
+                   [({"interface": n["Interface"]}, n["Rx_Bytes_Per_Sec"]) for n in nics])
+        out.family("network_transmit_bytes_per_second", "gauge", "Network transmit throughput.",
+                   [({"interface": n["Interface"]}, n["Tx_Bytes_Per_Sec"]) for n in nics])
+
+    out.gauge("containers_running", "Running Docker containers.", len(containers))
+    out.family("container_info", "gauge", "Running container metadata (always 1).",
+               [({"id": c["id"][:12], "name": c["name"], "image": c["image"]}, 1) for c in containers])
+    out.gauge("connected_clients", "Connected Socket.IO clients.", len(connected_clients))
+    out.gauge("last_sample_timestamp_seconds", "Unix time of the latest sample.", latest_sample_time)
+
+    out.counter("samples_total", "Sampler ticks completed.", agent_counters["samples"])
+    out.counter("sample_errors_total", "Sampler ticks that failed.", agent_counters["sample_errors"])
+    out.counter("usage_frames_sent_total", "usage_stats frames emitted.", agent_counters["usage_frames_sent"])
+    out.counter("usage_frames_suppressed_total", "Sampler ticks held back by the deadband.",
+                agent_counters["usage_frames_suppressed"])
+    out.counter("containers_started_total", "Containers started by the agent.", agent_counters["containers_started"])
+    out.counter("containers_stopped_total", "Containers stopped by the agent.", agent_counters["containers_stopped"])
+    out.counter("containers_updated_total", "Containers resized in place by the agent.",
+                agent_counters["containers_updated"])
+    out.counter("registrations_sent_total", "Registry heartbeats accepted.", agent_counters["registrations_sent"])
+    out.counter("registration_failures_total", "Registry heartbeats that failed.", agent_counters["registration_failures"])
+    out.counter("alerts_fired_total", "Alert rules that started firing.", agent_counters["alerts_fired"])
+    control_stats = control_scheduler.stats()
+    out.counter("control_commands_total", "Control commands completed.", control_stats["completed"])
+    out.counter("control_rejected_total", "Control commands rejected by rate limits.", control_stats["rejected"])
+    out.gauge("control_queued", "Control commands waiting for a worker.", control_stats["queued"])
+    out.counter("control_results_replayed_total", "Retried control requests answered from the result cache.",
+                control_results.hits)
+    if warm_pool is not None:
+        pool_stats = warm_pool.stats()
+        out.family("warm_pool_waiting", "gauge", "Warm pool containers waiting to be claimed, by profile.",
+                   [({"profile": name}, n) for name, n in pool_stats["waiting"].items()])
+        out.counter("warm_pool_claims_total", "Rentals started from the warm pool.", pool_stats["claims"])
+        out.counter("warm_pool_misses_total", "Matching rentals that found the pool empty.", pool_stats["misses"])
+        out.counter("warm_pool_created_total", "Containers created for the warm pool.", pool_stats["created"])
+    out.counter("meter_ledger_commits_total", "Metering ledger batches written and fsynced.", meter_ledger.commits)
+    out.counter("meter_ledger_records_total", "Metering ledger records written.", meter_ledger.records_written)
+    out.counter("meter_ledger_compactions_total", "Metering ledger rewrites that dropped old records.",
+                meter_ledger.compactions)
+    out.counter("meter_errors_total", "Metering ticks, ledger commits or compactions that failed.",
+                agent_counters["meter_errors"])
+    running = [({"container": u.container_id[:12], "name": u.name or ""}, u) for u in meter.usage.values()
+               if u.last_read is not None]
+    out.family("container_cpu_seconds_total", "counter", "CPU time used by each running container.",
+               [(labels, u.cpu_seconds) for labels, u in running])
+    out.family("container_gpu_seconds_total", "counter", "GPU time held by each running container.",
+               [(labels, u.gpu_seconds) for labels, u in running])
+    out.family("container_memory_gb_hours_total", "counter", "Memory integrated over time, in GiB-hours.",
+               [(labels, u.memory_byte_seconds / metering.GIB / 3600) for labels, u in running])
+    out.family("alert_firing", "gauge", "Alerts currently firing (always 1).",
+               [({"rule": a["rule"], "subject": "" if a["subject"] is None else a["subject"],
+                  "severity": a["severity"]}, 1) for a in alert_engine.active()])
+
+    # Self-instrumentation
+    out.histogram("handler_duration_seconds", "Socket.IO event handler latency.", instrument.series("handler"))
+    out.histogram("collector_duration_seconds", "Collector latency.", instrument.series("collector"))
+    out.histogram("emit_duration_seconds", "Socket.IO emit latency.", instrument.series("emit"))
+    out.histogram("event_loop_lag_seconds", "Event-loop wake-up delay.", [(None, instrument.loop_lag)])
+    out.family("errors_total", "counter", "Handler and collector exceptions.",
+               [({"kind": kind, "name": name}, n) for (kind, name), n in instrument.errors.items()])
+    depths = client_queue_depths().values()
+    out.gauge("outbound_queue_depth_max", "Longest per-client outbound queue.", max(depths, default=0))
+    out.gauge("outbound_queue_depth_total", "Packets queued for all clients.", sum(depths))
+    if outbound_lanes is not None:
+        out.counter("outbound_telemetry_conflated_total", "Queued telemetry frames replaced by a newer one.",
+                    outbound_lanes.conflated)
+        out.counter("outbound_priority_overtakes_total", "Packets sent ahead of queued telemetry.",
+                    outbound_lanes.overtaken)
+    process = instrument.process_stats()
+    out.gauge("process_cpu_percent", "CPU used by the agent process.", process["cpu_percent"])
+    out.gauge("process_resident_memory_bytes", "Resident memory of the agent process.", process["rss_bytes"])
+    out.gauge("process_threads", "Threads in the agent process.", process["threads"])
+    log_stats = jsonlog.stats()
+    out.counter("log_records_dropped_total", "Log records dropped on a full queue.", log_stats["dropped"])
+    out.counter("log_records_suppressed_total", "Log records rate limited or sampled away.", log_stats["suppressed"])
+    frames, sizes = ws_compression.series()
+    out.family("websocket_frames_total", "counter", "WebSocket frames sent, by event and compression.", frames)
+    out.family("websocket_payload_bytes_total", "counter", "Uncompressed WebSocket payload bytes sent.", sizes)
+    return out.render()
+
+async def sample_usage_loop():
+    """
+    Shared sampler: collect usage once per tick for every consumer.
+
+    Clients, /metrics and anything else read the latest snapshot instead of
+    running nvidia-smi or querying Docker themselves.
+    """
+    global latest_usage, latest_containers, latest_sample_time, latest_usage_version, latest_top, metrics_body
+
+    psutil.cpu_percent(interval=None)  # Prime the CPU counter for the first tick
+    while True:
+        started = time.monotonic()
+        publish = False
+        try:
+            usage = await get_usage()
+            try:
+                containers = await asyncio.to_thread(get_container_summary)
+            except Exception as e:
+                log.warning("sample_containers_error", error=str(e))
+                containers = latest_containers
+            else:
+                if meter.ready:
+                    await meter_containers(containers, usage, time.time())
+            usage["Container_IO"] = await asyncio.to_thread(read_container_io, containers, started)
+            latest_usage, latest_containers = usage, containers
+            if trace_writer is not None:
+                trace_writer.record(tracing.SNAPSHOT, None, {"usage": usage, "containers": containers})
+            latest_sample_time = time.time()
+            agent_counters["samples"] += 1
+            publish = not DEADBAND or usage_deadband.should_publish(usage, started)
+            if publish:
+                latest_usage_version += 1
+            else:
+                agent_counters["usage_frames_suppressed"] += 1
+            for alert in alert_engine.evaluate(usage, latest_sample_time):
+                await publish_alert(alert)
+        except Exception as e:
+            agent_counters["sample_errors"] += 1
+            log.error("sample_usage_error", error=str(e))
+        # Alerts-only clients have left the telemetry room (see subscribe_alerts)
+        usage_subscribers = len(connected_clients) - len(alerts_only_clients)
+        if CONNECTION_SCALE and latest_usage is not None and usage_subscribers > 0 and (publish or not DEADBAND):
+            # One packet encode for the whole room instead of a task per client
+            await emit('usage_stats', latest_usage, room=TELEMETRY_ROOM)
+            agent_counters["usage_frames_sent"] += usage_subscribers
+        if top_subscribers:
+            try:
+                latest_top = await asyncio.to_thread(get_top_processes, latest_containers)
+                await emit('top', latest_top, room=TOP_ROOM)
+            except Exception as e:
+                log.error("top_processes_error", error=str(e))
+        else:
+            latest_top = None  # Don't replay a stale frame to the next subscriber
+        metrics_body = render_metrics(latest_usage, latest_containers)
+        await asyncio.sleep(max(0, USAGE_INTERVAL - (time.monotonic() - started)))
+
+async def publish_alert(alert):
+    """Push one alert state transition to alert subscribers"""
+    if alert["state"] == "firing":
+        agent_counters["alerts_fired"] += 1
+        log.warning("alert_firing", rule=alert["rule"], subject=alert["subject"], value=alert["value"])
+    else:
+        log.info("alert_resolved", rule=alert["rule"], subject=alert["subject"], value=alert["value"],
+                 expired=alert.get("expired", False))
+    await emit('alert', alert, room=ALERTS_ROOM)
+
+async def emit(event, data=None, room=None):
+    """Emit through the instrumentation so per-event emit latency is recorded"""
+    with instrument.timer("emit", event):
+        await sio.emit(event, data, room=room)
+
+def client_queue_depths():
+    """Outbound Engine.IO queue length per connected client"""
+    depths = {}
+    for sid in list(connected_clients):
+        eio_sid = sio.manager.eio_sid_from_sid(sid, '/')
+        socket = sio.eio.sockets.get(eio_sid) if eio_sid else None
+        if socket is not None:
+            depths[sid] = socket.queue.qsize()
+    return depths
+
+async def metrics_handler(request):
+    """Serve the pre-rendered Prometheus metrics"""
+    return web.Response(body=metrics_body, headers={"Content-Type": metrics.CONTENT_TYPE})
+
+app.router.add_get('/metrics', metrics_handler)
+
 @sio.event
-async def connect(sid, environ):
+@instrument.handler
+async def connect(sid, environ, auth=None):
     """Handle new client connections"""
-    print(f"Client connected: {sid}")
+    log.info("client_connected", sid=sid)
     connected_clients.add(sid)
+    # Cached control results are scoped to the client. One that connects
+    # with auth {"client_id": ...} keeps its scope across reconnects, so a
+    # retry after a dropped connection still gets the first send's result;
+    # any other client is scoped to this connection
+    client_id = auth.get('client_id') if isinstance(auth, dict) else None
+    client_identities[sid] = str(client_id) if client_id else sid
+    
+    if CONNECTION_SCALE:
+        # The sampler broadcasts usage_stats to the room; system_info goes
+        # out once the connect handshake has completed
+        await sio.enter_room(sid, TELEMETRY_ROOM)
+        sio.start_background_task(send_system_info, sid)
+        return
     
     # Ensure system_info is ready
     system_info = await get_system_info()
@@ -244,23 +1448,62 @@ async def connect(sid, environ):
     # Send system information immediately upon connection
     # Use a slight delay to ensure the client is ready to receive
     await asyncio.sleep(0.5)
-    await sio.emit('system_info', system_info, room=sid)
-    print(f"Sent system_info to {sid}")
+    await emit('system_info', system_info, room=sid)
+    log.debug("system_info_sent", sid=sid)
     
     # Start sending regular usage updates
     sio.start_background_task(send_usage_updates, sid)
 
 @sio.event
+@instrument.handler
 async def request_system_info(sid, *args):
     """Handle explicit requests for system info"""
     system_info = await get_system_info()
-    await sio.emit('system_info', system_info, room=sid)
-    print(f"Sent system_info to {sid} (by request)")
+    await emit('system_info', system_info, room=sid)
+    log.debug("system_info_sent", sid=sid, requested=True)
+    return system_info
+
+async def run_control(sid, command, func, *args):
+    """Run a blocking Docker command in this client's turn, or say when to retry"""
+    try:
+        return await control_scheduler.submit(sid, command, func, *args)
+    except control.Throttled as e:
+        log.info("control_throttled", sid=sid, command=command, retry_after=e.retry_after)
+        return {'success': False, 'error': str(e), 'retry_after': e.retry_after}
+
+async def control_command(sid, command, data, func, *args):
+    """Run a control command; one with a request_id shares its result with retries of that request"""
+    request_id = data.get('request_id') if isinstance(data, dict) else None
+    if request_id is None:
+        return await run_control(sid, command, func, *args)
+    timeout = CONTROL_TIMEOUTS[command]
+    client = client_identities.get(sid, sid)
+    try:
+        result = await control_results.run(client, command, request_id,
+                                           lambda: run_control(sid, command, func, *args), timeout)
+    except asyncio.TimeoutError:
+        return {'success': False, 'pending': True,
+                'error': f"Still running after {timeout} s; retry with the same request_id for the result"}
+    if 'retry_after' in result:
+        control_results.forget(client, command, request_id)  # Never ran, so a retry must run it
+    return result
+
+async def reply(sid, event, data, result):
+    """
+    Return result for the Socket.IO acknowledgement. Requests without a
+    request_id also get it as the reply event, as before.
+    """
+    request_id = data.get('request_id') if isinstance(data, dict) else None
+    if request_id is None:
+        await emit(event, result, room=sid)
+        return result
+    return dict(result, request_id=request_id)
 
 @sio.event
+@instrument.handler
 async def run_container(sid, data):
     """Handle container run requests"""
-    print(f"Received container run request: {data}")
+    log.info("container_run_requested", sid=sid, request=data)
     
     image = data.get('image')
     resource_limits = data.get('resource_limits', {})
@@ -269,17 +1512,20 @@ async def run_container(sid, data):
     if not image:
         result = {'success': False, 'error': 'Image name is required'}
     else:
-        result = run_docker_container(image, resource_limits, container_name)
+        result = await control_command(sid, 'run_container', data, run_docker_container, image, resource_limits,
+                                       container_name)
     
-    await sio.emit('container_result', result, room=sid)
+    return await reply(sid, 'container_result', data, result)
 
 @sio.event
-async def list_containers(sid, *args):
+@instrument.handler
+async def list_containers(sid, data=None):
     """Handle container list requests"""
-    result = get_container_list()
-    await sio.emit('container_list', result, room=sid)
+    result = await control_command(sid, 'list_containers', data, get_container_list)
+    return await reply(sid, 'container_list', data, result)
 
 @sio.event
+@instrument.handler
 async def stop_container_request(sid, data):
     """Handle container stop requests"""
     container_id = data.get('container_id')
@@ -287,16 +1533,132 @@ async def stop_container_request(sid, data):
     if not container_id:
         result = {'success': False, 'error': 'Container ID is required'}
     else:
-        result = stop_container(container_id)
+        result = await control_command(sid, 'stop_container_request', data, stop_container, container_id)
     
-    await sio.emit('container_stop_result', result, room=sid)
+    return await reply(sid, 'container_stop_result', data, result)
 
 @sio.event
+@instrument.handler
+async def update_container(sid, data):
+    """Handle in-place resize requests"""
+    log.info("container_update_requested", sid=sid, request=data)
+    container_id = data.get('container_id')
+    resource_limits = data.get('resource_limits') or {}
+
+    if not container_id:
+        result = {'success': False, 'error': 'Container ID is required'}
+    else:
+        result = await control_command(sid, 'update_container', data, update_docker_container, container_id,
+                                       resource_limits)
+
+    return await reply(sid, 'container_update_result', data, result)
+
+@sio.event
+@instrument.handler
+async def get_agent_stats(sid, *args):
+    """Report the agent's own latency histograms, loop lag, queues and CPU/RSS"""
+    stats = instrument.snapshot()
+    stats["outbound_queue_depth"] = client_queue_depths()
+    stats["connected_clients"] = len(connected_clients)
+    stats["tasks"] = len(asyncio.all_tasks())
+    stats["counters"] = dict(agent_counters)
+    stats["control"] = dict(control_scheduler.stats(), cached_results=len(control_results.entries),
+                            replayed_results=control_results.hits)
+    if warm_pool is not None:
+        stats["warm_pool"] = warm_pool.stats()
+    stats["reservations"] = reservation_book.totals()
+    if trace_writer is not None:
+        stats["trace"] = trace_writer.stats()
+    stats["log"] = jsonlog.stats()
+    await emit('agent_stats', stats, room=sid)
+
+@sio.event
+@instrument.handler
+async def get_usage_report(sid, data=None):
+    """
+    Metered totals per container, optionally for one container and a window:
+    {"container_id": ..., "start": epoch seconds, "end": epoch seconds}.
+    Containers stopped more than METER_RETENTION ago are no longer reported.
+    """
+    data = data or {}
+    start, end = data.get('start'), data.get('end')
+    if any(value is not None and not isinstance(value, (int, float)) for value in (start, end)):
+        result = {'success': False, 'error': 'start and end must be seconds since the epoch'}
+    elif not meter.ready:
+        result = {'success': False, 'error': 'Metering is still loading its ledger'}
+    else:
+        result = {
+            'success': True,
+            'containers': meter.report(data.get('container_id'), start, end),
+            'start': start,
+            'end': end,
+            'resolution_s': METER_RECORD_INTERVAL,
+            'retention_s': METER_RETENTION,
+            'timestamp': time.time(),
+        }
+    await emit('usage_report', result, room=sid)
+
+@sio.event
+@instrument.handler
 async def disconnect(sid):
     """Handle client disconnections"""
-    print(f"Client disconnected: {sid}")
+    log.info("client_disconnected", sid=sid)
     if sid in connected_clients:
         connected_clients.remove(sid)
+    client_identities.pop(sid, None)
+    top_subscribers.discard(sid)
+    alerts_only_clients.discard(sid)
+    control_scheduler.drop(sid)
+
+@sio.event
+@instrument.handler
+async def subscribe_alerts(sid, data=None):
+    """
+    Receive 'alert' events on state transitions, starting with the alerts
+    already firing. With {"only": true} the usage_stats stream stops.
+    """
+    await sio.enter_room(sid, ALERTS_ROOM)
+    if (data or {}).get('only'):
+        alerts_only_clients.add(sid)
+        await sio.leave_room(sid, TELEMETRY_ROOM)
+    for alert in alert_engine.active():
+        await emit('alert', alert, room=sid)
+
+@sio.event
+@instrument.handler
+async def unsubscribe_alerts(sid, *args):
+    """Stop alert events; an alerts-only client gets usage_stats again"""
+    await sio.leave_room(sid, ALERTS_ROOM)
+    if sid in alerts_only_clients:
+        alerts_only_clients.discard(sid)
+        if CONNECTION_SCALE:
+            await sio.enter_room(sid, TELEMETRY_ROOM)
+
+@sio.event
+@instrument.handler
+async def subscribe_top(sid, *args):
+    """Stream the top-N process and container view to this client every tick"""
+    top_subscribers.add(sid)
+    await sio.enter_room(sid, TOP_ROOM)
+    if latest_top is not None:
+        await emit('top', latest_top, room=sid)
+
+@sio.event
+@instrument.handler
+async def unsubscribe_top(sid, *args):
+    top_subscribers.discard(sid)
+    await sio.leave_room(sid, TOP_ROOM)
+
+async def send_system_info(sid):
+    """Send system_info to a client just after its connect handshake"""
+    await asyncio.sleep(0.5)
+    if sid in connected_clients:
+        await emit('system_info', await get_system_info(), room=sid)
+        log.debug("system_info_sent", sid=sid)
+        if DEADBAND and latest_usage is not None and sid in connected_clients:
+            # The room only gets frames that moved past the deadband; start from the latest values
+            await emit('usage_stats', latest_usage, room=sid)
+            agent_counters["usage_frames_sent"] += 1
 
 async def send_usage_updates(sid):
     """Send regular usage updates to the connected client"""
@@ -304,39 +1666,77 @@ async def send_usage_updates(sid):
         # Send system info again with the first usage update to ensure it's received
         system_info = await get_system_info()
         if sid in connected_clients:
-            await sio.emit('system_info', system_info, room=sid)
-            print(f"Sent system_info again with first usage update to {sid}")
+            await emit('system_info', system_info, room=sid)
+            log.debug("system_info_sent", sid=sid, repeat=True)
             
+        sent_version = None
         while sid in connected_clients:
-            usage_stats = await get_usage()
-            if sid in connected_clients:  # Check again to avoid EmitError
-                await sio.emit('usage_stats', usage_stats, room=sid)
-            await asyncio.sleep(2)
+            usage_stats, version = latest_usage, latest_usage_version
+            if (usage_stats is not None and sid in connected_clients  # Check again to avoid EmitError
+                    and sid not in alerts_only_clients and not (DEADBAND and version == sent_version)):
+                await emit('usage_stats', usage_stats, room=sid)
+                agent_counters["usage_frames_sent"] += 1
+                sent_version = version
+            await asyncio.sleep(USAGE_INTERVAL)
     except Exception as e:
-        print(f"Error sending updates to {sid}: {e}")
+        log.warning("usage_updates_error", sid=sid, error=str(e))
 
 # Function to set the server notification URL dynamically
 def set_server_notification_url(url):
     global SERVER_NOTIFICATION_URL
     SERVER_NOTIFICATION_URL = url
-    print(f"Server notification URL set to: {url}")
+    log.info("notification_url_set", url=url)
 
-async def main():
-    """Start Socket.IO server"""
-    host = "0.0.0.0"  # Listen on all interfaces
-    port = 8765
-    
-    # Pre-cache system info
+async def connect_docker():
+    try:
+        await asyncio.to_thread(get_docker_client)
+        log.info("docker_connected", startup_ms=startup_ms())
+    except Exception as e:
+        log.error("docker_connect_failed", error=str(e))
+
+async def warm_system_info():
     await get_system_info()
-    
-    # Start the server
+    log.info("system_info_ready", startup_ms=startup_ms())
+
+async def open_tunnel_and_register(port):
+    """Create the public URL (ngrok unless AGENT_PUBLIC_URL is set), then keep it registered"""
+    public_url = PUBLIC_URL
+    if not public_url:
+        try:
+            public_url = await asyncio.to_thread(start_ngrok, port)
+        except Exception as e:
+            log.exception("ngrok_failed", error=str(e))
+            return
+    log.info("public_url", url=public_url, startup_ms=startup_ms())
+    await registration_heartbeat(public_url)
+
+def startup_ms():
+    """Milliseconds since the agent module started loading"""
+    return round((time.monotonic() - _process_started) * 1000, 1)
+
+async def main(host="0.0.0.0", port=PORT):
+    """Start Socket.IO server"""
+    # Bind first so clients can connect while the slower setup runs
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, host, port)
     await site.start()
     
-    print(f"Socket.IO server started on http://{host}:{port}")
-    print("Waiting for connections...")
+    log.info("listening", url=f"http://{host}:{port}", startup_ms=startup_ms())
+    
+    # Everything else happens concurrently in the background
+    sio.start_background_task(open_tunnel_and_register, port)
+    sio.start_background_task(connect_docker)
+    sio.start_background_task(warm_system_info)
+    
+    # One sampler feeds every client and the /metrics endpoint
+    sio.start_background_task(sample_usage_loop)
+    sio.start_background_task(metering_loop)
+    sio.start_background_task(instrument.monitor_loop_lag)
+    if warm_pool is not None:
+        sio.start_background_task(warm_pool_loop)
+    if trace_writer is not None:
+        sio.start_background_task(trace_loop)
     
     # Keep the server running
     while True:
@@ -344,17 +1744,14 @@ async def main():
 
 if __name__ == "__main__":
     try:
+        jsonlog.configure(limits=LOG_RATE_LIMITS, samples=LOG_SAMPLES)
+
         # Check if a server URL is provided as a command line argument
-        import sys
-        
         if len(sys.argv) > 1:
             set_server_notification_url(sys.argv[1])
         
-        port = 8765
-        ngrok_url = start_ngrok(port)
-        print(f"Public URL: {ngrok_url}")
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("\nServer shutdown requested. Closing...")
+        log.info("shutdown_requested")
     except Exception as e:
-        print(f"Unexpected error: {e}")
\ No newline at end of file
+        log.exception("unexpected_error", error=str(e))
\ No newline at end of file
@@ -0,0 +1,255 @@
+"""
+Secondary indexes over host capacity summaries.
+
+The aggregator feeds every registration heartbeat's load summary into a
+HostIndex. Each indexed attribute (free GPUs overall, free GPUs per model,
+free RAM, CPU threads) is a sorted list of (value, machine_id), updated in
+place when a host's value changes. A query bisects every criterion to get
+its candidate range as a slice of machine IDs and intersects the ranges,
+smallest first, as sets; the per-host Python work is limited to GPU
+counts summed across several matching models.
+
+Matches are ranked by free (matching) GPUs, most first, then machine ID,
+by walking the free-GPU index a value at a time, so `limit` always keeps
+the same hosts. A limited query that looks broad skips the candidate sets
+and walks the ranking index from the top, checking hosts directly until
+it has enough.
+
+Measured with bench/bench_host_index.py at 10k hosts: selective and
+limited queries take 10-200 us (p99 under 0.35 ms). Queries that return
+thousands of hosts take 0.8-1.7 ms (p99 up to about 3 ms), and a limited
+query over several matching models about 0.5-0.8 ms; most of that time
+is building and ranking the candidate set.
+"""
+import bisect
+
+
+class SortedIndex:
+    """
+    (value, machine_id) pairs kept sorted, with the machine IDs mirrored in
+    a parallel list so a 'value >= x' range is a single C-level slice.
+    """
+
+    __slots__ = ("keys", "ids")
+
+    def __init__(self):
+        self.keys = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, value, machine_id):
+        i = bisect.bisect_left(self.keys, (value, machine_id))
+        self.keys.insert(i, (value, machine_id))
+        self.ids.insert(i, machine_id)
+
+    def remove(self, value, machine_id):
+        i = bisect.bisect_left(self.keys, (value, machine_id))
+        if i < len(self.keys) and self.keys[i] == (value, machine_id):
+            del self.keys[i]
+            del self.ids[i]
+
+    def at_least(self, value):
+        """Machine IDs whose value is >= value"""
+        return self.ids[bisect.bisect_left(self.keys, (value, "")):]
+
+    def groups(self):
+        """(value, machine IDs with that value) from the highest value down, IDs in order"""
+        end = len(self.keys)
+        while end:
+            value = self.keys[end - 1][0]
+            start = bisect.bisect_left(self.keys, (value, ""), 0, end)
+            yield value, self.ids[start:end]
+            end = start
+
+
+def normalize(summary):
+    """Pick the indexed fields out of a heartbeat load summary"""
+    models = summary.get("free_gpu_models") or {}
+    return {
+        "free_gpus": int(summary.get("free_gpus") or 0),
+        "free_gpu_models": {str(name): int(count) for name, count in models.items() if count},
+        "free_ram_gb": float(summary.get("free_ram_gb") or 0),
+        "cpu_threads": int(summary.get("cpu_threads") or 0),
+    }
+
+
+class HostIndex:
+    """Capacity indexes for the whole fleet, maintained incrementally"""
+
+    def __init__(self):
+        self.hosts = {}  # machine_id -> normalized summary
+        self.free_gpus = SortedIndex()
+        self.free_ram_gb = SortedIndex()
+        self.cpu_threads = SortedIndex()
+        self.models = {}  # GPU model name -> SortedIndex of free GPUs of that model
+        self._model_matches = {}  # Query substring -> matching model names
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def update(self, machine_id, summary):
+        """Apply one heartbeat; only the attributes that changed are re-indexed"""
+        new = normalize(summary)
+        old = self.hosts.get(machine_id)
+        for field in ("free_gpus", "free_ram_gb", "cpu_threads"):
+            if old is None or old[field] != new[field]:
+                index = getattr(self, field)
+                if old is not None:
+                    index.remove(old[field], machine_id)
+                index.add(new[field], machine_id)
+
+        old_models = old["free_gpu_models"] if old else {}
+        new_models = new["free_gpu_models"]
+        for model in old_models.keys() | new_models.keys():
+            before, after = old_models.get(model), new_models.get(model)
+            if before == after:
+                continue
+            if before is not None:
+                self.models[model].remove(before, machine_id)
+            if after is not None:
+                if model not in self.models:
+                    self.models[model] = SortedIndex()
+                    self._model_matches.clear()
+                self.models[model].add(after, machine_id)
+        self.hosts[machine_id] = new
+
+    def remove(self, machine_id):
+        old = self.hosts.pop(machine_id, None)
+        if old is None:
+            return
+        for field in ("free_gpus", "free_ram_gb", "cpu_threads"):
+            getattr(self, field).remove(old[field], machine_id)
+        for model, count in old["free_gpu_models"].items():
+            self.models[model].remove(count, machine_id)
+
+    def matching_models(self, query):
+        """Model names containing the query, case-insensitively ('A100' matches 'NVIDIA A100-SXM4-80GB')"""
+        matches = self._model_matches.get(query)
+        if matches is None:
+            needle = query.lower()
+            matches = self._model_matches[query] = [m for m in self.models if needle in m.lower()]
+        return matches
+
+    def find(self, min_free_gpus=0, gpu_model=None, min_free_ram_gb=0, min_cpu_threads=0, limit=None):
+        """
+        Machine IDs of hosts satisfying every given minimum, the most
+        free GPUs (of matching models, with gpu_model) first and ties in
+        machine ID order, so a limited query always returns the same hosts.
+
+        With gpu_model, min_free_gpus counts only free GPUs of matching
+        models, summed across models on the same host.
+        """
+        ranges = []  # (candidate IDs, field, minimum) per active criterion
+        models = None
+        multi_model = []
+        mixed = set()  # Hosts with free GPUs of two or more matching models
+        if gpu_model:
+            models = self.matching_models(gpu_model)
+            if not models:
+                return []
+            need = max(1, min_free_gpus)
+            if len(models) == 1:
+                ranges.append((self.models[models[0]].at_least(need), None, None))
+            else:
+                # Free GPUs are summed across matching models: hosts where a
+                # single model already suffices pass outright, and only hosts
+                # with free GPUs of two or more matching models need summing
+                enough = set()
+                seen = set()
+                for model in models:
+                    enough.update(self.models[model].at_least(need))
+                    some = set(self.models[model].at_least(1))
+                    mixed |= seen & some
+                    seen |= some
+                multi_model = mixed - enough
+                ranges.append((enough | multi_model, None, None))
+        elif min_free_gpus:
+            ranges.append((self.free_gpus.at_least(min_free_gpus), "free_gpus", min_free_gpus))
+        if min_free_ram_gb:
+            ranges.append((self.free_ram_gb.at_least(min_free_ram_gb), "free_ram_gb", min_free_ram_gb))
+        if min_cpu_threads:
+            ranges.append((self.cpu_threads.at_least(min_cpu_threads), "cpu_threads", min_cpu_threads))
+
+        hosts = self.hosts
+        if limit and not multi_model and not (models and len(models) > 1):
+            # A broad query that only wants the top few: walk the ranking
+            # index and check hosts directly when that should stop sooner
+            # than building the candidate set would (criteria taken as independent)
+            estimated = len(hosts)
+            for ids, _, _ in ranges:
+                estimated *= len(ids) / len(hosts)
+            smallest = min((len(ids) for ids, _, _ in ranges), default=len(hosts))
+            if estimated >= 1 and limit * len(hosts) / estimated < smallest:
+                index = self.models[models[0]] if models else self.free_gpus
+                checks = [(field, minimum) for field, minimum in
+                          (("free_ram_gb", min_free_ram_gb), ("cpu_threads", min_cpu_threads)) if minimum]
+                return self._walk(index, max(1, min_free_gpus) if models else min_free_gpus, checks, limit)
+
+        if not ranges:
+            result = set(hosts)
+        else:
+            ranges.sort(key=lambda r: len(r[0]))
+            result = set(ranges[0][0])
+            for ids, field, minimum in ranges[1:]:
+                if not result:
+                    break
+                if field is not None and len(result) * 4 < len(ids):
+                    # Few candidates left: checking them beats walking the range
+                    result = {m for m in result if hosts[m][field] >= minimum}
+                else:
+                    result.intersection_update(ids)
+
+        if multi_model:
+            need = max(1, min_free_gpus)
+            for machine_id in result & multi_model:
+                free_models = hosts[machine_id]["free_gpu_models"]
+                if sum(free_models.get(m, 0) for m in models) < need:
+                    result.discard(machine_id)
+
+        return self._ranked(result, models, mixed, limit)
+
+    def _walk(self, index, need, checks, limit):
+        """The first `limit` hosts in ranking order with index value >= need that pass every check"""
+        hosts = self.hosts
+        matches = []
+        for value, ids in index.groups():
+            if value < need:
+                break
+            for machine_id in ids:
+                host = hosts[machine_id]
+                if all(host[field] >= minimum for field, minimum in checks):
+                    matches.append(machine_id)
+                    if len(matches) == limit:
+                        return matches
+        return matches
+
+    def _ranked(self, result, models, mixed, limit):
+        """
+        Matches with the most free (matching) GPUs first, ties by machine
+        ID, cut to limit. Walks the ranking index a value at a time; only
+        hosts with free GPUs of several matching models need summing.
+        """
+        if models and len(models) > 1:
+            buckets = {}  # Free matching GPUs -> machine IDs
+            for model in models:
+                for value, ids in self.models[model].groups():
+                    buckets.setdefault(value, []).extend(m for m in ids if m in result and m not in mixed)
+            for machine_id in result & mixed:
+                free_models = self.hosts[machine_id]["free_gpu_models"]
+                buckets.setdefault(sum(free_models.get(m, 0) for m in models), []).append(machine_id)
+            groups = ((value, sorted(buckets[value])) for value in sorted(buckets, reverse=True))
+        else:
+            groups = (self.models[models[0]] if models else self.free_gpus).groups()
+        matches = []
+        remaining = len(result)
+        for _, ids in groups:
+            if not remaining:
+                break
+            found = list(filter(result.__contains__, ids))
+            remaining -= len(found)
+            matches += found
+            if limit and len(matches) >= limit:
+                return matches[:limit]
+        return matches
@@ -0,0 +1,185 @@
+"""
+Self-instrumentation for the agent.
+
+Fixed-bucket latency histograms for Socket.IO handlers, collectors and
+emits, an event-loop lag monitor and the agent's own CPU/RSS. Recording a
+sample is a bisect plus two additions, cheap enough to leave on in
+production.
+"""
+import asyncio
+import bisect
+import functools
+import inspect
+import time
+
+
+# Upper bounds in seconds: 100us .. ~52s, doubling each step
+DEFAULT_BUCKETS = tuple(0.0001 * 2 ** i for i in range(20))
+
+
+class Histogram:
+    """Cumulative latency histogram with fixed bucket bounds"""
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        """Millisecond summary used by the get_agent_stats event"""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class Timer:
+    """Context manager that records its duration into a histogram"""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    """Registry of histograms and error counters keyed by (kind, name)"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.errors = {}
+        self.loop_lag = Histogram()
+        self.last_loop_lag = 0.0
+        self.process = None  # psutil.Process, created on first use to keep imports light
+
+    def histogram(self, kind, name):
+        key = (kind, name)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+            self.errors[key] = 0
+        return hist
+
+    def timer(self, kind, name):
+        return Timer(self.histogram(kind, name))
+
+    def handler(self, fn):
+        """
+        Wrap a Socket.IO event handler.
+
+        Extra positional arguments beyond what the handler declares (the
+        auth dict on connect, the reason on disconnect) are dropped, so
+        python-socketio's signature fallbacks never count as errors.
+        """
+        return self._wrap("handler", fn)
+
+    def collector(self, fn):
+        """Wrap a sync or async collector function"""
+        return self._wrap("collector", fn)
+
+    def _wrap(self, kind, fn):
+        key = (kind, fn.__name__)
+        hist = self.histogram(kind, fn.__name__)
+        params = inspect.signature(fn).parameters.values()
+        max_args = None
+        if not any(p.kind == p.VAR_POSITIONAL for p in params):
+            max_args = sum(1 for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if max_args is not None:
+                    args = args[:max_args]
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    self.errors[key] += 1
+                    raise
+                finally:
+                    hist.observe(time.perf_counter() - start)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                except Exception:
+                    self.errors[key] += 1
+                    raise
+                finally:
+                    hist.observe(time.perf_counter() - start)
+        return wrapper
+
+    async def monitor_loop_lag(self, interval=0.5):
+        """Measure how late the event loop wakes us up compared to the request"""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - start - interval)
+            self.last_loop_lag = lag
+            self.loop_lag.observe(lag)
+
+    def process_stats(self):
+        if self.process is None:
+            import psutil
+            self.process = psutil.Process()
+            self.process.cpu_percent(interval=None)  # Prime; the first reading is 0
+        with self.process.oneshot():
+            stats = {
+                "cpu_percent": self.process.cpu_percent(interval=None),
+                "rss_bytes": self.process.memory_info().rss,
+                "threads": self.process.num_threads(),
+            }
+        return stats
+
+    def snapshot(self):
+        """Everything as plain data, grouped by kind"""
+        result = {}
+        for (kind, name), hist in self.histograms.items():
+            entry = hist.summary()
+            entry["errors"] = self.errors[(kind, name)]
+            result.setdefault(kind + "s", {})[name] = entry
+        result["event_loop_lag"] = dict(self.loop_lag.summary(),
+                                        last_ms=round(self.last_loop_lag * 1000, 3))
+        result["process"] = self.process_stats()
+        return result
+
+    def series(self, kind):
+        """(labels, histogram) pairs for one kind, for the metrics renderer"""
+        return [({kind: name}, hist) for (k, name), hist in self.histograms.items() if k == kind]
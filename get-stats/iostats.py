@@ -0,0 +1,85 @@
+"""
+Disk and network throughput from kernel counter deltas.
+
+psutil only exposes cumulative counters. IoRates keeps the previous
+reading per device and turns each new one into per-second rates. It is
+called once per sampler tick. A device's row dict is created the first
+time the device is seen and then updated in place; the row list is only
+rebuilt when devices come or go. After psutil's own read, a tick costs a
+handful of float operations per device. Include and exclude regexes
+decide which devices are reported. The decision is cached per device
+name, so the regexes run once per device rather than once per tick.
+"""
+import re
+import time
+
+
+class DeviceFilter:
+    """Include/exclude regexes over device names, cached per name"""
+
+    def __init__(self, include=None, exclude=None):
+        self.include = re.compile(include) if include else None
+        self.exclude = re.compile(exclude) if exclude else None
+        self._cache = {}
+
+    def __call__(self, name):
+        allowed = self._cache.get(name)
+        if allowed is None:
+            allowed = self._cache[name] = (
+                (self.include is None or self.include.search(name) is not None)
+                and (self.exclude is None or self.exclude.search(name) is None))
+        return allowed
+
+
+class IoRates:
+    """
+    Per-device rates from cumulative counters.
+
+    fields maps an output key to the counter attribute it is derived from,
+    e.g. {"Read_Bytes_Per_Sec": "read_bytes"}. name_key is the row key that
+    holds the device name.
+    """
+
+    def __init__(self, fields, name_key, device_filter=None):
+        self.fields = tuple(fields.items())
+        self.name_key = name_key
+        self.filter = device_filter or DeviceFilter()
+        self.previous = {}  # device -> list of counter values, updated in place
+        self.rows = {}  # device -> output dict, reused between ticks
+        self.last_time = None
+        self.current = []  # Rows of the latest update, in device order
+
+    def update(self, counters, now=None):
+        """Feed one {device: counters} reading; returns the list of rows"""
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.last_time if self.last_time is not None else 0.0
+        self.last_time = now
+
+        seen = 0
+        changed = False
+        for device, stats in counters.items():
+            if not self.filter(device):
+                continue
+            seen += 1
+            row = self.rows.get(device)
+            if row is None:
+                row = self.rows[device] = {self.name_key: device}
+                self.previous[device] = [None] * len(self.fields)
+                changed = True
+            previous = self.previous[device]
+            for i, (key, attr) in enumerate(self.fields):
+                value = getattr(stats, attr)
+                old = previous[i]
+                previous[i] = value
+                # A counter that went backwards was reset (device re-added, wrap)
+                if old is None or elapsed <= 0 or value < old:
+                    row[key] = 0.0
+                else:
+                    row[key] = round((value - old) / elapsed, 1)
+
+        if changed or seen != len(self.rows):
+            for device in [d for d in self.rows if d not in counters or not self.filter(d)]:
+                del self.rows[device]
+                self.previous.pop(device, None)
+            self.current = [self.rows[d] for d in sorted(self.rows)]
+        return self.current
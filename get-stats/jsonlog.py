@@ -0,0 +1,208 @@
+"""
+Non-blocking structured logging for the agent.
+
+Log calls only build a LogRecord and put it on a bounded queue; a
+background thread formats the records as JSON lines and writes them, so a
+slow terminal, pipe or file never stalls the event loop. When the writer
+falls behind, records are dropped and counted instead of blocking.
+
+Each event name gets a token bucket so a reconnect storm logs a burst and
+then a trickle, with the number of suppressed records attached to the next
+one that gets through. Very chatty events can additionally be sampled
+(1 in N).
+
+    log = jsonlog.get_logger("agent")
+    log.info("client_connected", sid=sid)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# Per-event token bucket: sustained records per second and burst size
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 50
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, event and the event's fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        sampled = getattr(record, "sampled", 0)
+        if sampled:
+            entry["sampled"] = sampled
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue records without ever blocking; count the ones that do not fit"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Same process, nothing to pickle: leave formatting to the writer thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class EventRateFilter(logging.Filter):
+    """
+    Token bucket per event name, plus optional 1-in-N sampling.
+
+    limits maps an event name to (rate, burst); samples maps an event name
+    to N. Warnings and errors are never sampled, only rate limited.
+    Loggers are called from worker threads too, so the state is locked.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, limits=None, samples=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.limits = dict(limits or {})
+        self.samples = dict(samples or {})
+        self.lock = threading.Lock()  # Guards buckets, seen and the counters
+        self.buckets = {}  # event -> [tokens, last refill, suppressed since last pass]
+        self.seen = {}
+        self.suppressed = 0  # Rate limited plus sampled out
+        self.sampled_out = 0
+
+    def filter(self, record):
+        event = record.msg
+        n = self.samples.get(event)
+        sampled = n and record.levelno < logging.WARNING
+        with self.lock:
+            if sampled:
+                count = self.seen.get(event, 0)
+                self.seen[event] = count + 1
+                if count % n:
+                    self.suppressed += 1
+                    self.sampled_out += 1
+                    return False
+
+            rate, burst = self.limits.get(event, (self.rate, self.burst))
+            now = time.monotonic()
+            bucket = self.buckets.get(event)
+            if bucket is None:
+                bucket = self.buckets[event] = [burst, now, 0]
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        # Flag only records that are actually written
+        if suppressed:
+            record.suppressed = suppressed
+        if sampled:
+            record.sampled = n
+        return True
+
+
+class StructuredLogger:
+    """Thin wrapper so call sites pass an event name and keyword fields"""
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def _log(self, level, event, fields, exc_info=None):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+_handler = None
+_filter = None
+_listener = None
+
+
+def configure(stream=None, level=None, queue_size=10000, limits=None, samples=None):
+    """
+    Route the agent's loggers through the queue and start the writer thread.
+
+    Safe to call more than once; later calls replace the previous setup.
+    The level defaults to $AGENT_LOG_LEVEL or INFO.
+    """
+    global _handler, _filter, _listener
+    shutdown()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    _handler = DroppingQueueHandler(queue.Queue(queue_size))
+    _filter = EventRateFilter(limits=limits, samples=samples)
+    _handler.addFilter(_filter)
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger("agent")
+    root.handlers[:] = [_handler]
+    root.setLevel(level or os.environ.get("AGENT_LOG_LEVEL", "INFO").upper())
+    root.propagate = False
+    return root
+
+
+def shutdown():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats():
+    """Records dropped on a full queue, and suppressed by rate limiting or sampling (of which sampled out)"""
+    return {
+        "dropped": _handler.dropped if _handler else 0,
+        "suppressed": _filter.suppressed if _filter else 0,
+        "sampled_out": _filter.sampled_out if _filter else 0,
+    }
+
+
+def get_logger(name="agent"):
+    if not name.startswith("agent"):
+        name = "agent." + name
+    return StructuredLogger(logging.getLogger(name))
+
+
+atexit.register(shutdown)
@@ -0,0 +1,143 @@
+"""
+Outbound priority lanes for Engine.IO sockets.
+
+Every packet for a client, from container_result to usage_stats, goes
+through one Engine.IO queue per socket and then the kernel's send buffer.
+On a slow link the queue fills with telemetry, and a command result or a
+ping waits behind all of it; a backlog past the ping timeout drops the
+connection.
+
+install() gives each socket a LaneQueue with two lanes. Telemetry events
+(usage_stats, top) go in the low lane and are conflated: each is a full
+snapshot, so a newer frame replaces a queued one of the same event instead
+of waiting behind it. Everything else, including command results, alerts
+and Engine.IO pings, goes in the high lane and is always taken first.
+Namespaces would not help here, since all of a client's namespaces share
+one Engine.IO socket and queue.
+
+The lanes only work if the backlog stays in the queue, so install() also
+caps what sits below it: TCP_NOTSENT_LOWAT limits unsent bytes in the
+kernel, and a transport write limit with a WebSocket writer that checks
+it after every frame makes aiohttp wait for the socket instead of
+buffering without bound. What is left below the lanes is about twice
+send_buffer plus the frame being written and the bytes in flight.
+"""
+import asyncio
+import collections
+import re
+import socket
+
+from aiohttp.web import WebSocketResponse
+from engineio import packet
+
+DEFAULT_SEND_BUFFER = 8192  # Unsent bytes the kernel, and again the transport, may hold
+TCP_NOTSENT_LOWAT = getattr(socket, "TCP_NOTSENT_LOWAT", 25)
+
+# Non-binary Socket.IO event ('2'), optional namespace and ack id, then the event name
+_EVENT_RE = re.compile(r'2(?:/[^,]*,)?\d*\["((?:[^"\\]|\\.)*)"')
+
+
+def telemetry_event(pkt, events):
+    """Event name if pkt is a conflatable telemetry packet, else None"""
+    if pkt is None or pkt.packet_type != packet.MESSAGE or not isinstance(pkt.data, str):
+        return None
+    match = _EVENT_RE.match(pkt.data)
+    if match is None or match.group(1) not in events:
+        return None
+    return match.group(1)
+
+
+class LanePolicy:
+    """Which events are telemetry, plus counts for /metrics"""
+
+    def __init__(self, telemetry_events, send_buffer=DEFAULT_SEND_BUFFER):
+        self.telemetry_events = frozenset(telemetry_events)
+        self.send_buffer = send_buffer
+        self.conflated = 0  # Telemetry frames replaced by a newer one before sending
+        self.overtaken = 0  # High-lane packets queued while telemetry was waiting
+
+
+class LaneQueue(asyncio.Queue):
+    """asyncio.Queue with a high lane and a conflating telemetry lane"""
+
+    def __init__(self, policy):
+        self.policy = policy
+        super().__init__()
+
+    def _init(self, maxsize):
+        self._high = collections.deque()
+        self._telemetry = collections.deque()  # (event, packet), at most one per event
+
+    def qsize(self):
+        return len(self._high) + len(self._telemetry)
+
+    def empty(self):
+        return not (self._high or self._telemetry)
+
+    def _put(self, item):
+        event = telemetry_event(item, self.policy.telemetry_events)
+        if event is None:
+            if self._telemetry:
+                self.policy.overtaken += 1
+            self._high.append(item)
+            return
+        for i, (queued_event, _) in enumerate(self._telemetry):
+            if queued_event == event:
+                self._telemetry[i] = (event, item)
+                # put_nowait() counts one more unfinished task after _put();
+                # the replaced packet will never be taken, so keep join() balanced
+                self._unfinished_tasks -= 1
+                self.policy.conflated += 1
+                return
+        self._telemetry.append((event, item))
+
+    def _get(self):
+        if self._high:
+            return self._high.popleft()
+        return self._telemetry.popleft()[1]
+
+
+def limit_send_buffer(transport, limit):
+    """Keep at most about limit unsent bytes in the kernel and in the transport"""
+    sock = transport.get_extra_info("socket")
+    if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, TCP_NOTSENT_LOWAT, limit)
+        except OSError:
+            pass  # Not Linux or macOS; the transport limit still applies
+    transport.set_write_buffer_limits(high=limit)
+
+
+def websocket_driver(base, policy):
+    """Wrap an Engine.IO aiohttp WebSocket driver so its connection buffers stay small"""
+
+    class LaneWebSocket(base):
+        async def __call__(self, environ):
+            request = environ['aiohttp.request']
+            limit_send_buffer(request.transport, policy.send_buffer)
+            # As the base driver, but the writer checks for a paused transport after every frame
+            self._sock = WebSocketResponse(max_msg_size=self.server.max_http_buffer_size, writer_limit=1)
+            await self._sock.prepare(request)
+            self.environ = environ
+            await self.handler(self)
+            return self._sock
+
+    return LaneWebSocket
+
+
+def install(server, telemetry_events, send_buffer=DEFAULT_SEND_BUFFER):
+    """
+    Give every Engine.IO socket of a socketio.AsyncServer a LaneQueue and
+    small send buffers. Call after compression.install(), whose driver
+    this wraps. Returns the policy.
+    """
+    drivers = getattr(server.eio, "_async", None)
+    if not isinstance(drivers, dict) or "websocket" not in drivers or not hasattr(server.eio, "create_queue"):
+        raise RuntimeError("Cannot install lanes: python-engineio has no AsyncServer._async['websocket'] driver "
+                           "or create_queue; install the version in requirements.txt")
+    if not hasattr(asyncio.Queue(), "_unfinished_tasks"):
+        raise RuntimeError("Cannot install lanes: asyncio.Queue has no _unfinished_tasks count")
+    policy = LanePolicy(telemetry_events, send_buffer)
+    server.eio.create_queue = lambda *args, **kwargs: LaneQueue(policy)
+    server.eio._async = dict(server.eio._async, websocket=websocket_driver(server.eio._async['websocket'], policy))
+    return policy
@@ -0,0 +1,426 @@
+"""
+Rental metering: per-container CPU-seconds, GPU-seconds and memory GB-hours.
+
+Every sampler tick CgroupReader reads each running container's cgroup CPU
+counter and memory usage, and Meter.tick() integrates them into running
+totals. CPU-seconds are the growth of the cgroup's own usage counter, so
+CPU burned between ticks is never lost. Memory and GPUs are gauges,
+integrated with the trapezoid rule between the container's consecutive
+readings; the step is capped at max_gap, so a stalled sampler does not
+bill time it did not observe. GPU-seconds count the GPUs a container holds.
+
+Once per record_interval the cumulative totals of every container go to an
+append-only JSON-lines ledger, plus a final record when a container goes
+away. Ledger.append() only buffers; commit() writes the whole batch with
+one write and one fsync (group commit), and records appended while a
+commit is running go into the next batch. The same cumulative checkpoints
+are kept in memory per container, so a report over any window is two
+binary searches per container instead of a scan of samples. On startup the
+ledger is replayed once to restore totals and checkpoints; the stored raw
+CPU counter lets CPU used while the agent was down still be billed.
+
+A container's cgroup CPU counter starts when the container does, so when
+the first reading comes with Docker's State.StartedAt, the whole counter
+is billed and first_seen is the start time rather than the first tick.
+Reports cover the last `retention` seconds: evict() drops containers that
+stopped before that and whose final record has been committed, and trims
+older checkpoints down to one per container; Ledger.compact() rewrites the
+file the same way, so neither grows without bound.
+
+CgroupReader.read_io() reads a container's block I/O counters, the time
+its tasks stalled on I/O and its PID count against its limit, which show
+whether blkio and pids limits are being enforced.
+"""
+import bisect
+import collections
+import json
+import os
+import threading
+from array import array
+
+from proctop import read_file
+
+GIB = 1 << 30
+
+# Container cgroup directories for the systemd and cgroupfs drivers
+_CGROUP_DIRS = ("system.slice/docker-{id}.scope", "docker/{id}")
+_V1_CPU_CONTROLLERS = ("cpuacct", "cpu,cpuacct")
+
+# Counter names as in psutil's disk counters, so iostats.IoRates can rate them.
+# io_stall_seconds is the time all of the cgroup's tasks waited on I/O
+# (io.pressure "full", cgroup v2 only, else None); pids_limit_hits counts
+# forks refused at pids_max (None when unlimited)
+IoStats = collections.namedtuple("IoStats", "read_bytes write_bytes read_count write_count io_stall_seconds "
+                                            "pids pids_max pids_limit_hits")
+
+
+class CgroupReader:
+    """Cumulative CPU time and current memory of container cgroups, v1 or v2"""
+
+    def __init__(self, root="/sys/fs/cgroup"):
+        self.root = root
+        self.v2 = os.path.exists(os.path.join(root, "cgroup.controllers"))
+        self.paths = {}  # container id -> (cpu file, memory file)
+        self.io_dirs = {}  # container id -> (blkio or unified dir, pids dir)
+
+    def _first_dir(self, parents, container_id):
+        for parent in parents:
+            for pattern in _CGROUP_DIRS:
+                directory = os.path.join(parent, pattern.format(id=container_id))
+                if os.path.isdir(directory):
+                    return directory
+        return None
+
+    def _locate(self, container_id):
+        if self.v2:
+            directory = self._first_dir((self.root,), container_id)
+            if directory is None:
+                return None
+            return os.path.join(directory, "cpu.stat"), os.path.join(directory, "memory.current")
+        cpu = self._first_dir([os.path.join(self.root, c) for c in _V1_CPU_CONTROLLERS], container_id)
+        memory = self._first_dir((os.path.join(self.root, "memory"),), container_id)
+        if cpu is None or memory is None:
+            return None
+        return os.path.join(cpu, "cpuacct.usage"), os.path.join(memory, "memory.usage_in_bytes")
+
+    def read(self, container_id):
+        """(CPU seconds since the cgroup was created, memory bytes), or None"""
+        paths = self.paths.get(container_id)
+        if paths is None:
+            paths = self._locate(container_id)
+            if paths is None:
+                return None
+            self.paths[container_id] = paths
+        cpu_data = read_file(paths[0])
+        memory_data = read_file(paths[1])
+        if cpu_data is None or memory_data is None:
+            del self.paths[container_id]  # Gone, or recreated somewhere else
+            return None
+        try:
+            if self.v2:
+                for line in cpu_data.splitlines():
+                    if line.startswith(b"usage_usec "):
+                        cpu = int(line[11:]) / 1e6
+                        break
+                else:
+                    return None
+            else:
+                cpu = int(cpu_data) / 1e9
+            return cpu, int(memory_data)
+        except ValueError:
+            return None
+
+
+    def _locate_io(self, container_id):
+        if self.v2:
+            directory = self._first_dir((self.root,), container_id)
+            return None if directory is None else (directory, directory)
+        blkio = self._first_dir((os.path.join(self.root, "blkio"),), container_id)
+        pids = self._first_dir((os.path.join(self.root, "pids"),), container_id)
+        return None if blkio is None or pids is None else (blkio, pids)
+
+    def read_io(self, container_id):
+        """IoStats for a container, or None"""
+        dirs = self.io_dirs.get(container_id)
+        if dirs is None:
+            dirs = self._locate_io(container_id)
+            if dirs is None:
+                return None
+            self.io_dirs[container_id] = dirs
+        io_dir, pids_dir = dirs
+        pids = read_file(os.path.join(pids_dir, "pids.current"))
+        if pids is None:
+            del self.io_dirs[container_id]
+            return None
+        try:
+            totals = {}  # io.stat key -> sum over devices
+            stall = None
+            if self.v2:
+                for line in (read_file(os.path.join(io_dir, "io.stat"), 65536) or b"").splitlines():
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition(b"=")
+                        totals[key] = totals.get(key, 0) + int(value)
+                for line in (read_file(os.path.join(io_dir, "io.pressure")) or b"").splitlines():
+                    if line.startswith(b"full "):
+                        stall = int(line.rpartition(b"total=")[2]) / 1e6
+            else:
+                for name, suffix in (("blkio.throttle.io_service_bytes_recursive", b"bytes"),
+                                     ("blkio.throttle.io_serviced_recursive", b"ios")):
+                    for line in (read_file(os.path.join(io_dir, name), 65536) or b"").splitlines():
+                        fields = line.split()
+                        if len(fields) == 3 and fields[1] in (b"Read", b"Write"):
+                            key = (b"r" if fields[1] == b"Read" else b"w") + suffix
+                            totals[key] = totals.get(key, 0) + int(fields[2])
+            pids_max = (read_file(os.path.join(pids_dir, "pids.max")) or b"max").strip()
+            pids_max = None if pids_max == b"max" else int(pids_max)
+            hits = None
+            for line in (read_file(os.path.join(pids_dir, "pids.events")) or b"").splitlines():
+                if line.startswith(b"max "):
+                    hits = int(line[4:])
+            return IoStats(totals.get(b"rbytes", 0), totals.get(b"wbytes", 0), totals.get(b"rios", 0),
+                           totals.get(b"wios", 0), stall, int(pids), pids_max, hits if pids_max is not None else None)
+        except ValueError:
+            return None
+
+
+class Ledger:
+    """Append-only JSON-lines file written in fsynced batches"""
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = []
+        self.lock = threading.Lock()  # Guards pending
+        self.commit_lock = threading.Lock()  # One batch on disk at a time
+        self.file = None
+        self.pending_t = None  # Time of the last record appended
+        self.committed_t = None  # Time of the last record on disk
+        self.commits = 0
+        self.records_written = 0
+        self.compactions = 0
+
+    def _parse(self, data):
+        records = []
+        for line in data.splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    def replay(self):
+        """Records already on disk; a torn last line from a crash is cut off"""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        records = self._parse(data[:end])
+        if records:
+            self.committed_t = max(record["t"] for record in records)
+        return records
+
+    def append(self, record):
+        line = json.dumps(record, separators=(",", ":"))
+        with self.lock:
+            self.pending.append(line)
+            self.pending_t = record["t"]
+
+    def commit(self):
+        """Write and fsync everything appended so far (blocking; run in a thread)"""
+        with self.commit_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+                batch_t = self.pending_t
+            if not batch:
+                return 0
+            if self.file is None:
+                self.file = open(self.path, "a")
+            self.file.write("\n".join(batch) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.committed_t = batch_t
+            self.commits += 1
+            self.records_written += len(batch)
+            return len(batch)
+
+    def compact(self, keep, cutoff):
+        """
+        Rewrite the file with only the records of containers in `keep`,
+        and of those only the last one at or before `cutoff` plus all
+        later ones (blocking; run in a thread). Returns (records before,
+        records after).
+        """
+        with self.commit_lock:
+            try:
+                with open(self.path, "rb") as f:
+                    records = self._parse(f.read())
+            except FileNotFoundError:
+                return 0, 0
+            bases = {}  # container id -> last record at or before cutoff
+            recent = []
+            for record in records:
+                if record["container_id"] not in keep:
+                    continue
+                if record["t"] <= cutoff:
+                    bases[record["container_id"]] = record
+                else:
+                    recent.append(record)
+            kept = sorted(bases.values(), key=lambda record: record["t"]) + recent
+            temporary = self.path + ".compact"
+            with open(temporary, "w") as f:
+                f.writelines(json.dumps(record, separators=(",", ":")) + "\n" for record in kept)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.file is not None:
+                self.file.close()
+                self.file = None  # The next commit appends to the new file
+            os.replace(temporary, self.path)
+            self.compactions += 1
+            return len(records), len(kept)
+
+
+class ContainerUsage:
+    __slots__ = ("container_id", "name", "cpu_seconds", "gpu_seconds", "memory_byte_seconds",
+                 "first_seen", "last_seen", "cpu_counter", "memory", "gpus", "last_read", "times", "checkpoints")
+
+    def __init__(self, container_id, name, now):
+        self.container_id = container_id
+        self.name = name
+        self.cpu_seconds = 0.0
+        self.gpu_seconds = 0.0
+        self.memory_byte_seconds = 0.0
+        self.first_seen = now
+        self.last_seen = now
+        self.cpu_counter = None  # Raw cgroup counter at the last reading
+        self.memory = 0  # Bytes at the last reading
+        self.gpus = 0
+        self.last_read = None  # Time of the last reading, None while not running
+        self.times = array("d")  # Checkpoint times, ascending
+        self.checkpoints = array("d")  # cpu, gpu, memory byte-seconds per checkpoint
+
+    def totals(self):
+        return self.cpu_seconds, self.gpu_seconds, self.memory_byte_seconds
+
+    def totals_at(self, when):
+        """Cumulative totals as of the last checkpoint at or before `when`"""
+        if when >= self.last_seen:
+            return self.totals()
+        index = bisect.bisect_right(self.times, when) - 1
+        if index < 0:
+            return 0.0, 0.0, 0.0
+        return tuple(self.checkpoints[3 * index:3 * index + 3])
+
+
+class Meter:
+    def __init__(self, ledger, record_interval=60.0, max_gap=10.0, retention=7 * 86400):
+        self.ledger = ledger
+        self.record_interval = record_interval
+        self.max_gap = max_gap
+        self.retention = retention
+        self.usage = {}  # container id -> ContainerUsage
+        self.last_record = None
+        self.ready = False  # Set once the ledger has been replayed
+
+    def restore(self, records):
+        """Rebuild totals and checkpoints from ledger records"""
+        for record in records:
+            usage = self.usage.get(record["container_id"])
+            if usage is None:
+                usage = self.usage[record["container_id"]] = ContainerUsage(
+                    record["container_id"], record.get("name"), record.get("first_seen", record["t"]))
+            usage.name = record.get("name") or usage.name
+            usage.cpu_seconds = record["cpu_seconds"]
+            usage.gpu_seconds = record["gpu_seconds"]
+            usage.memory_byte_seconds = record["memory_gb_hours"] * GIB * 3600
+            usage.cpu_counter = record.get("cpu_counter")
+            usage.last_seen = record["t"]
+            self._checkpoint(usage, record["t"])
+        self.ready = True
+
+    def _checkpoint(self, usage, now):
+        usage.times.append(now)
+        usage.checkpoints.extend(usage.totals())
+
+    def _record(self, usage, now):
+        self._checkpoint(usage, now)
+        self.ledger.append({
+            "t": round(now, 3),
+            "container_id": usage.container_id,
+            "name": usage.name,
+            "first_seen": round(usage.first_seen, 3),
+            "cpu_seconds": round(usage.cpu_seconds, 6),
+            "gpu_seconds": round(usage.gpu_seconds, 3),
+            "memory_gb_hours": usage.memory_byte_seconds / GIB / 3600,
+            "cpu_counter": usage.cpu_counter,
+        })
+
+    def tick(self, readings, now):
+        """
+        Integrate one sampler tick.
+
+        readings maps container id -> (name, cpu counter seconds, memory
+        bytes, GPUs held, start time or None) for every running container
+        that could be read.
+        """
+        for container_id, (name, cpu, memory, gpus, started) in readings.items():
+            usage = self.usage.get(container_id)
+            if usage is None:
+                usage = self.usage[container_id] = ContainerUsage(container_id, name, now)
+                if started is not None:
+                    usage.first_seen = min(started, now)
+                    usage.cpu_seconds = cpu  # The counter started with the container
+            elif started is not None and started < usage.first_seen:
+                usage.first_seen = started  # Restored from records written after it started
+            if usage.cpu_counter is not None:
+                delta = cpu - usage.cpu_counter
+                usage.cpu_seconds += delta if delta >= 0 else cpu  # Counter reset: container restarted
+            if usage.last_read is not None:
+                elapsed = min(max(now - usage.last_read, 0.0), self.max_gap)
+                usage.memory_byte_seconds += (usage.memory + memory) / 2 * elapsed
+                usage.gpu_seconds += (usage.gpus + gpus) / 2 * elapsed
+            usage.name = name
+            usage.cpu_counter = cpu
+            usage.memory = memory
+            usage.gpus = gpus
+            usage.last_read = usage.last_seen = now
+
+        for usage in self.usage.values():
+            if usage.last_read is not None and usage.container_id not in readings:
+                usage.last_read = None  # Stopped: don't integrate the gap if it comes back
+                self._record(usage, now)
+
+        if self.last_record is None or now - self.last_record >= self.record_interval:
+            self.last_record = now
+            for usage in self.usage.values():
+                if usage.last_read is not None:
+                    self._record(usage, now)
+
+    def evict(self, now):
+        """
+        Forget containers that stopped more than `retention` ago and whose
+        final record is committed, and trim everyone's checkpoints to the
+        last one at or before that; returns how many were forgotten
+        """
+        cutoff = now - self.retention
+        committed = self.ledger.committed_t
+        evicted = 0
+        for container_id, usage in list(self.usage.items()):
+            if usage.last_read is None and usage.last_seen < cutoff and \
+                    committed is not None and round(usage.last_seen, 3) <= committed:
+                del self.usage[container_id]
+                evicted += 1
+                continue
+            index = bisect.bisect_right(usage.times, cutoff) - 1
+            if index > 0:
+                del usage.times[:index]
+                del usage.checkpoints[:3 * index]
+        return evicted
+
+    def report(self, container_id=None, start=None, end=None):
+        """Totals per container over [start, end] (seconds since the epoch; open ends allowed)"""
+        rows = []
+        for usage in self.usage.values():
+            if container_id is not None and usage.container_id != container_id:
+                continue
+            if (end is not None and usage.first_seen > end) or (start is not None and usage.last_seen < start):
+                continue
+            cpu, gpu, memory = usage.totals() if end is None else usage.totals_at(end)
+            if start is not None:
+                cpu_before, gpu_before, memory_before = usage.totals_at(start)
+                cpu, gpu, memory = cpu - cpu_before, gpu - gpu_before, memory - memory_before
+            rows.append({
+                "container_id": usage.container_id,
+                "name": usage.name,
+                "cpu_seconds": round(cpu, 3),
+                "gpu_seconds": round(gpu, 3),
+                "memory_gb_hours": round(memory / GIB / 3600, 6),
+                "first_seen": usage.first_seen,
+                "last_seen": usage.last_seen,
+                "running": usage.last_read is not None,
+            })
+        rows.sort(key=lambda row: row["cpu_seconds"], reverse=True)
+        return rows
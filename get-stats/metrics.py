@@ -0,0 +1,81 @@
+"""
+Helpers for the Prometheus text exposition format (version 0.0.4).
+
+The agent renders its metrics once per sampler tick into bytes and serves
+the same buffer to every scrape, so the format code lives here and stays
+out of the request path.
+"""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value):
+    """Escape a label value as required by the text format"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class MetricsText:
+    """Accumulates metric families and renders them to bytes"""
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.lines = []
+
+    def family(self, name, kind, help_text, samples):
+        """
+        Add one metric family.
+
+        samples is an iterable of (labels, value) pairs where labels is a dict
+        or None. Families without samples are still declared so dashboards
+        see them from the first scrape.
+        """
+        full_name = self.prefix + name
+        self.lines.append(f"# HELP {full_name} {help_text}")
+        self.lines.append(f"# TYPE {full_name} {kind}")
+        for labels, value in samples:
+            if labels:
+                label_text = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+                self.lines.append(f"{full_name}{{{label_text}}} {format_value(value)}")
+            else:
+                self.lines.append(f"{full_name} {format_value(value)}")
+
+    def gauge(self, name, help_text, value, labels=None):
+        self.family(name, "gauge", help_text, [(labels, value)])
+
+    def counter(self, name, help_text, value, labels=None):
+        self.family(name, "counter", help_text, [(labels, value)])
+
+    def histogram(self, name, help_text, series):
+        """
+        Add a histogram family.
+
+        series is an iterable of (labels, hist) pairs where hist has
+        bounds, counts (one extra +Inf slot), count and sum attributes.
+        """
+        full_name = self.prefix + name
+        self.lines.append(f"# HELP {full_name} {help_text}")
+        self.lines.append(f"# TYPE {full_name} histogram")
+        for labels, hist in series:
+            base = ",".join(f'{k}="{escape_label(v)}"' for k, v in (labels or {}).items())
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, n in zip(hist.bounds, hist.counts):
+                cumulative += n
+                self.lines.append(f'{full_name}_bucket{{{base}{sep}le="{bound:g}"}} {cumulative}')
+            self.lines.append(f'{full_name}_bucket{{{base}{sep}le="+Inf"}} {hist.count}')
+            suffix = f"{{{base}}}" if base else ""
+            self.lines.append(f"{full_name}_sum{suffix} {format_value(hist.sum)}")
+            self.lines.append(f"{full_name}_count{suffix} {hist.count}")
+
+    def render(self):
+        return ("\n".join(self.lines) + "\n").encode("utf-8")
@@ -0,0 +1,162 @@
+"""
+Incremental top-N process view with container attribution.
+
+ProcessTable keeps one small record per live PID between refreshes. Each
+refresh lists PROC_ROOT and reads only /proc/<pid>/stat for every PID; a
+PID's cgroup file (for its container ID) and name are read once, when the
+PID first appears or is reused by a new process (different start time).
+CPU percent comes from utime+stime deltas between refreshes, memory from
+the RSS page count, so no psutil.Process objects are created per tick.
+
+ContainerMap answers the same PID -> container question for a handful of
+PIDs named by someone else (nvidia-smi's compute apps), with the same
+start-time check against PID reuse.
+"""
+import heapq
+import os
+import re
+import time
+
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Docker and containerd cgroup paths, v1 (/docker/<id>) and v2
+# (/system.slice/docker-<id>.scope, cri-containerd-<id>.scope, ...)
+_CONTAINER_ID_RE = re.compile(rb"[/-]([0-9a-f]{64})(?:\.scope)?\s*$", re.MULTILINE)
+
+
+def read_file(path, size=4096):
+    """One read(2) of a small procfs file; None if the process is gone"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return os.read(fd, size)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def container_id_from_cgroup(data):
+    """Container ID from the contents of /proc/<pid>/cgroup, or None"""
+    match = _CONTAINER_ID_RE.search(data or b"")
+    return match.group(1).decode() if match else None
+
+
+def stat_start(data):
+    """Start time (clock ticks after boot) from the contents of /proc/<pid>/stat"""
+    return int(data[data.rfind(b")") + 2:].split()[19])
+
+
+class ContainerMap:
+    """PID -> container ID, cached per process (PID plus start time)"""
+
+    def __init__(self, proc_root="/proc"):
+        self.proc_root = proc_root
+        self.cache = {}  # pid -> (start, container_id)
+        self.cgroup_reads = 0
+
+    def lookup(self, pid):
+        """Container ID of a live PID, None for host processes and PIDs that are gone"""
+        data = read_file(f"{self.proc_root}/{pid}/stat")
+        if not data:
+            self.cache.pop(pid, None)
+            return None
+        start = stat_start(data)
+        cached = self.cache.get(pid)
+        if cached is not None and cached[0] == start:
+            return cached[1]
+        self.cgroup_reads += 1
+        container_id = container_id_from_cgroup(read_file(f"{self.proc_root}/{pid}/cgroup"))
+        self.cache[pid] = (start, container_id)
+        return container_id
+
+    def retain(self, pids):
+        """Drop cached PIDs that are not in pids"""
+        for pid in self.cache.keys() - set(pids):
+            del self.cache[pid]
+
+
+class ProcessRecord:
+    __slots__ = ("pid", "name", "start", "container_id", "ticks", "cpu_percent", "rss_bytes")
+
+    def __init__(self, pid, name, start, container_id, ticks):
+        self.pid = pid
+        self.name = name
+        self.start = start
+        self.container_id = container_id
+        self.ticks = ticks
+        self.cpu_percent = 0.0
+        self.rss_bytes = 0
+
+
+class ProcessTable:
+    """Per-PID CPU and memory, refreshed incrementally from procfs"""
+
+    def __init__(self, proc_root="/proc"):
+        self.proc_root = proc_root
+        self.records = {}  # pid -> ProcessRecord
+        self.last_refresh = None
+        self.stat_reads = 0
+        self.cgroup_reads = 0
+
+    def refresh(self, now=None):
+        """Read /proc/<pid>/stat for every live PID and update the records"""
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.last_refresh if self.last_refresh is not None else 0.0
+        self.last_refresh = now
+        scale = 100.0 / (elapsed * CLK_TCK) if elapsed > 0 else 0.0
+
+        root = self.proc_root
+        records = self.records
+        live = set()
+        for entry in os.listdir(root):
+            if not entry.isdigit():
+                continue
+            pid = int(entry)
+            data = read_file(f"{root}/{entry}/stat")
+            self.stat_reads += 1
+            if not data:
+                continue
+            # The name is in parentheses and may itself contain ') '
+            close = data.rfind(b")")
+            fields = data[close + 2:].split()
+            ticks = int(fields[11]) + int(fields[12])  # utime + stime
+            start = int(fields[19])
+            record = records.get(pid)
+            if record is None or record.start != start:
+                name = data[data.find(b"(") + 1:close].decode(errors="replace")
+                self.cgroup_reads += 1
+                container_id = container_id_from_cgroup(read_file(f"{root}/{entry}/cgroup"))
+                record = records[pid] = ProcessRecord(pid, name, start, container_id, ticks)
+            else:
+                record.cpu_percent = round((ticks - record.ticks) * scale, 1)
+                record.ticks = ticks
+            record.rss_bytes = int(fields[21]) * PAGE_SIZE
+            live.add(pid)
+
+        if len(live) != len(records):
+            for pid in records.keys() - live:
+                del records[pid]
+        return records
+
+    def top(self, n, key):
+        """The n records with the largest value of key ('cpu_percent' or 'rss_bytes')"""
+        return heapq.nlargest(n, self.records.values(), key=lambda r: getattr(r, key))
+
+    def containers(self):
+        """{container_id: [cpu_percent, rss_bytes, processes]} summed over each container's PIDs"""
+        totals = {}
+        for record in self.records.values():
+            if record.container_id is None:
+                continue
+            entry = totals.get(record.container_id)
+            if entry is None:
+                entry = totals[record.container_id] = [0.0, 0, 0]
+            entry[0] += record.cpu_percent
+            entry[1] += record.rss_bytes
+            entry[2] += 1
+        return totals
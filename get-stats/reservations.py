@@ -0,0 +1,183 @@
+"""
+Host reservation accounting for CPU, memory and cpusets.
+
+A container's reservation is what its limits promise it: CPUs from its CFS
+quota (or NanoCpus), memory from its memory limit, and the CPUs of its
+cpuset. A container without a limit reserves nothing of that resource.
+Book keeps the reservation of every running container and checks a
+change against the host: total CPUs and memory promised must stay within
+capacity times the overcommit ratio, and a cpuset may only use host CPUs
+that no other container is pinned to.
+
+The book is filled by inspecting each container once; whoever changes a
+container's limits records the new reservation with set(). A container
+still being created is held under a provisional key (hold()) and moved to
+its id once it exists (confirm()), so the slow create need not run under
+the lock.
+"""
+import itertools
+import threading
+
+CPU_PERIOD = 100000  # Docker's default CFS period, in microseconds
+
+
+def parse_cpuset(spec):
+    """CPU numbers of a cpuset list like "0-3,8,10-11" """
+    cpus = set()
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return frozenset(cpus)
+
+
+def format_cpuset(cpus):
+    """The shortest cpuset list for a set of CPU numbers"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+class Reservation:
+    __slots__ = ("cpus", "memory", "cpuset")
+
+    def __init__(self, cpus=0.0, memory=0, cpuset=frozenset()):
+        self.cpus = cpus  # CPUs of quota; 0 when unlimited
+        self.memory = memory  # Bytes; 0 when unlimited
+        self.cpuset = cpuset  # Pinned CPUs; empty when it may run anywhere
+
+    @classmethod
+    def from_host_config(cls, host_config):
+        if host_config.get("NanoCpus"):
+            cpus = host_config["NanoCpus"] / 1e9
+        elif (host_config.get("CpuQuota") or 0) > 0:
+            cpus = host_config["CpuQuota"] / (host_config.get("CpuPeriod") or CPU_PERIOD)
+        else:
+            cpus = 0.0
+        return cls(cpus, host_config.get("Memory") or 0, parse_cpuset(host_config.get("CpusetCpus")))
+
+    def updated(self, cpu_quota=None, cpu_period=None, mem_limit=None, cpuset_cpus=None, **_):
+        """This reservation after a container.update() with these arguments (mem_limit in bytes)"""
+        cpus = self.cpus
+        if cpu_quota is not None:
+            cpus = cpu_quota / (cpu_period or CPU_PERIOD) if cpu_quota > 0 else 0.0
+        memory = self.memory if mem_limit is None else mem_limit
+        cpuset = self.cpuset if cpuset_cpus is None else parse_cpuset(cpuset_cpus)
+        return Reservation(cpus, memory, cpuset)
+
+    def as_dict(self):
+        return {"cpus": round(self.cpus, 3), "memory": self.memory, "cpuset": format_cpuset(self.cpuset)}
+
+
+class Book:
+    """
+    Reservations of the running containers. capacity() returns the host's
+    (CPU numbers, memory bytes); CPUs may be offline or numbered with gaps,
+    so a cpuset is checked against the CPU numbers, not their count. It is
+    called on every check, so it may be lazy.
+    """
+
+    def __init__(self, capacity, cpu_overcommit=1.0, memory_overcommit=1.0):
+        self.capacity = capacity
+        self.cpu_overcommit = cpu_overcommit
+        self.memory_overcommit = memory_overcommit
+        self.reservations = {}  # container id, or hold() key while it is created -> Reservation
+        self.holds = set()
+        self._hold_numbers = itertools.count(1)
+        # Checks and updates come from the control workers; hold the lock
+        # across check(), the Docker call and set() so two changes cannot
+        # both pass against the same free capacity
+        self.lock = threading.RLock()
+        self.rejected = 0
+
+    def retain(self, container_ids):
+        """Forget containers that are no longer running; returns the ids not in the book yet"""
+        container_ids = set(container_ids)
+        with self.lock:
+            for container_id in list(self.reservations):
+                if container_id not in container_ids and container_id not in self.holds:
+                    del self.reservations[container_id]
+            return container_ids - self.reservations.keys()
+
+    def set(self, container_id, reservation):
+        with self.lock:
+            self.reservations[container_id] = reservation
+
+    def hold(self, reservation):
+        """Book reservation for a container that is being created; returns the key for confirm() or release()"""
+        with self.lock:
+            key = f"hold-{next(self._hold_numbers)}"
+            self.holds.add(key)
+            self.reservations[key] = reservation
+            return key
+
+    def confirm(self, key, container_id):
+        """The held container now exists as container_id"""
+        with self.lock:
+            self.holds.discard(key)
+            self.reservations[container_id] = self.reservations.pop(key)
+
+    def release(self, key):
+        """The held container was never created"""
+        with self.lock:
+            self.holds.discard(key)
+            self.reservations.pop(key, None)
+
+    def pinned(self, exclude=None):
+        """CPUs in the cpusets of the containers, except exclude"""
+        with self.lock:
+            return frozenset().union(*(r.cpuset for cid, r in self.reservations.items() if cid != exclude))
+
+    def check(self, container_id, reservation):
+        """
+        None if container_id may hold reservation, else why not. Shrinking
+        is always allowed, even on a host that is already overbooked.
+        """
+        host_cpus, memory_capacity = self.capacity()
+        cpu_capacity = len(host_cpus)
+        with self.lock:
+            current = self.reservations.get(container_id) or Reservation()
+            others = [r for cid, r in self.reservations.items() if cid != container_id]
+        error = None
+        free_cpus = cpu_capacity * self.cpu_overcommit - sum(r.cpus for r in others)
+        free_memory = int(memory_capacity * self.memory_overcommit) - sum(r.memory for r in others)
+        if reservation.cpus > max(free_cpus, current.cpus):
+            error = (f"Not enough CPU: {reservation.cpus:g} requested, "
+                     f"{max(0, free_cpus):g} of {cpu_capacity} unreserved")
+        elif reservation.memory > max(free_memory, current.memory):
+            error = f"Not enough memory: {reservation.memory} bytes requested, {max(0, free_memory)} unreserved"
+        elif reservation.cpuset:
+            pinned = self.pinned(exclude=container_id)
+            if not reservation.cpuset <= host_cpus:
+                error = f"No such CPUs on this host: {format_cpuset(reservation.cpuset - host_cpus)}"
+            elif reservation.cpuset & pinned:
+                error = f"CPUs already pinned to another container: {format_cpuset(reservation.cpuset & pinned)}"
+            elif reservation.cpus > len(reservation.cpuset):
+                error = (f"A quota of {reservation.cpus:g} CPUs needs more than "
+                         f"the {len(reservation.cpuset)} in the cpuset")
+        if error is not None:
+            self.rejected += 1
+        return error
+
+    def totals(self):
+        host_cpus, memory_capacity = self.capacity()
+        cpu_capacity = len(host_cpus)
+        with self.lock:
+            reservations = list(self.reservations.values())
+            held = len(self.holds)
+        return {
+            "containers": len(reservations) - held,
+            "being_created": held,
+            "cpus": round(sum(r.cpus for r in reservations), 3),
+            "cpu_capacity": cpu_capacity * self.cpu_overcommit,
+            "memory": sum(r.memory for r in reservations),
+            "memory_capacity": int(memory_capacity * self.memory_overcommit),
+            "pinned_cpus": format_cpuset(self.pinned()),
+            "rejected": self.rejected,
+        }
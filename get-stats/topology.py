@@ -0,0 +1,165 @@
+"""
+CPU, NUMA and GPU topology from sysfs, and a NUMA-local cpuset allocator.
+
+read_topology() reads the NUMA nodes (devices/system/node/node*/cpulist,
+meminfo and distance), the physical cores (hyperthread siblings and
+package of every CPU under devices/system/cpu) and the NUMA node of each
+GPU's PCI device (bus/pci/devices/<bus id>/numa_node). A host without
+NUMA nodes in sysfs is one node holding every online CPU. The sysfs root
+is a parameter, so the agent can read the host's /sys from a container and
+benchmarks can point it at a fake tree.
+
+allocate_cpuset() picks exclusive CPUs for a container, whole cores first,
+from the NUMA nodes of its GPUs and then from the nearest other nodes, so a
+renter's threads stay next to their GPUs and memory instead of floating
+across sockets.
+"""
+import math
+import os
+import re
+
+from reservations import format_cpuset, parse_cpuset
+
+_NODE_RE = re.compile(r"^node(\d+)$")
+_MEMTOTAL_RE = re.compile(r"MemTotal:\s+(\d+) kB")
+
+
+def _read(path, default=None):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def sysfs_bus_id(bus_id):
+    """nvidia-smi's PCI bus id ("00000000:3B:00.0") as sysfs names it ("0000:3b:00.0")"""
+    domain, _, rest = bus_id.strip().partition(":")
+    return f"{int(domain, 16):04x}:{rest.lower()}"
+
+
+class Topology:
+    def __init__(self, nodes, cores, gpus, distances):
+        self.nodes = nodes  # node -> {"cpus": frozenset, "memory": bytes}
+        self.cores = cores  # [(node, package, frozenset of sibling CPUs)], by first CPU
+        self.gpus = gpus  # GPU index (str) or UUID -> NUMA node, None when unknown
+        self.distances = distances  # node -> {node: distance}
+        self.cpus = frozenset().union(*(node["cpus"] for node in nodes.values()))
+
+    def gpu_nodes(self, gpus):
+        """NUMA nodes of these GPUs (indices or UUIDs); unknown ones are skipped"""
+        nodes = (self.gpus.get(str(gpu)) for gpu in gpus)
+        return {node for node in nodes if node is not None}
+
+    def as_dict(self):
+        """The system_info view: sockets and, per NUMA node, its CPUs, cores, memory and GPUs"""
+        numa = []
+        for node, info in sorted(self.nodes.items()):
+            numa.append({
+                "Node": node,
+                "CPUs": format_cpuset(info["cpus"]),
+                "Cores": sum(1 for core_node, _, _ in self.cores if core_node == node),
+                "Memory_GB": round(info["memory"] / (1024 ** 3), 2),
+                "GPUs": sorted(int(gpu) for gpu, gpu_node in self.gpus.items() if gpu_node == node and gpu.isdigit()),
+                "Distances": [self.distances.get(node, {}).get(other) for other in sorted(self.nodes)],
+            })
+        return {
+            "Sockets": len({package for _, package, _ in self.cores}),
+            "Physical_Cores": len(self.cores),
+            "NUMA": numa,
+        }
+
+
+def read_topology(sysfs_root="/sys", gpus=()):
+    """
+    Topology of the host whose sysfs is at sysfs_root. gpus is
+    [(index, uuid, PCI bus id)] as nvidia-smi reports them.
+    """
+    node_dir = os.path.join(sysfs_root, "devices", "system", "node")
+    cpu_dir = os.path.join(sysfs_root, "devices", "system", "cpu")
+    nodes, rows = {}, {}
+    for name in sorted(os.listdir(node_dir)) if os.path.isdir(node_dir) else []:
+        match = _NODE_RE.match(name)
+        if match is None:
+            continue
+        node = int(match.group(1))
+        rows[node] = _read(os.path.join(node_dir, name, "distance"), "").split()
+        cpus = parse_cpuset(_read(os.path.join(node_dir, name, "cpulist"), ""))
+        if not cpus:
+            continue  # Memory-only node (CXL, HBM); nothing to pin CPUs to
+        memory = _MEMTOTAL_RE.search(_read(os.path.join(node_dir, name, "meminfo"), ""))
+        nodes[node] = {"cpus": cpus, "memory": int(memory.group(1)) * 1024 if memory else 0}
+    # Each distance file lists every node, in node order
+    distances = {node: {other: int(d) for other, d in zip(sorted(rows), rows[node])} if len(rows[node]) == len(rows)
+                 else {} for node in nodes}
+    if not nodes:
+        online = parse_cpuset(_read(os.path.join(cpu_dir, "online"), "")) or frozenset(range(os.cpu_count() or 1))
+        nodes = {0: {"cpus": online, "memory": 0}}
+        distances = {0: {0: 10}}
+
+    cpu_node = {cpu: node for node, info in nodes.items() for cpu in info["cpus"]}
+    cores, seen = [], set()
+    for cpu in sorted(cpu_node):
+        if cpu in seen:
+            continue
+        topology_dir = os.path.join(cpu_dir, f"cpu{cpu}", "topology")
+        siblings = parse_cpuset(_read(os.path.join(topology_dir, "thread_siblings_list"), "")) & cpu_node.keys()
+        siblings = frozenset(s for s in siblings | {cpu} if cpu_node[s] == cpu_node[cpu])
+        package = int(_read(os.path.join(topology_dir, "physical_package_id"), "0") or 0)
+        seen.update(siblings)
+        cores.append((cpu_node[cpu], package, siblings))
+
+    gpu_nodes = {}
+    for index, uuid, bus_id in gpus:
+        node = _read(os.path.join(sysfs_root, "bus", "pci", "devices", sysfs_bus_id(bus_id), "numa_node"))
+        node = int(node) if node and node.lstrip("-").isdigit() else -1
+        if node not in nodes:
+            node = next(iter(nodes)) if len(nodes) == 1 else None  # -1 on a NUMA host: firmware didn't say
+        gpu_nodes[str(index)] = gpu_nodes[uuid] = node
+    return Topology(nodes, cores, gpu_nodes, distances)
+
+
+def allocate_cpuset(topology, cpu_count, gpus=(), taken=frozenset()):
+    """
+    Exclusive CPUs for a container: ceil(cpu_count) CPUs not in taken,
+    whole cores first, from the NUMA nodes of its GPUs, then from the
+    nodes nearest to them. Without GPUs (or when their nodes are unknown)
+    it takes the node with the fewest free CPUs that still fits the
+    request, to keep large blocks free. Returns (cpuset_cpus, cpuset_mems)
+    as cpuset lists, or None if the host has too few free CPUs.
+    """
+    want = math.ceil(cpu_count)
+    free = {node: [] for node in topology.nodes}  # node -> free sibling sets, whole cores first
+    for node, _, siblings in topology.cores:
+        if siblings - taken:
+            free[node].append(sorted(siblings - taken))
+    for node_cores in free.values():
+        node_cores.sort(key=lambda cpus: (-len(cpus), cpus[0]))
+    free_count = {node: sum(len(cpus) for cpus in node_cores) for node, node_cores in free.items()}
+    if sum(free_count.values()) < want:
+        return None
+
+    local = topology.gpu_nodes(gpus)
+    if local:
+        def distance(node):
+            return min(topology.distances.get(near, {}).get(node, 10 if near == node else 20) for near in local)
+        order = sorted(topology.nodes, key=lambda node: (distance(node), -free_count[node], node))
+    else:
+        fits = {node: free_count[node] >= want for node in topology.nodes}
+        order = sorted(topology.nodes, key=lambda node: (not fits[node],
+                                                         free_count[node] if fits[node] else -free_count[node], node))
+
+    chosen = []
+    for node in order:
+        node_cores = free[node]
+        while node_cores and len(chosen) < want:
+            need = want - len(chosen)
+            # A partly taken core that fits the remainder exactly before splitting a whole one
+            exact = next((cpus for cpus in node_cores if len(cpus) == need), None)
+            cpus = exact if exact is not None and need < len(node_cores[0]) else node_cores[0]
+            node_cores.remove(cpus)
+            chosen.extend(cpus[:need])
+        if len(chosen) == want:
+            break
+    cpu_node = {cpu: node for node, info in topology.nodes.items() for cpu in info["cpus"]}
+    return format_cpuset(chosen), format_cpuset({cpu_node[cpu] for cpu in chosen})
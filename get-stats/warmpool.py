@@ -0,0 +1,161 @@
+"""
+Warm container pool for fast rental starts.
+
+Even with the image cached, containers.run() is a create plus a start, and
+the start sets up the network namespace and runs the entrypoint. For each
+configured profile (image plus GPU request) the pool keeps a few
+containers created ahead of time, either stopped ("created") or started
+and then paused ("paused"). A run_container that matches a profile claims
+one: the CPU and memory limits are applied with container.update(), the
+container is renamed, and it is started or unpaused. Device requests cannot
+be changed after create, so the GPU request is part of the profile.
+
+Pool containers are named WARM_PREFIX + profile + suffix and labelled with
+their profile, so a restarted agent adopts the ones still waiting and the
+agent's listings can leave them out. A claimed container is always renamed,
+to the requested name or "rental-" + its short ID.
+
+Every method here blocks on the Docker API; call them from a thread.
+"""
+import collections
+import os
+import threading
+
+WARM_PREFIX = "warm-pool-"
+PROFILE_LABEL = "theweb3rental.warm-pool"
+STATES = ("created", "paused")
+# Limits claim() can give a waiting container; a request with any other needs a new one
+CLAIMABLE_LIMITS = frozenset(("cpu_count", "memory", "gpu_count", "gpu_devices", "cpuset_cpus", "cpuset_mems"))
+
+
+def is_pool_name(name):
+    return name.lstrip("/").startswith(WARM_PREFIX)
+
+
+class WarmPool:
+    """
+    profiles: [{"name", "image", "size", "state" ("paused" by default),
+    "gpu_count", "gpu_devices", "cpu_count", "memory"}]; the last two are
+    the limits a waiting container holds until it is claimed.
+    container_options(resource_limits) returns the create() keyword
+    arguments for a set of limits, as run_container uses them.
+    """
+
+    def __init__(self, profiles, client_factory, container_options):
+        self.profiles = {}
+        for profile in profiles:
+            profile = dict(profile)
+            profile.setdefault("state", "paused")
+            if profile["state"] not in STATES:
+                raise ValueError(f"Warm pool state must be one of {STATES}: {profile['state']}")
+            self.profiles[profile["name"]] = profile
+        self.client_factory = client_factory
+        self.container_options = container_options
+        self.ready = {name: collections.deque() for name in self.profiles}  # profile -> container IDs
+        self.lock = threading.Lock()  # Claims come from the control workers, refills from another thread
+        self.counters = {"claims": 0, "misses": 0, "created": 0, "discarded": 0, "errors": 0}
+
+    def match(self, image, resource_limits):
+        """The profile a request can be served from, or None"""
+        if not CLAIMABLE_LIMITS.issuperset(resource_limits):
+            return None
+        gpu_count = resource_limits.get("gpu_count", 0) or 0
+        gpu_devices = list(resource_limits.get("gpu_devices") or [])
+        for profile in self.profiles.values():
+            if (profile["image"] == image and (profile.get("gpu_count") or 0) == gpu_count
+                    and list(profile.get("gpu_devices") or []) == gpu_devices):
+                return profile
+        return None
+
+    def adopt(self):
+        """Take back waiting pool containers left by a previous run; remove those no profile wants"""
+        client = self.client_factory()
+        for container in client.containers.list(all=True, filters={"label": PROFILE_LABEL}):
+            profile = self.profiles.get(container.labels.get(PROFILE_LABEL))
+            if not is_pool_name(container.name):
+                continue  # Claimed by an earlier run; a rental now
+            if (profile is None or container.status != profile["state"]
+                    or container.attrs["Config"]["Image"] != profile["image"]):
+                container.remove(force=True)
+                self.counters["discarded"] += 1
+                continue
+            with self.lock:
+                self.ready[profile["name"]].append(container.id)
+
+    def refill(self):
+        """Create containers until every profile has its size waiting; returns how many were created"""
+        created = 0
+        for name, profile in self.profiles.items():
+            while len(self.ready[name]) < profile["size"]:
+                container_id = self._create(profile)
+                with self.lock:
+                    self.ready[name].append(container_id)
+                created += 1
+        return created
+
+    def _create(self, profile):
+        client = self.client_factory()
+        limits = {key: profile[key] for key in ("cpu_count", "memory", "gpu_count", "gpu_devices") if key in profile}
+        container = client.containers.create(
+            profile["image"],
+            name=f"{WARM_PREFIX}{profile['name']}-{os.urandom(4).hex()}",
+            labels={PROFILE_LABEL: profile["name"]},
+            stdin_open=True,
+            tty=True,
+            **self.container_options(limits),
+        )
+        if profile["state"] == "paused":
+            container.start()
+            container.pause()
+        self.counters["created"] += 1
+        return container.id
+
+    def claim(self, profile, resource_limits, name=None):
+        """
+        Start a waiting container of profile with these limits and name.
+        Returns the container, or None when none is waiting (the caller
+        then runs one the usual way). A container that fails part way is
+        removed and the error raised.
+        """
+        import docker  # Not at module level: the agent loads docker lazily, after binding
+        client = self.client_factory()
+        while True:
+            with self.lock:
+                if not self.ready[profile["name"]]:
+                    self.counters["misses"] += 1
+                    return None
+                container_id = self.ready[profile["name"]].popleft()
+            try:
+                container = client.containers.get(container_id)
+            except docker.errors.NotFound:
+                self.counters["discarded"] += 1  # Removed behind our back
+                continue
+            try:
+                container.rename(name or f"rental-{container.id[:12]}")
+            except docker.errors.APIError:
+                with self.lock:
+                    self.ready[profile["name"]].appendleft(container_id)  # Name taken; the container is fine
+                raise
+            try:
+                options = self.container_options(resource_limits)
+                pinning = {key: options[key] for key in ("cpuset_cpus", "cpuset_mems") if key in options}
+                container.update(cpu_period=options["cpu_period"], cpu_quota=options["cpu_quota"],
+                                 mem_limit=options["mem_limit"],
+                                 # As create() leaves it: swap up to the memory limit again
+                                 memswap_limit=2 * docker.utils.parse_bytes(options["mem_limit"]), **pinning)
+                if profile["state"] == "paused":
+                    container.unpause()
+                else:
+                    container.start()
+                container.reload()
+            except Exception:
+                self.counters["errors"] += 1
+                container.remove(force=True)
+                raise
+            self.counters["claims"] += 1
+            return container
+
+    def stats(self):
+        with self.lock:
+            waiting = {name: len(ready) for name, ready in self.ready.items()}
+        return dict(self.counters, waiting=waiting)
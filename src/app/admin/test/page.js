@@ -4,6 +4,50 @@ import React, { useState, useEffect, useCallback } from 'react';
 import { io } from 'socket.io-client';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 export {}; 
+
+const COMMAND_TIMEOUT_MS = 30000;
+const RETRY_BASE_MS = 1000;
+const CLIENT_ID_KEY = 'agent_client_id';
+
+// One id per browser tab, kept across reconnects and reloads. The agent caches
+// command results per (client id, command, request_id); without it the agent
+// falls back to the socket id, which changes on every reconnect.
+function getClientId() {
+    let clientId = sessionStorage.getItem(CLIENT_ID_KEY);
+    if (!clientId) {
+        clientId = crypto.randomUUID();
+        sessionStorage.setItem(CLIENT_ID_KEY, clientId);
+    }
+    return clientId;
+}
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// Send a control command and wait for its acknowledged result. Timeouts and
+// rate-limit rejections are retried with the same request_id, so the agent
+// runs the command at most once. Timed-out attempts back off exponentially,
+// with jitter so dashboards that lost the same agent don't retry in lockstep.
+async function callAgent(socket, event, data = {}, attempts = 3) {
+    const request = { ...data, request_id: data.request_id || crypto.randomUUID() };
+    for (let attempt = 1; ; attempt++) {
+        let result;
+        try {
+            result = await socket.timeout(COMMAND_TIMEOUT_MS).emitWithAck(event, request);
+        } catch (err) {
+            if (attempt >= attempts) {
+                return { success: false, error: `No answer to ${event}` };
+            }
+            await sleep(RETRY_BASE_MS * 2 ** (attempt - 1) * (0.5 + Math.random()));
+            continue;
+        }
+        if (attempt < attempts && (result.pending || result.retry_after !== undefined)) {
+            await sleep((result.retry_after || 0) * 1000);
+            continue;
+        }
+        return result;
+    }
+}
+
 function App() {
     const [socket, setSocket] = useState(null);
     const [connected, setConnected] = useState(false);
@@ -29,6 +73,7 @@ function App() {
         const socketUrl = 'https://da4d-125-16-66-215.ngrok-free.app';
         const socketInstance = io(socketUrl, {
             transports: ['websocket'],
+            auth: { client_id: getClientId() },
             reconnection: true,
             reconnectionAttempts: 5,
             reconnectionDelay: 1000
@@ -44,7 +89,7 @@ function App() {
             socketInstance.emit('request_system_info');
 
             // Request container list
-            socketInstance.emit('list_containers');
+            loadContainers(socketInstance);
         });
 
         socketInstance.on('disconnect', () => {
@@ -78,37 +123,6 @@ function App() {
             });
         });
 
-        socketInstance.on('container_list', (data) => {
-            console.log('Received container list:', data);
-            if (data.success) {
-                setContainers(data.containers);
-            } else {
-                setError(`Failed to get containers: ${data.error}`);
-            }
-        });
-
-        socketInstance.on('container_result', (data) => {
-            console.log('Received container result:', data);
-            if (data.success) {
-                setSuccess(`Container ${data.container.name || data.container.id} started successfully`);
-                // Refresh container list
-                socketInstance.emit('list_containers');
-            } else {
-                setError(`Failed to start container: ${data.error}`);
-            }
-        });
-
-        socketInstance.on('container_stop_result', (data) => {
-            console.log('Received container stop result:', data);
-            if (data.success) {
-                setSuccess(data.message);
-                // Refresh container list
-                socketInstance.emit('list_containers');
-            } else {
-                setError(`Failed to stop container: ${data.error}`);
-            }
-        });
-
         setSocket(socketInstance);
 
         // Cleanup on unmount
@@ -119,6 +133,17 @@ function App() {
         };
     }, []);
 
+    // Fetch the container list
+    const loadContainers = async (socketInstance) => {
+        const data = await callAgent(socketInstance, 'list_containers');
+        console.log('Received container list:', data);
+        if (data.success) {
+            setContainers(data.containers);
+        } else {
+            setError(`Failed to get containers: ${data.error}`);
+        }
+    };
+
     // Handle container form input changes
     const handleContainerInputChange = (e) => {
         const { name, value } = e.target;
@@ -143,7 +168,7 @@ function App() {
     };
 
     // Start a new container
-    const handleStartContainer = (e) => {
+    const handleStartContainer = async (e) => {
         e.preventDefault();
         setError('');
         setSuccess('');
@@ -164,20 +189,34 @@ function App() {
             }
         };
 
-        socket.emit('run_container', formattedContainer);
+        const data = await callAgent(socket, 'run_container', formattedContainer);
+        console.log('Received container result:', data);
+        if (data.success) {
+            setSuccess(`Container ${data.container.name || data.container.id} started successfully`);
+            loadContainers(socket);
+        } else {
+            setError(`Failed to start container: ${data.error}`);
+        }
     };
 
     // Stop a container
-    const handleStopContainer = (containerId) => {
+    const handleStopContainer = async (containerId) => {
         setError('');
         setSuccess('');
-        socket.emit('stop_container_request', { container_id: containerId });
+        const data = await callAgent(socket, 'stop_container_request', { container_id: containerId });
+        console.log('Received container stop result:', data);
+        if (data.success) {
+            setSuccess(data.message);
+            loadContainers(socket);
+        } else {
+            setError(`Failed to stop container: ${data.error}`);
+        }
     };
 
     // Refresh container list
     const refreshContainers = () => {
         if (socket && connected) {
-            socket.emit('list_containers');
+            loadContainers(socket);
         }
     };
 